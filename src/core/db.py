@@ -0,0 +1,57 @@
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """
+    Tune every new SQLite connection with SQLITE_PRAGMAS and the SQLITE_ALIAS_PRAGMAS
+    of its alias. journal_mode is stored in the database file, the others only last
+    as long as the connection.
+    """
+    if connection.vendor != "sqlite":
+        return
+    pragmas = {
+        **settings.SQLITE_PRAGMAS,
+        **settings.SQLITE_ALIAS_PRAGMAS.get(connection.alias, {}),
+    }
+    with connection.cursor() as cursor:
+        for pragma, value in pragmas.items():
+            if value is not None:
+                cursor.execute(f"PRAGMA {pragma} = {value}")
+
+
+@contextmanager
+def immediate_atomic(using: str | None = None):
+    """
+    transaction.atomic() that takes the SQLite write lock when it begins.
+    A transaction that reads before it writes is upgraded to a writer later, and in
+    WAL mode that upgrade fails with "database is locked" right away, without waiting
+    busy_timeout, when another connection wrote in between. BEGIN IMMEDIATE waits
+    for the lock instead. Nested in another atomic block, it is a plain savepoint.
+    """
+    connection = transaction.get_connection(using)
+    if connection.vendor != "sqlite" or connection.in_atomic_block:
+        with transaction.atomic(using=using):
+            yield
+        return
+
+    # Django 4.2 always starts SQLite transactions with a plain BEGIN from this
+    # private hook, fail loudly rather than fall back to BEGIN if it is gone
+    if not hasattr(type(connection), "_start_transaction_under_autocommit"):
+        raise RuntimeError(
+            "immediate_atomic needs DatabaseWrapper._start_transaction_under_autocommit"
+        )
+    connection._start_transaction_under_autocommit = (
+        lambda: connection.cursor().execute("BEGIN IMMEDIATE")
+    )
+    try:
+        with transaction.atomic(using=using):
+            del connection._start_transaction_under_autocommit
+            yield
+    finally:
+        connection.__dict__.pop("_start_transaction_under_autocommit", None)
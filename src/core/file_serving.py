@@ -0,0 +1,159 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import (
+    FileResponse,
+    HttpRequest,
+    HttpResponse,
+    HttpResponseNotModified,
+    StreamingHttpResponse,
+)
+from django.utils.http import http_date, parse_http_date_safe
+
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+CHUNK_SIZE = 256 * 1024
+
+
+def parse_range(range_header: str, size: int) -> tuple[int, int] | None | bool:
+    """
+    (start, end) inclusive of a single "bytes=" range, None if the header should
+    be ignored (multiple or malformed ranges), False if it is not satisfiable
+    """
+    match = RANGE_RE.match(range_header.strip())
+    if not match:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+
+    if not start:
+        # suffix range, the last N bytes
+        length = int(end)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def iter_file_range(file_path: str, start: int, end: int):
+    with open(file_path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def serve_file(
+    request: HttpRequest,
+    file_path: str,
+    content_type: str | None = None,
+    etag: str | None = None,
+    immutable: bool = False,
+) -> HttpResponse:
+    """
+    Serve a file with Range, ETag and Last-Modified support.
+    With MEDIA_SENDFILE_BACKEND set the bytes are streamed by the front proxy.
+    etag defaults to one derived from the file size and mtime, immutable files
+    (content addressed) are cached by clients for a year.
+    """
+    stat = os.stat(file_path)
+    if etag is None:
+        etag = f"{stat.st_size:x}-{stat.st_mtime_ns:x}"
+    etag = f'"{etag}"'
+    last_modified = http_date(stat.st_mtime)
+    if content_type is None:
+        content_type = mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+
+    headers = {
+        "ETag": etag,
+        "Last-Modified": last_modified,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": (
+            "public, max-age=31536000, immutable"
+            if immutable
+            else f"public, max-age={settings.MEDIA_CACHE_MAX_AGE}"
+        ),
+    }
+
+    # conditional requests, If-None-Match takes precedence over If-Modified-Since
+    if_none_match = request.META.get("HTTP_IF_NONE_MATCH")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        if "*" in tags or etag in tags or f"W/{etag}" in tags:
+            return not_modified(headers)
+    else:
+        if_modified_since = parse_http_date_safe(
+            request.META.get("HTTP_IF_MODIFIED_SINCE", "")
+        )
+        if if_modified_since is not None and int(stat.st_mtime) <= if_modified_since:
+            return not_modified(headers)
+
+    if settings.MEDIA_SENDFILE_BACKEND:
+        return offload(file_path, content_type, headers)
+
+    byte_range = None
+    range_header = request.META.get("HTTP_RANGE")
+    if_range = request.META.get("HTTP_IF_RANGE")
+    # a range only applies if the client still has the current version
+    if range_header and (if_range is None or if_range in (etag, last_modified)):
+        byte_range = parse_range(range_header, stat.st_size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{stat.st_size}"
+        return response
+
+    if byte_range is None:
+        # the WSGI server can use sendfile() for a whole file
+        response = FileResponse(open(file_path, "rb"), content_type=content_type)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            iter_file_range(file_path, start, end),
+            status=206,
+            content_type=content_type,
+        )
+        response["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+        response["Content-Length"] = str(end - start + 1)
+
+    for header, value in headers.items():
+        response[header] = value
+    return response
+
+
+def not_modified(headers: dict) -> HttpResponse:
+    response = HttpResponseNotModified()
+    for header, value in headers.items():
+        response[header] = value
+    return response
+
+
+def offload(file_path: str, content_type: str, headers: dict) -> HttpResponse:
+    """
+    Let the front proxy send the file, it also handles Range requests itself
+    """
+    response = HttpResponse(content_type=content_type)
+    if settings.MEDIA_SENDFILE_BACKEND == "x-accel-redirect":
+        relative_path = os.path.relpath(file_path, settings.MEDIA_SENDFILE_ROOT)
+        response["X-Accel-Redirect"] = settings.MEDIA_SENDFILE_URL + quote(
+            relative_path.replace(os.sep, "/")
+        )
+    else:
+        response["X-Sendfile"] = os.path.abspath(file_path)
+
+    for header, value in headers.items():
+        response[header] = value
+    return response
@@ -0,0 +1,44 @@
+import hashlib
+import os
+
+from core.phash import dhash
+
+
+FILE_TYPES = {
+    ".jpg": "image/jpg",
+    ".jpeg": "image/jpg",
+    ".png": "image/png",
+    ".mp4": "video/mp4",
+    ".gif": "gif/gif",
+}
+
+
+def get_file_type(file_name: str) -> str | None:
+    return FILE_TYPES.get(os.path.splitext(file_name)[1].lower())
+
+
+def hash_file(file_path: str) -> str:
+    """
+    SHA-256 of the file content, read in 1 MB blocks
+    """
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def phash_file(file_path: str) -> int | None:
+    """
+    Perceptual hash of a file, None for videos
+    """
+    if get_file_type(file_path) == "video/mp4":
+        return None
+    return dhash(file_path)
+
+
+def fingerprint_file(file_path: str) -> tuple[str, int | None]:
+    """
+    Content hash and perceptual hash of a file, the latter is None for videos
+    """
+    return hash_file(file_path), phash_file(file_path)
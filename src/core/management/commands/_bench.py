@@ -0,0 +1,63 @@
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import connection
+from django.utils.timezone import now
+
+from core.models import Media, Seiyuu, Tweet
+
+
+@contextmanager
+def temporary_database():
+    """
+    Run the block against a freshly migrated SQLite file next to nothing else,
+    benchmarks pay the real fsync cost and never touch the data
+    """
+    tmp_dir = tempfile.mkdtemp(prefix="seiyuu_bench_")
+    connection.settings_dict["TEST"]["NAME"] = os.path.join(tmp_dir, "bench.sqlite3")
+    old_name = connection.creation.create_test_db(
+        verbosity=0, autoclobber=True, serialize=False
+    )
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def create_bench_tweets(count: int, seiyuu_count: int = 1) -> list[str]:
+    """
+    Tweets without data spread over seiyuu_count seiyuu, return their ids
+    """
+    seiyuu_instances = Seiyuu.objects.bulk_create(
+        [
+            Seiyuu(
+                name=f"bench{i}",
+                screen_name=f"bench{i}_bot",
+                id_name=f"bench{i}",
+                image_folder=f"bench{i}",
+            )
+            for i in range(seiyuu_count)
+        ]
+    )
+    media = Media.objects.bulk_create(
+        [
+            Media(file_path=f"{seiyuu.image_folder}/bench.jpg", seiyuu=seiyuu)
+            for seiyuu in seiyuu_instances
+        ]
+    )
+    post_time = now() - timedelta(days=30)
+    tweets = [
+        Tweet(
+            id=str(1700000000000000000 + i),
+            post_time=post_time + timedelta(minutes=i),
+            media=media[i % len(media)],
+            seiyuu=seiyuu_instances[i % len(media)],
+        )
+        for i in range(count)
+    ]
+    Tweet.objects.bulk_create(tweets, batch_size=500)
+    return [tweet.id for tweet in tweets]
@@ -0,0 +1,364 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from core.hashing import fingerprint_file, get_file_type
+from core.models import LibraryFile, Media, Seiyuu
+from core.phash import BKTree
+from core.thumbnails import (
+    evict_thumbnails,
+    generate_thumbnails_bulk,
+    get_thumbnails_size,
+    scan_thumbnail_cache,
+)
+
+
+# SQLite allows at most 999 variables in one query
+QUERY_CHUNK_SIZE = 900
+
+# below this number of files hashing inline is faster than starting a process pool
+POOL_THRESHOLD = 8
+
+# seconds before the thumbnail cache size estimate is measured again, thumbnails
+# generated by the image browser or other processes are not counted in between
+THUMBNAIL_CACHE_SIZE_TTL = 3600
+
+
+def get_library_path(seiyuu_instance: Seiyuu) -> str:
+    return os.path.join(settings.MEDIA_ROOT, seiyuu_instance.image_folder)
+
+
+def get_import_path(seiyuu_instance: Seiyuu) -> str:
+    return os.path.join(
+        settings.BASE_DIR,
+        "data",
+        "media",
+        "ImportQueue",
+        seiyuu_instance.image_folder,
+    )
+
+
+def get_quarantine_path(seiyuu_instance: Seiyuu) -> str:
+    return os.path.join(settings.QUARANTINE_ROOT, seiyuu_instance.image_folder)
+
+
+def get_phash_tree(seiyuu_instance: Seiyuu) -> BKTree:
+    tree = BKTree()
+    for file_path, phash in Media.objects.filter(
+        seiyuu=seiyuu_instance, phash__isnull=False
+    ).values_list("file_path", "phash"):
+        tree.add(phash, file_path)
+    return tree
+
+
+def get_existing_hashes(seiyuu_instance: Seiyuu, hashes: list[str]) -> set[str]:
+    """
+    The hashes already in the Library of the seiyuu
+    """
+    existing = set()
+    for i in range(0, len(hashes), QUERY_CHUNK_SIZE):
+        existing.update(
+            Media.objects.filter(
+                seiyuu=seiyuu_instance,
+                content_hash__in=hashes[i : i + QUERY_CHUNK_SIZE],
+            ).values_list("content_hash", flat=True)
+        )
+    return existing
+
+
+class MediaImporter(object):
+
+    def __init__(
+        self,
+        stdout,
+        style,
+        workers=None,
+        batch_size=500,
+        check_near_duplicates=True,
+        make_thumbnails=True,
+    ):
+        """
+        Import files from the ImportQueue to the Library in batches.
+        Files are hashed in a process pool and skipped if the same content is
+        already in the Library of the seiyuu. Images whose perceptual hash is close to an
+        existing one are moved to the quarantine folder for review.
+        Thumbnails of the imported files are generated in the same pool.
+        """
+        self.stdout = stdout
+        self.style = style
+        self.workers = workers
+        self.batch_size = batch_size
+        self.check_near_duplicates = check_near_duplicates
+        self.make_thumbnails = make_thumbnails
+        # running estimate of the thumbnail cache size, None until measured
+        self.thumbnail_cache_bytes = None
+        self.thumbnail_cache_measured_at = 0.0
+
+    def fingerprint_files(self, file_paths: list[str]) -> list[tuple[str, int | None]]:
+        if len(file_paths) < POOL_THRESHOLD or self.workers == 1:
+            return [fingerprint_file(file_path) for file_path in file_paths]
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(fingerprint_file, file_paths, chunksize=16))
+
+    def import_seiyuu(
+        self, seiyuu_instance: Seiyuu, file_names: list[str] | None = None
+    ) -> dict:
+        """
+        Import the given file names (default: the whole queue) of a seiyuu,
+        return the import statistics
+        """
+        start = time.perf_counter()
+        id_name = seiyuu_instance.id_name
+        imgs_path = get_library_path(seiyuu_instance)
+        import_path = get_import_path(seiyuu_instance)
+
+        if file_names is None:
+            file_names = os.listdir(import_path)
+            library_names = set(os.listdir(imgs_path))
+        else:
+            # a few known files, cheaper to check than listing the whole Library
+            library_names = {
+                img
+                for img in file_names
+                if os.path.exists(os.path.join(imgs_path, img))
+            }
+
+        stats = {
+            "queued": len(file_names),
+            "imported": 0,
+            "skipped": 0,
+            "quarantined": 0,
+            "bytes": 0,
+            "seconds": 0.0,
+        }
+        phash_tree = None
+
+        # filter out names that can not be imported before hashing
+        candidates = []
+        for img in file_names:
+            if img in library_names:
+                self.stdout.write(
+                    self.style.WARNING(f"[{id_name}] {img} Already exists, skipping")
+                )
+                stats["skipped"] += 1
+                continue
+            if get_file_type(img) is None:
+                self.stdout.write(
+                    self.style.ERROR(
+                        f"[{id_name}] {img} Invalid file type: {img.split('.')[-1].lower()}, skipping"
+                    )
+                )
+                stats["skipped"] += 1
+                continue
+            candidates.append(img)
+
+        for i in range(0, len(candidates), self.batch_size):
+            batch = candidates[i : i + self.batch_size]
+            fingerprints = self.fingerprint_files(
+                [os.path.join(import_path, img) for img in batch]
+            )
+            existing_hashes = get_existing_hashes(
+                seiyuu_instance, [content_hash for content_hash, _ in fingerprints]
+            )
+            if self.check_near_duplicates and phash_tree is None:
+                phash_tree = get_phash_tree(seiyuu_instance)
+
+            new_files = []
+            for img, (content_hash, phash) in zip(batch, fingerprints):
+                if content_hash in existing_hashes:
+                    self.stdout.write(
+                        self.style.WARNING(
+                            f"[{id_name}] {img} Same content already exists, skipping"
+                        )
+                    )
+                    stats["skipped"] += 1
+                    continue
+                # the same content may also appear twice in one batch
+                existing_hashes.add(content_hash)
+
+                if self.check_near_duplicates and phash is not None:
+                    matches = phash_tree.search(phash, settings.PHASH_MAX_DISTANCE)
+                    if matches:
+                        distance, similar_path = matches[0]
+                        self.quarantine(seiyuu_instance, img)
+                        self.stdout.write(
+                            self.style.WARNING(
+                                f"[{id_name}] {img} Looks like {similar_path} (distance {distance}), quarantined"
+                            )
+                        )
+                        stats["quarantined"] += 1
+                        continue
+                    phash_tree.add(
+                        phash, os.path.join(seiyuu_instance.image_folder, img)
+                    )
+
+                new_files.append((img, content_hash, phash))
+
+            try:
+                stats["bytes"] += self.import_batch(seiyuu_instance, new_files)
+            except IntegrityError:
+                # another import run added the same content first, the files are
+                # back in the queue and are skipped as duplicates on the next run
+                self.stdout.write(
+                    self.style.ERROR(
+                        f"[{id_name}] {len(new_files)} files were imported concurrently, skipping the batch"
+                    )
+                )
+                stats["skipped"] += len(new_files)
+                continue
+            stats["imported"] += len(new_files)
+
+            if self.make_thumbnails:
+                generate_thumbnails_bulk(
+                    [
+                        (os.path.join(imgs_path, img), get_file_type(img), content_hash)
+                        for img, content_hash, _ in new_files
+                    ],
+                    self.workers,
+                )
+                self.add_thumbnails_size(
+                    [content_hash for _, content_hash, _ in new_files]
+                )
+
+        stats["seconds"] = time.perf_counter() - start
+        if stats["imported"]:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"[{id_name}] Imported {stats['imported']}/{stats['queued']} files, "
+                    f"{stats['imported'] / stats['seconds']:.1f} files/s, "
+                    f"{stats['bytes'] / 1024 / 1024 / stats['seconds']:.1f} MB/s"
+                )
+            )
+        return stats
+
+    def add_thumbnails_size(self, content_hashes: list[str]):
+        """
+        Count new thumbnails in the cache size estimate and evict once it passes
+        THUMBNAIL_CACHE_MAX_BYTES. The cache is walked to measure it at most every
+        THUMBNAIL_CACHE_SIZE_TTL seconds, not after every import.
+        """
+        if (
+            self.thumbnail_cache_bytes is None
+            or time.monotonic() - self.thumbnail_cache_measured_at
+            > THUMBNAIL_CACHE_SIZE_TTL
+        ):
+            self.thumbnail_cache_bytes = sum(
+                size for _, size, _ in scan_thumbnail_cache()
+            )
+            self.thumbnail_cache_measured_at = time.monotonic()
+        else:
+            self.thumbnail_cache_bytes += get_thumbnails_size(content_hashes)
+
+        if self.thumbnail_cache_bytes > settings.THUMBNAIL_CACHE_MAX_BYTES:
+            _, freed = evict_thumbnails()
+            self.thumbnail_cache_bytes -= freed
+
+    def quarantine(self, seiyuu_instance: Seiyuu, img: str):
+        quarantine_path = get_quarantine_path(seiyuu_instance)
+        os.makedirs(quarantine_path, exist_ok=True)
+        os.rename(
+            os.path.join(get_import_path(seiyuu_instance), img),
+            os.path.join(quarantine_path, img),
+        )
+
+    def import_batch(
+        self, seiyuu_instance: Seiyuu, new_files: list[tuple[str, str, int | None]]
+    ) -> int:
+        """
+        Move the files to the Library and create their Media in one transaction,
+        the files are moved back if the insert fails. Return the bytes imported.
+        """
+        imgs_path = get_library_path(seiyuu_instance)
+        import_path = get_import_path(seiyuu_instance)
+
+        moved = []
+        library_files = []
+        total_bytes = 0
+        try:
+            with transaction.atomic():
+                for img, content_hash, _ in new_files:
+                    dst = os.path.join(imgs_path, img)
+                    os.rename(os.path.join(import_path, img), dst)
+                    moved.append(img)
+
+                    stat = os.stat(dst)
+                    total_bytes += stat.st_size
+                    library_files.append(
+                        LibraryFile(
+                            file_path=os.path.join(seiyuu_instance.image_folder, img),
+                            size=stat.st_size,
+                            mtime_ns=stat.st_mtime_ns,
+                            content_hash=content_hash,
+                        )
+                    )
+
+                Media.objects.bulk_create(
+                    [
+                        Media(
+                            file_path=os.path.join(seiyuu_instance.image_folder, img),
+                            seiyuu=seiyuu_instance,
+                            file_type=get_file_type(img),
+                            content_hash=content_hash,
+                            phash=phash,
+                        )
+                        for img, content_hash, phash in new_files
+                    ]
+                )
+                # keep the manifest in sync, so reconcile_library doesn't rehash them
+                LibraryFile.objects.bulk_create(
+                    library_files,
+                    update_conflicts=True,
+                    unique_fields=["file_path"],
+                    update_fields=["size", "mtime_ns", "content_hash"],
+                )
+        except Exception:
+            for img in moved:
+                os.rename(os.path.join(imgs_path, img), os.path.join(import_path, img))
+            raise
+
+        return total_bytes
+
+    def backfill_hashes(self, seiyuu_instance: Seiyuu) -> int:
+        """
+        Hash the Library files of Media created before content hashes existed.
+        A file with the same content as another Media of the seiyuu keeps no hash.
+        """
+        media_list = list(
+            Media.objects.filter(seiyuu=seiyuu_instance, content_hash__isnull=True)
+        )
+        media_list = [
+            media
+            for media in media_list
+            if os.path.isfile(os.path.join(settings.MEDIA_ROOT, media.file_path))
+        ]
+
+        hashed = 0
+        for i in range(0, len(media_list), self.batch_size):
+            batch = media_list[i : i + self.batch_size]
+            fingerprints = self.fingerprint_files(
+                [os.path.join(settings.MEDIA_ROOT, media.file_path) for media in batch]
+            )
+            existing_hashes = get_existing_hashes(
+                seiyuu_instance, [content_hash for content_hash, _ in fingerprints]
+            )
+            hashed_media = []
+            for media, (content_hash, phash) in zip(batch, fingerprints):
+                if content_hash in existing_hashes:
+                    self.stdout.write(
+                        self.style.WARNING(
+                            f"[{seiyuu_instance.id_name}] {media.file_path} Same content as another Media, not hashed"
+                        )
+                    )
+                    continue
+                existing_hashes.add(content_hash)
+                media.content_hash = content_hash
+                media.phash = phash
+                hashed_media.append(media)
+            with transaction.atomic():
+                Media.objects.bulk_update(hashed_media, ["content_hash", "phash"])
+            hashed += len(hashed_media)
+
+        return hashed
@@ -0,0 +1,110 @@
+import asyncio
+
+from core.rate_limit import get_budgeter
+
+from django.conf import settings
+
+# requests is imported on first use, like in _post_handler
+from ._post_handler import get_requests
+
+# ids or usernames per lookup request, the API maximum
+LOOKUP_BATCH_SIZE = 100
+
+
+class TwitterLookupError(Exception):
+    pass
+
+
+def send_lookup(
+    account: str,
+    bearer_token: str,
+    endpoint: str,
+    path: str,
+    params: dict,
+    base_url: str | None,
+) -> dict:
+    """
+    GET a v2 lookup endpoint within the rate limit budget of the account,
+    return the json body
+    """
+    url = (base_url or settings.TWITTER_API_BASE_URL).rstrip("/") + path
+    response = get_budgeter().request(
+        account,
+        endpoint,
+        lambda: get_requests().get(
+            url,
+            params=params,
+            headers={"Authorization": f"Bearer {bearer_token}"},
+            timeout=30,
+        ),
+    )
+    if response.status_code != 200:
+        raise TwitterLookupError(
+            f"{endpoint} returned {response.status_code}: {response.text[:200]}"
+        )
+    return response.json()
+
+
+async def lookup_tweets(
+    semaphore: asyncio.Semaphore,
+    account: str,
+    bearer_token: str,
+    tweet_ids: list[str],
+    base_url: str | None = None,
+) -> dict[str, dict]:
+    """
+    Public metrics of up to LOOKUP_BATCH_SIZE tweets, {id: {like, rt, quote, reply}}.
+    Deleted or protected tweets are missing from the result.
+    """
+    async with semaphore:
+        body = await asyncio.to_thread(
+            send_lookup,
+            account,
+            bearer_token,
+            "tweet_lookup",
+            "/2/tweets",
+            {"ids": ",".join(tweet_ids), "tweet.fields": "public_metrics"},
+            base_url,
+        )
+
+    metrics = {}
+    for tweet in body.get("data", []):
+        public_metrics = tweet["public_metrics"]
+        metrics[tweet["id"]] = {
+            "like": public_metrics["like_count"],
+            "rt": public_metrics["retweet_count"],
+            "quote": public_metrics["quote_count"],
+            "reply": public_metrics["reply_count"],
+        }
+    return metrics
+
+
+async def lookup_followers(
+    semaphore: asyncio.Semaphore,
+    account: str,
+    bearer_token: str,
+    usernames: list[str],
+    base_url: str | None = None,
+) -> dict[str, int]:
+    """
+    Follower counts of up to LOOKUP_BATCH_SIZE users, {username: followers}.
+    Usernames are matched case-insensitively, suspended or renamed users are missing.
+    """
+    async with semaphore:
+        body = await asyncio.to_thread(
+            send_lookup,
+            account,
+            bearer_token,
+            "user_lookup",
+            "/2/users/by",
+            {"usernames": ",".join(usernames), "user.fields": "public_metrics"},
+            base_url,
+        )
+
+    requested = {username.lower(): username for username in usernames}
+    followers = {}
+    for user in body.get("data", []):
+        username = requested.get(user["username"].lower())
+        if username is not None:
+            followers[username] = user["public_metrics"]["followers_count"]
+    return followers
@@ -1,27 +1,43 @@
-import tweepy
+import logging
 import os
 import sys
 import time
 
 # print(tweepy.__version__) #3.8
 import json
-import requests
-from requests_oauthlib import OAuth1
+from functools import lru_cache
 from pathlib import Path
 
+# tweepy and requests_oauthlib are imported where they are used and requests through
+# get_requests(), so commands that import this module but end up not posting start fast
+
 from core.models import Seiyuu
+from core.rate_limit import get_budgeter
 
 from django.conf import settings
 
+logger = logging.getLogger(__name__)
+
 
 # The media upload method
 MEDIA_ENDPOINT_URL = "https://upload.twitter.com/1.1/media/upload.json"
 POST_TWEET_URL = "https://api.twitter.com/1.1/statuses/update.json"
 
 
+@lru_cache(maxsize=None)
+def get_requests():
+    import requests
+
+    return requests
+
+
+def elapsed_ms(start: float) -> int:
+    return int((time.perf_counter() - start) * 1000)
+
+
 class MediaTweet(object):
 
-    def __init__(self, file_name, auth, client):
+    def __init__(self, file_name, auth, client, account):
         """
         Defines video tweet properties
         """
@@ -31,12 +47,17 @@ class MediaTweet(object):
         self.processing_info = None
         self.auth = auth
         self.client = client
+        self.account = account
+        self.budgeter = get_budgeter()
+        # phase durations in ms, bytes sent and number of chunks
+        self.timings = {}
 
     def upload_init(self, form):  # form: ['image/jpg','tweet_image']
         """
         Initializes Upload
         """
-        print("INIT")
+        logger.info(f"[{self.account}] INIT")
+        start = time.perf_counter()
 
         # the file format
 
@@ -47,12 +68,17 @@ class MediaTweet(object):
             "media_category": form[1],
         }
 
-        req = requests.post(
-            url=MEDIA_ENDPOINT_URL, data=request_data, auth=self.auth, timeout=10
+        req = self.budgeter.request(
+            self.account,
+            "media_upload_init",
+            lambda: get_requests().post(
+                url=MEDIA_ENDPOINT_URL, data=request_data, auth=self.auth, timeout=10
+            ),
         )
         media_id = req.json()["media_id"]
 
         self.media_id = media_id
+        self.timings["init_ms"] = elapsed_ms(start)
 
         # print('Media ID: %s' % str(media_id))
 
@@ -62,13 +88,14 @@ class MediaTweet(object):
         """
         segment_id = 0
         bytes_sent = 0
+        start = time.perf_counter()
 
         with open(self.video_filename, "rb") as file:
 
             while bytes_sent < self.total_bytes:
                 chunk = file.read(4 * 1024 * 1024)
 
-                print("APPEND")
+                logger.info(f"[{self.account}] APPEND")
 
                 request_data = {
                     "command": "APPEND",
@@ -78,24 +105,34 @@ class MediaTweet(object):
 
                 files = {"media": chunk}
 
-                req = requests.post(
-                    url=MEDIA_ENDPOINT_URL,
-                    data=request_data,
-                    files=files,
-                    auth=self.auth,
-                    timeout=20,
+                req = self.budgeter.request(
+                    self.account,
+                    "media_upload_append",
+                    lambda: get_requests().post(
+                        url=MEDIA_ENDPOINT_URL,
+                        data=request_data,
+                        files=files,
+                        auth=self.auth,
+                        timeout=20,
+                    ),
                 )
 
                 if req.status_code < 200 or req.status_code > 299:
-                    print(req.status_code)
-                    print(req.text)
+                    logger.error(
+                        f"[{self.account}] APPEND returned {req.status_code}: {req.text}"
+                    )
                     sys.exit(0)
 
                 segment_id = segment_id + 1
                 bytes_sent = file.tell()
 
-                print(f"{bytes_sent} of {self.total_bytes} bytes uploaded")
+                logger.info(
+                    f"[{self.account}] {bytes_sent} of {self.total_bytes} bytes uploaded"
+                )
 
+        self.timings["append_ms"] = elapsed_ms(start)
+        self.timings["total_bytes"] = bytes_sent
+        self.timings["chunks"] = segment_id
         # print('Upload chunks complete.')
 
     def upload_finalize(self):
@@ -103,16 +140,25 @@ class MediaTweet(object):
         Finalizes uploads and starts video processing
         """
         # print('FINALIZE')
+        start = time.perf_counter()
 
         request_data = {"command": "FINALIZE", "media_id": self.media_id}
 
-        req = requests.post(
-            url=MEDIA_ENDPOINT_URL, data=request_data, auth=self.auth, timeout=10
+        req = self.budgeter.request(
+            self.account,
+            "media_upload_finalize",
+            lambda: get_requests().post(
+                url=MEDIA_ENDPOINT_URL, data=request_data, auth=self.auth, timeout=10
+            ),
         )
-        print(req.json())
+        logger.info(f"[{self.account}] FINALIZE {req.json()}")
 
         self.processing_info = req.json().get("processing_info", None)
+        self.timings["finalize_ms"] = elapsed_ms(start)
+
+        start = time.perf_counter()
         self.check_status()
+        self.timings["processing_ms"] = elapsed_ms(start)
 
     def check_status(self):
         """
@@ -123,12 +169,13 @@ class MediaTweet(object):
 
         state = self.processing_info["state"]
 
-        print(f"Media processing status is {state}")
+        logger.info(f"[{self.account}] Media processing status is {state}")
 
         if state == "succeeded":
             return
 
         if state == "failed":
+            logger.error(f"[{self.account}] Media processing failed")
             sys.exit(0)
 
         check_after_secs = self.processing_info["check_after_secs"]
@@ -136,12 +183,19 @@ class MediaTweet(object):
         # print('Checking after %s seconds' % str(check_after_secs))
         time.sleep(check_after_secs)
 
-        print("STATUS")
+        logger.info(f"[{self.account}] STATUS")
 
         request_params = {"command": "STATUS", "media_id": self.media_id}
 
-        req = requests.get(
-            url=MEDIA_ENDPOINT_URL, params=request_params, auth=self.auth, timeout=10
+        req = self.budgeter.request(
+            self.account,
+            "media_upload_status",
+            lambda: get_requests().get(
+                url=MEDIA_ENDPOINT_URL,
+                params=request_params,
+                auth=self.auth,
+                timeout=10,
+            ),
         )
 
         self.processing_info = req.json().get("processing_info", None)
@@ -154,40 +208,73 @@ class MediaTweet(object):
         """
         request_data = {"status": "", "media_ids": self.media_id}
 
-        req = requests.post(
+        req = get_requests().post(
             url=POST_TWEET_URL, data=request_data, auth=self.auth, timeout=10
         )
         # print(req.json())
 
     def tweet_v2(self):
-        req = self.client.create_tweet(media_ids=[self.media_id], user_auth=True)
-        print(req)
-        return req.data["id"]
+        import tweepy
 
+        start = time.perf_counter()
 
-def mediaUpload(file_name, auth, form, client):
-    mediaTweet = MediaTweet(file_name, auth, client)
-    mediaTweet.upload_init(form)
-    mediaTweet.upload_append()
-    mediaTweet.upload_finalize()
-    tweet_id = mediaTweet.tweet_v2()
+        def send():
+            try:
+                return self.client.create_tweet(
+                    media_ids=[self.media_id], user_auth=True
+                )
+            except tweepy.errors.HTTPException as e:
+                # keep the raw response so the budgeter can read the headers
+                return e.response
+
+        req = self.budgeter.request(self.account, "create_tweet", send)
+        self.timings["create_tweet_ms"] = elapsed_ms(start)
+        logger.info(f"[{self.account}] create_tweet {req.json()}")
+        if req.status_code < 200 or req.status_code > 299:
+            raise tweepy.errors.HTTPException(req)
+        return req.json()["data"]["id"]
+
+
+def mediaUpload(file_name, auth, form, client, account, timings=None):
+    """
+    Upload the media and tweet it, phase timings are written to the timings dict if given
+    """
+    mediaTweet = MediaTweet(file_name, auth, client, account)
+    try:
+        mediaTweet.upload_init(form)
+        mediaTweet.upload_append()
+        mediaTweet.upload_finalize()
+        tweet_id = mediaTweet.tweet_v2()
+    finally:
+        if timings is not None:
+            timings.update(mediaTweet.timings)
     return tweet_id
 
 
 # main post action is here
 
 
-with open(
-    os.path.join(settings.BASE_DIR, "data", "twitter_credentials.json"),
-    "r",
-    encoding="UTF-8",
-) as twitter_credentials_json:
-    twitter_credentials = json.load(twitter_credentials_json)
+@lru_cache(maxsize=None)
+def get_twitter_credentials() -> dict:
+    """
+    Load the credentials of all accounts on first use
+    """
+    with open(
+        os.path.join(settings.BASE_DIR, "data", "twitter_credentials.json"),
+        "r",
+        encoding="UTF-8",
+    ) as twitter_credentials_json:
+        return json.load(twitter_credentials_json)
 
 
 def auth_api(the_seiyuu_instance: Seiyuu):
+    import tweepy
+    from requests_oauthlib import OAuth1
+
     try:
-        the_twitter_credentials = twitter_credentials[the_seiyuu_instance.id_name]
+        the_twitter_credentials = get_twitter_credentials()[
+            the_seiyuu_instance.id_name
+        ]
     except KeyError:
         raise ValueError(f"Token missing for id_name: {the_seiyuu_instance.id_name}")
 
@@ -215,6 +302,8 @@ def auth_api(the_seiyuu_instance: Seiyuu):
             consumer_secret=the_twitter_credentials["api_key_secret"],
             access_token=the_twitter_credentials["access"],
             access_token_secret=the_twitter_credentials["access_secret"],
+            # raw responses carry the rate limit headers
+            return_type=get_requests().Response,
         )
     except tweepy.errors.Unauthorized:
         # print("Error during authentication")
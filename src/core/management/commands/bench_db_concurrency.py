@@ -0,0 +1,145 @@
+import random
+import threading
+import time
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+from django.test.utils import override_settings
+from django.utils.timezone import now
+
+from core.models import Seiyuu, Tweet
+from core.utils import get_stats_from_query_options, update_tweet_metrics_bulk
+
+from ._bench import create_bench_tweets, temporary_database
+
+
+# the SQLite defaults before the tuned profile, journal_mode is stored in the file
+DEFAULT_PRAGMAS = {
+    "journal_mode": "DELETE",
+    "synchronous": "FULL",
+    "busy_timeout": 5000,
+}
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)]
+
+
+class Command(BaseCommand):
+    help = "Measure read latency while the crawler writes, with the default and the tuned SQLite settings, on a temporary database"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--tweets", type=int, default=5000, help="Number of tweets in the database"
+        )
+        parser.add_argument(
+            "--readers", type=int, default=4, help="Threads reading the stats"
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=500, help="Tweets per write transaction"
+        )
+        parser.add_argument(
+            "--seconds", type=float, default=5.0, help="Duration of each run"
+        )
+
+    def handle(self, **options):
+        with temporary_database():
+            with override_settings(SQLITE_PRAGMAS=DEFAULT_PRAGMAS):
+                connection.close()
+                self.tweet_ids = create_bench_tweets(options["tweets"], seiyuu_count=4)
+                # the stats only read tweets with data, both runs read all of them
+                Tweet.objects.update(data_time=now(), like=0, rt=0, quote=0)
+                self.seiyuu = list(Seiyuu.objects.all())
+                before = self.run(options, persistent=False)
+            connection.close()
+            after = self.run(options, persistent=True)
+            connection.close()
+
+        for name, result in (("Default", before), ("Tuned", after)):
+            self.stdout.write(
+                f"{name}: {result['reads']} reads, p50 {result['p50']:.1f}ms, "
+                f"p95 {result['p95']:.1f}ms, max {result['max']:.1f}ms, "
+                f"{result['errors']} locked, {result['writes']} write batches, "
+                f"{result['write_errors']} locked writes"
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Tuned p95 read latency is {before['p95'] / after['p95']:.1f}x lower, "
+                f"{after['reads'] / max(before['reads'], 1):.1f}x the reads"
+            )
+        )
+
+    def run(self, options, persistent: bool) -> dict:
+        """
+        One writer updates metrics in batches like the crawler, the readers load the
+        stats page in a loop. Without persistent connections every read reconnects.
+        """
+        stop = threading.Event()
+        latencies = []
+        errors = []
+        writes = []
+        write_errors = []
+        lock = threading.Lock()
+
+        def write():
+            try:
+                while not stop.is_set():
+                    batch = random.sample(self.tweet_ids, options["batch_size"])
+                    try:
+                        update_tweet_metrics_bulk(
+                            [
+                                {
+                                    "id": tweet_id,
+                                    "like": random.randint(0, 500),
+                                    "rt": 0,
+                                    "quote": 0,
+                                }
+                                for tweet_id in batch
+                            ]
+                        )
+                    except OperationalError:
+                        write_errors.append(1)
+                    else:
+                        writes.append(1)
+            finally:
+                connection.close()
+
+        def read():
+            start_date = now().replace(year=2000)
+            try:
+                while not stop.is_set():
+                    start = time.perf_counter()
+                    try:
+                        get_stats_from_query_options(
+                            random.choice(self.seiyuu), start_date, now()
+                        )
+                    except OperationalError:
+                        with lock:
+                            errors.append(1)
+                    else:
+                        with lock:
+                            latencies.append((time.perf_counter() - start) * 1000)
+                    if not persistent:
+                        connection.close()
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=write)] + [
+            threading.Thread(target=read) for _ in range(options["readers"])
+        ]
+        for thread in threads:
+            thread.start()
+        time.sleep(options["seconds"])
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        return {
+            "reads": len(latencies),
+            "p50": percentile(latencies, 0.5) if latencies else 0,
+            "p95": percentile(latencies, 0.95) if latencies else 0,
+            "max": max(latencies, default=0),
+            "errors": len(errors),
+            "writes": len(writes),
+            "write_errors": len(write_errors),
+        }
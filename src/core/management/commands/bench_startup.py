@@ -0,0 +1,106 @@
+import os
+import subprocess
+import sys
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+
+
+class Command(BaseCommand):
+    help = "Measure the cold start of a management command with -X importtime and save the report"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "target", nargs="?", default="tweet_once", help="Command to measure"
+        )
+        parser.add_argument(
+            "--runs", type=int, default=5, help="Number of cold starts to time"
+        )
+        parser.add_argument(
+            "--top", type=int, default=20, help="Number of slowest imports to report"
+        )
+        parser.add_argument(
+            "--max-ms",
+            type=float,
+            default=None,
+            help="Fail if the median cold start is slower than this",
+        )
+        parser.add_argument(
+            "--output",
+            default=os.path.join(settings.BASE_DIR, "data", "benchmarks"),
+            help="Directory to save the report",
+        )
+
+    def handle(self, *args, **options):
+        target = options["target"]
+        # "--help" loads the command module without running it
+        command = [
+            sys.executable,
+            os.path.join(settings.SRC_DIR, "manage.py"),
+            target,
+            "--help",
+        ]
+
+        wall_times = []
+        for _ in range(options["runs"]):
+            start = time.perf_counter()
+            subprocess.run(command, capture_output=True, check=True)
+            wall_times.append((time.perf_counter() - start) * 1000)
+        wall_times.sort()
+        median_ms = wall_times[len(wall_times) // 2]
+
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", *command[1:]],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        imports = self.parse_importtime(result.stderr)
+        total_ms = sum(self_us for _, self_us, _ in imports) / 1000
+        slowest = sorted(imports, key=lambda row: row[2], reverse=True)[
+            : options["top"]
+        ]
+
+        lines = [
+            f"command: manage.py {target}",
+            f"runs: {options['runs']}",
+            f"median wall time: {median_ms:.1f} ms",
+            f"min wall time: {wall_times[0]:.1f} ms",
+            f"total import time: {total_ms:.1f} ms ({len(imports)} modules)",
+            "",
+            f"{'cumulative ms':>14} {'self ms':>9}  module",
+        ]
+        for module, self_us, cumulative_us in slowest:
+            lines.append(
+                f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {module}"
+            )
+        report = "\n".join(lines)
+
+        os.makedirs(options["output"], exist_ok=True)
+        report_path = os.path.join(options["output"], f"startup_{target}.txt")
+        with open(report_path, "w", encoding="UTF-8") as f:
+            f.write(report + "\n")
+
+        self.stdout.write(report)
+        self.stdout.write(self.style.SUCCESS(f"Report saved to {report_path}"))
+
+        if options["max_ms"] is not None and median_ms > options["max_ms"]:
+            raise CommandError(
+                f"Cold start of {target} took {median_ms:.1f} ms, limit is {options['max_ms']} ms"
+            )
+
+    def parse_importtime(self, stderr: str) -> list[tuple[str, int, int]]:
+        """
+        Parse "import time: self [us] | cumulative | imported package" lines
+        """
+        imports = []
+        for line in stderr.splitlines():
+            if not line.startswith("import time:"):
+                continue
+            fields = line[len("import time:") :].split("|")
+            if len(fields) != 3 or not fields[0].strip().isdigit():
+                continue
+            imports.append(
+                (fields[2].strip(), int(fields[0].strip()), int(fields[1].strip()))
+            )
+        return imports
@@ -0,0 +1,136 @@
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+from django.core.management.base import BaseCommand
+
+
+# core_tweet before and after the integer key, without the lease columns
+TWEET_TABLE = """
+    CREATE TABLE core_tweet (
+        id {id_type} NOT NULL PRIMARY KEY,
+        post_time datetime NULL,
+        data_time datetime NULL,
+        "like" smallint NULL,
+        rt smallint NULL,
+        reply smallint NULL,
+        quote smallint NULL,
+        media_id bigint NOT NULL,
+        seiyuu_id integer NOT NULL
+    )
+"""
+SNAPSHOT_TABLE = """
+    CREATE TABLE core_tweet_metric_snapshot (
+        id integer NOT NULL PRIMARY KEY AUTOINCREMENT,
+        tweet_id {id_type} NOT NULL,
+        age integer NOT NULL,
+        "like" integer NOT NULL
+    )
+"""
+INDEXES = [
+    "CREATE INDEX core_tweet_seiyuu_post_time ON core_tweet (seiyuu_id, post_time)",
+    "CREATE INDEX core_snapshot_tweet_age ON core_tweet_metric_snapshot (tweet_id, age)",
+]
+
+
+class Command(BaseCommand):
+    help = "Compare the size and lookup speed of text and integer tweet ids on temporary SQLite files"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--tweets", type=int, default=200000, help="Number of tweets to insert"
+        )
+        parser.add_argument(
+            "--snapshots", type=int, default=3, help="Metric snapshots per tweet"
+        )
+        parser.add_argument(
+            "--lookups", type=int, default=20000, help="Number of random id lookups"
+        )
+
+    def handle(self, **options):
+        self.snapshots = options["snapshots"]
+        # snowflake-like ids, increasing with the post time
+        tweet_ids = sorted(
+            random.sample(range(1700000000000000000, 1800000000000000000), options["tweets"])
+        )
+        lookup_ids = random.choices(tweet_ids, k=options["lookups"])
+
+        tmp_dir = tempfile.mkdtemp(prefix="seiyuu_bench_")
+        try:
+            text = self.measure(
+                os.path.join(tmp_dir, "text.sqlite3"), "varchar(50)", str, tweet_ids, lookup_ids
+            )
+            integer = self.measure(
+                os.path.join(tmp_dir, "integer.sqlite3"), "integer", int, tweet_ids, lookup_ids
+            )
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        for name, result in (("Text ids", text), ("Integer ids", integer)):
+            self.stdout.write(
+                f"{name}: {result['size'] / 1024 / 1024:.1f} MiB, "
+                f"{result['lookup_us']:.1f} us per tweet lookup, "
+                f"{result['join_us']:.1f} us per tweet with snapshots"
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Integer ids are {1 - integer['size'] / text['size']:.0%} smaller, "
+                f"lookups {text['lookup_us'] / integer['lookup_us']:.1f}x "
+                f"and joins {text['join_us'] / integer['join_us']:.1f}x faster"
+            )
+        )
+
+    def measure(
+        self, db_path: str, id_type: str, to_key, tweet_ids: list, lookup_ids: list
+    ) -> dict:
+        db = sqlite3.connect(db_path)
+        try:
+            db.execute(TWEET_TABLE.format(id_type=id_type))
+            db.execute(SNAPSHOT_TABLE.format(id_type=id_type))
+            for index in INDEXES:
+                db.execute(index)
+
+            # inserted in a random order, like tweets of many seiyuu crawled out of order
+            rows = [
+                (to_key(tweet_id), "2024-01-01 00:00:00", i % 500, i % 12)
+                for i, tweet_id in enumerate(tweet_ids)
+            ]
+            random.shuffle(rows)
+            with db:
+                db.executemany(
+                    "INSERT INTO core_tweet (id, post_time, media_id, seiyuu_id) "
+                    "VALUES (?, ?, ?, ?)",
+                    rows,
+                )
+                db.executemany(
+                    'INSERT INTO core_tweet_metric_snapshot (tweet_id, age, "like") '
+                    "VALUES (?, ?, 0)",
+                    (
+                        (to_key(tweet_id), age * 3600)
+                        for age in range(self.snapshots)
+                        for tweet_id in tweet_ids
+                    ),
+                )
+            db.execute("VACUUM")
+            size = os.path.getsize(db_path)
+
+            keys = [to_key(tweet_id) for tweet_id in lookup_ids]
+            start = time.perf_counter()
+            for key in keys:
+                db.execute("SELECT * FROM core_tweet WHERE id = ?", (key,)).fetchone()
+            lookup_us = (time.perf_counter() - start) / len(keys) * 1e6
+
+            start = time.perf_counter()
+            for key in keys:
+                db.execute(
+                    'SELECT t.id, s.age, s."like" FROM core_tweet t '
+                    "JOIN core_tweet_metric_snapshot s ON s.tweet_id = t.id WHERE t.id = ?",
+                    (key,),
+                ).fetchall()
+            join_us = (time.perf_counter() - start) / len(keys) * 1e6
+        finally:
+            db.close()
+
+        return {"size": size, "lookup_us": lookup_us, "join_us": join_us}
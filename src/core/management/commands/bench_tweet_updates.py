@@ -0,0 +1,72 @@
+import random
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.urls import reverse
+
+from ._bench import create_bench_tweets, temporary_database
+
+
+class Command(BaseCommand):
+    help = "Compare the per-tweet and the batch tweet data endpoints on a temporary database"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--tweets", type=int, default=500, help="Number of tweets to update"
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Tweets per batch request",
+        )
+
+    def handle(self, **options):
+        count = options["tweets"]
+        batch_size = options["batch_size"]
+
+        with temporary_database():
+            tweet_ids = create_bench_tweets(count)
+            client = Client(HTTP_HOST=settings.LOCAL_HOSTS[0])
+
+            def metrics(tweet_id):
+                return {
+                    "id": tweet_id,
+                    "like": random.randint(0, 500),
+                    "rt": random.randint(0, 100),
+                    "quote": random.randint(0, 10),
+                }
+
+            start = time.perf_counter()
+            for tweet_id in tweet_ids:
+                client.patch(
+                    reverse("update_tweet_data", args=[tweet_id]),
+                    metrics(tweet_id),
+                    content_type="application/json",
+                )
+            single_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for i in range(0, count, batch_size):
+                response = client.post(
+                    reverse("update_tweet_data_batch"),
+                    [metrics(tweet_id) for tweet_id in tweet_ids[i : i + batch_size]],
+                    content_type="application/json",
+                )
+                if response.json()["updated"] != len(tweet_ids[i : i + batch_size]):
+                    self.stdout.write(self.style.ERROR(f"Batch {i // batch_size} incomplete"))
+            batch_seconds = time.perf_counter() - start
+
+        self.stdout.write(
+            f"Per tweet: {count} requests in {single_seconds:.2f}s "
+            f"({count / single_seconds:.0f} tweets/s)"
+        )
+        requests = -(-count // batch_size)
+        self.stdout.write(
+            f"Batch: {requests} requests in {batch_seconds:.2f}s "
+            f"({count / batch_seconds:.0f} tweets/s)"
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f"Batch is {single_seconds / batch_seconds:.1f}x faster")
+        )
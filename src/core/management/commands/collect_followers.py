@@ -0,0 +1,130 @@
+import asyncio
+import time
+from core.models import Seiyuu
+from core.rate_limit import RateLimitExceeded
+from core.utils import create_followers_bulk
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from ._lookup_handler import LOOKUP_BATCH_SIZE, TwitterLookupError, lookup_followers
+from ._post_handler import get_twitter_credentials
+
+
+class Command(BaseCommand):
+    help = "Sample the follower counts of all seiyuu with batched user lookups"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--follow",
+            action="store_true",
+            help="Keep running and take a sample every interval",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=3600.0,
+            help="Seconds between samples in follow mode",
+        )
+        parser.add_argument(
+            "--account",
+            default=None,
+            help="id_name of the credentials used for the lookups, default is the first seiyuu with credentials",
+        )
+        parser.add_argument(
+            "--base-url",
+            default=None,
+            help="Twitter API root, default is TWITTER_API_BASE_URL",
+        )
+
+    def handle(self, **options):
+        credentials = get_twitter_credentials()
+        account = options["account"]
+        if account is None:
+            account = next(
+                (
+                    id_name
+                    for id_name in Seiyuu.objects.order_by("id").values_list(
+                        "id_name", flat=True
+                    )
+                    if id_name in credentials
+                ),
+                None,
+            )
+        if account not in credentials:
+            self.stdout.write(self.style.ERROR("No credentials for the lookups"))
+            return
+
+        try:
+            while True:
+                self.collect(
+                    account, credentials[account]["bearer_token"], options["base_url"]
+                )
+                if not options["follow"]:
+                    break
+                close_old_connections()
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            pass
+
+    def collect(self, account: str, bearer_token: str, base_url: str | None):
+        start = time.perf_counter()
+        # one data time for the whole sample, so the seiyuu line up in the charts
+        data_time = timezone.now()
+
+        screen_names = list(
+            Seiyuu.objects.filter(screen_name__isnull=False).values_list(
+                "screen_name", flat=True
+            )
+        )
+        try:
+            followers = asyncio.run(
+                self.lookup_all(account, bearer_token, screen_names, base_url)
+            )
+        except (TwitterLookupError, RateLimitExceeded, OSError) as e:
+            self.stdout.write(self.style.ERROR(f"[{account}] Lookup failed: {e}"))
+            return
+
+        results = create_followers_bulk(
+            [
+                {"seiyuu": screen_name, "followers": count, "data_time": data_time}
+                for screen_name, count in followers.items()
+            ]
+        )
+        created = sum(result["status"] for result in results)
+        missing = sorted(set(screen_names) - followers.keys())
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{created}/{len(screen_names)} follower counts saved "
+                f"in {time.perf_counter() - start:.2f}s"
+            )
+        )
+        if missing:
+            self.stdout.write(self.style.WARNING(f"Not found: {', '.join(missing)}"))
+
+    async def lookup_all(
+        self,
+        account: str,
+        bearer_token: str,
+        screen_names: list[str],
+        base_url: str | None,
+    ) -> dict[str, int]:
+        semaphore = asyncio.Semaphore(1)
+        results = await asyncio.gather(
+            *(
+                lookup_followers(
+                    semaphore,
+                    account,
+                    bearer_token,
+                    screen_names[i : i + LOOKUP_BATCH_SIZE],
+                    base_url,
+                )
+                for i in range(0, len(screen_names), LOOKUP_BATCH_SIZE)
+            )
+        )
+        return {
+            screen_name: count
+            for result in results
+            for screen_name, count in result.items()
+        }
@@ -0,0 +1,158 @@
+import asyncio
+import time
+from core.models import Seiyuu
+from core.rate_limit import RateLimitExceeded
+from core.utils import (
+    claim_due_tweets,
+    record_crawl_failures,
+    release_leased_tweets,
+    update_tweet_metrics_bulk,
+)
+from django.core.management.base import BaseCommand
+from django.conf import settings
+
+from ._lookup_handler import LOOKUP_BATCH_SIZE, TwitterLookupError, lookup_tweets
+from ._post_handler import get_twitter_credentials
+
+
+class Command(BaseCommand):
+    help = "Collect like/rt/quote/reply of due tweets with batched lookups, concurrently across accounts"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Tweets claimed from the queue per round",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=4,
+            help="Max lookup requests in flight",
+        )
+        parser.add_argument(
+            "--lease-seconds",
+            type=int,
+            default=settings.TWEET_LEASE_SECONDS,
+            help="Lease of the claimed tweets, tweets that failed are collected again after it",
+        )
+        parser.add_argument(
+            "--max-tweets",
+            type=int,
+            default=None,
+            help="Stop after claiming this many tweets",
+        )
+        parser.add_argument(
+            "--base-url",
+            default=None,
+            help="Twitter API root, default is TWITTER_API_BASE_URL",
+        )
+
+    def handle(self, **options):
+        credentials = get_twitter_credentials()
+        self.accounts = {
+            screen_name: id_name
+            for screen_name, id_name in Seiyuu.objects.filter(
+                screen_name__isnull=False
+            ).values_list("screen_name", "id_name")
+            if id_name in credentials
+        }
+        self.credentials = credentials
+        self.options = options
+
+        claimed = 0
+        while options["max_tweets"] is None or claimed < options["max_tweets"]:
+            limit = options["batch_size"]
+            if options["max_tweets"] is not None:
+                limit = min(limit, options["max_tweets"] - claimed)
+            lease_token, _, tweets = claim_due_tweets(limit, options["lease_seconds"])
+            if not tweets:
+                break
+            claimed += len(tweets)
+            try:
+                self.collect_round(lease_token, tweets)
+            except KeyboardInterrupt:
+                # the tweets can be claimed again right away
+                release_leased_tweets(lease_token)
+                raise
+
+        self.stdout.write(self.style.SUCCESS(f"Done, {claimed} tweets claimed"))
+
+    def collect_round(self, lease_token: str, tweets: list[dict]):
+        start = time.perf_counter()
+
+        by_account: dict[str, list[str]] = {}
+        no_credentials = []
+        for tweet in tweets:
+            id_name = self.accounts.get(tweet["media__seiyuu__screen_name"])
+            if id_name is None:
+                no_credentials.append(tweet["id"])
+                continue
+            by_account.setdefault(id_name, []).append(tweet["id"])
+
+        metrics, failed_ids, failed = asyncio.run(self.lookup_all(by_account))
+
+        results = update_tweet_metrics_bulk(
+            [{"id": tweet_id, **values} for tweet_id, values in metrics.items()],
+            lease_token=lease_token,
+        )
+        updated = sum(result["status"] for result in results.values())
+        # deleted or protected tweets are missing from a successful lookup
+        missing = [
+            tweet_id
+            for tweet_ids in by_account.values()
+            for tweet_id in tweet_ids
+            if tweet_id not in metrics and tweet_id not in failed_ids
+        ]
+        # all tweets not written stay leased until the lease expires, so a round never
+        # claims them again. Missing tweets and tweets without credentials count a
+        # failure and drop out of the queue after MAX_CRAWL_FAILURES, tweets of
+        # failed requests are just retried.
+        record_crawl_failures(lease_token, missing + no_credentials)
+
+        self.stdout.write(
+            f"{len(tweets)} claimed, {updated} updated, {len(missing)} missing, "
+            f"{failed} failed requests, {len(no_credentials)} without credentials "
+            f"in {time.perf_counter() - start:.2f}s"
+        )
+
+    async def lookup_all(
+        self, by_account: dict[str, list[str]]
+    ) -> tuple[dict, set[str], int]:
+        """
+        Lookups of all accounts at once, each with its own bearer token and rate limit
+        budget. Return (metrics, ids of the failed requests, number of failed requests)
+        """
+        semaphore = asyncio.Semaphore(self.options["concurrency"])
+        jobs = []
+        tasks = []
+        for id_name, tweet_ids in by_account.items():
+            for i in range(0, len(tweet_ids), LOOKUP_BATCH_SIZE):
+                batch = tweet_ids[i : i + LOOKUP_BATCH_SIZE]
+                jobs.append((id_name, batch))
+                tasks.append(
+                    lookup_tweets(
+                        semaphore,
+                        id_name,
+                        self.credentials[id_name]["bearer_token"],
+                        batch,
+                        self.options["base_url"],
+                    )
+                )
+
+        metrics = {}
+        failed_ids = set()
+        failed = 0
+        for (id_name, batch), result in zip(
+            jobs, await asyncio.gather(*tasks, return_exceptions=True)
+        ):
+            if isinstance(result, (TwitterLookupError, RateLimitExceeded, OSError)):
+                self.stdout.write(self.style.ERROR(f"[{id_name}] Lookup failed: {result}"))
+                failed_ids.update(batch)
+                failed += 1
+            elif isinstance(result, BaseException):
+                raise result
+            else:
+                metrics.update(result)
+        return metrics, failed_ids, failed
@@ -0,0 +1,42 @@
+import os
+from core.models import Media
+from core.thumbnails import evict_thumbnails, generate_thumbnails_bulk
+from django.core.management.base import BaseCommand
+from django.conf import settings
+
+
+class Command(BaseCommand):
+    help = "Generate missing thumbnails of all hashed Media and evict the cache down to its size limit"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Number of processes, default is the number of CPUs",
+        )
+        parser.add_argument(
+            "--max-bytes",
+            type=int,
+            default=settings.THUMBNAIL_CACHE_MAX_BYTES,
+            help="Size limit of the thumbnail cache",
+        )
+
+    def handle(self, **options):
+        files = [
+            (os.path.join(settings.MEDIA_ROOT, file_path), file_type, content_hash)
+            for file_path, file_type, content_hash in Media.objects.filter(
+                content_hash__isnull=False
+            ).values_list("file_path", "file_type", "content_hash")
+            if os.path.isfile(os.path.join(settings.MEDIA_ROOT, file_path))
+        ]
+
+        done = generate_thumbnails_bulk(files, options["workers"])
+        self.stdout.write(f"{done}/{len(files)} files have thumbnails")
+
+        deleted, freed = evict_thumbnails(options["max_bytes"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Evicted {deleted} thumbnails, {freed / 1024 / 1024:.1f} MB freed"
+            )
+        )
@@ -1,72 +1,69 @@
-import os
-from core.models import Media, Seiyuu
+from core.models import Seiyuu
 from django.core.management.base import BaseCommand
-from django.conf import settings
+
+from ._import_handler import MediaImporter
 
 
 class Command(BaseCommand):
     help = "Import new image from ImportQueue to Library, and create Media instance"
 
-    def handle(self, **options):
-
-        for the_seiyuu_instance in Seiyuu.objects.all():
-            self.import_image_from_queue(the_seiyuu_instance)
-
-    def import_image_from_queue(self, seiyuu_instance: Seiyuu):
-        imgs_path = os.path.join(
-            settings.BASE_DIR, "data", "media", "Library", seiyuu_instance.image_folder
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Number of hashing processes, default is the number of CPUs",
         )
-        import_path = os.path.join(
-            settings.BASE_DIR,
-            "data",
-            "media",
-            "ImportQueue",
-            seiyuu_instance.image_folder,
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of files hashed and inserted per transaction",
+        )
+        parser.add_argument(
+            "--backfill-hashes",
+            action="store_true",
+            help="Hash Library files of existing Media that have no content hash",
+        )
+        parser.add_argument(
+            "--skip-near-duplicate-check",
+            action="store_true",
+            help="Import images even if they look like an image in the Library",
         )
 
-        imgs = os.listdir(imgs_path)
-        import_imgs: list[str] = os.listdir(import_path)
-
-        import_len = len(import_imgs)
-
-        for idx, img in enumerate(import_imgs):
-
-            if img in imgs:
-                self.stdout.write(
-                    self.style.WARNING(
-                        f"[{seiyuu_instance.id_name}] {idx+1}/{import_len} - {img} Already exists, skipping"
-                    )
-                )
-                continue
-
-            os.rename(os.path.join(import_path, img), os.path.join(imgs_path, img))
+    def handle(self, **options):
+        importer = MediaImporter(
+            self.stdout,
+            self.style,
+            workers=options["workers"],
+            batch_size=options["batch_size"],
+            check_near_duplicates=not options["skip_near_duplicate_check"],
+        )
 
-            file_type = "image/jpg"
+        total = {
+            "queued": 0,
+            "imported": 0,
+            "skipped": 0,
+            "quarantined": 0,
+            "bytes": 0,
+            "seconds": 0.0,
+        }
 
-            if img.lower().endswith(".jpg") or img.lower().endswith(".jpeg"):
-                file_type = "image/jpg"
-            elif img.lower().endswith(".png"):
-                file_type = "image/png"
-            elif img.lower().endswith(".mp4"):
-                file_type = "video/mp4"
-            elif img.lower().endswith(".gif"):
-                file_type = "gif/gif"
-            else:
+        for the_seiyuu_instance in Seiyuu.objects.all():
+            if options["backfill_hashes"]:
+                count = importer.backfill_hashes(the_seiyuu_instance)
                 self.stdout.write(
-                    self.style.ERROR(
-                        f"[{seiyuu_instance.id_name}] {idx+1}/{import_len} - {img} Invalid file type: {img.split('.')[-1].lower()}, skipping"
-                    )
+                    f"[{the_seiyuu_instance.id_name}] Hashed {count} existing files"
                 )
-                continue
 
-            Media.objects.create(
-                file_path=os.path.join(seiyuu_instance.image_folder, img),
-                seiyuu=seiyuu_instance,
-                file_type=file_type,
-            )
+            stats = importer.import_seiyuu(the_seiyuu_instance)
+            for key in total:
+                total[key] += stats[key]
 
+        if total["seconds"]:
             self.stdout.write(
-                self.style.SUCCESS(
-                    f"[{seiyuu_instance.id_name}] {idx+1}/{import_len} - {img} Imported"
-                )
+                f"Imported {total['imported']}, skipped {total['skipped']}, "
+                f"quarantined {total['quarantined']} of {total['queued']} files "
+                f"in {total['seconds']:.2f}s ({total['imported'] / total['seconds']:.1f} files/s, "
+                f"{total['bytes'] / 1024 / 1024 / total['seconds']:.1f} MB/s)"
             )
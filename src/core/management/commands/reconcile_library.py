@@ -0,0 +1,311 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from core.hashing import get_file_type, hash_file, phash_file
+from core.models import LibraryFile, Media, Seiyuu
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.db import transaction
+
+from ._import_handler import POOL_THRESHOLD, QUERY_CHUNK_SIZE, get_existing_hashes
+
+
+def scan_folder(image_folder: str) -> dict[str, tuple[int, int]] | None:
+    """
+    {file path relative to the Library: (size, mtime_ns)} of one seiyuu folder,
+    None if the folder doesn't exist
+    """
+    files = {}
+    try:
+        entries = os.scandir(os.path.join(settings.MEDIA_ROOT, image_folder))
+    except FileNotFoundError:
+        return None
+    with entries:
+        for entry in entries:
+            if entry.is_file(follow_symlinks=False):
+                stat = entry.stat(follow_symlinks=False)
+                files[os.path.join(image_folder, entry.name)] = (
+                    stat.st_size,
+                    stat.st_mtime_ns,
+                )
+    return files
+
+
+class Command(BaseCommand):
+    help = "Compare the Library folder with the Media table through the file manifest, report or fix orphans"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--fix",
+            action="store_true",
+            help="Create Media for untracked files and flag Media with missing files as missing",
+        )
+        parser.add_argument(
+            "--list",
+            action="store_true",
+            help="Print every orphan instead of only the counts",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Number of hashing processes, default is the number of CPUs",
+        )
+
+    def handle(self, **options):
+        start = time.perf_counter()
+        seiyuu_by_folder = {
+            the_seiyuu_instance.image_folder: the_seiyuu_instance
+            for the_seiyuu_instance in Seiyuu.objects.filter(image_folder__isnull=False)
+        }
+        scanned_folders = set()
+
+        # scan all seiyuu folders at once, scandir spends its time waiting on the disk
+        disk_files: dict[str, tuple[int, int]] = {}
+        with ThreadPoolExecutor(max_workers=min(len(seiyuu_by_folder), 16) or 1) as executor:
+            for image_folder, files in zip(
+                seiyuu_by_folder, executor.map(scan_folder, seiyuu_by_folder)
+            ):
+                if files is None:
+                    # an unmounted or renamed folder is not a folder without files
+                    self.stdout.write(
+                        self.style.ERROR(
+                            f"[{seiyuu_by_folder[image_folder].id_name}] Folder {image_folder} not found, skipping"
+                        )
+                    )
+                    continue
+                disk_files.update(files)
+                scanned_folders.add(image_folder)
+        scanned = time.perf_counter()
+
+        manifest = self.update_manifest(disk_files, scanned_folders, options["workers"])
+        hashed = time.perf_counter()
+
+        media_paths = {
+            file_path: media_id
+            for file_path, media_id, image_folder in Media.objects.values_list(
+                "file_path", "id", "seiyuu__image_folder"
+            )
+            if image_folder in scanned_folders
+        }
+        missing_files = sorted(media_paths.keys() - disk_files.keys())
+        untracked_files = sorted(disk_files.keys() - media_paths.keys())
+
+        self.stdout.write(
+            f"{len(disk_files)} files on disk, {len(media_paths)} Media, "
+            f"{len(missing_files)} Media without file, {len(untracked_files)} files without Media"
+        )
+        if options["list"]:
+            for file_path in missing_files:
+                self.stdout.write(
+                    self.style.ERROR(f"Missing file: {file_path} (Media {media_paths[file_path]})")
+                )
+            for file_path in untracked_files:
+                self.stdout.write(self.style.WARNING(f"Untracked file: {file_path}"))
+
+        if options["fix"]:
+            self.fix(
+                missing_files,
+                untracked_files,
+                disk_files,
+                media_paths,
+                manifest,
+                seiyuu_by_folder,
+                options["workers"],
+            )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Done in {time.perf_counter() - start:.2f}s "
+                f"(scan {scanned - start:.2f}s, manifest {hashed - scanned:.2f}s)"
+            )
+        )
+
+    def update_manifest(
+        self,
+        disk_files: dict[str, tuple[int, int]],
+        scanned_folders: set[str],
+        workers: int | None,
+    ) -> dict[str, str]:
+        """
+        Rehash new or changed files, drop deleted ones of the scanned folders,
+        return {file path: content hash}
+        """
+        manifest = {
+            file_path: (size, mtime_ns, content_hash)
+            for file_path, size, mtime_ns, content_hash in LibraryFile.objects.values_list(
+                "file_path", "size", "mtime_ns", "content_hash"
+            )
+        }
+
+        changed = [
+            file_path
+            for file_path, signature in disk_files.items()
+            if manifest.get(file_path, (None, None))[:2] != signature
+        ]
+        deleted = [
+            file_path
+            for file_path in manifest.keys() - disk_files.keys()
+            if os.path.dirname(file_path) in scanned_folders
+        ]
+
+        hashes = {}
+        if changed:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                hashes = dict(
+                    zip(
+                        changed,
+                        executor.map(
+                            hash_file,
+                            [os.path.join(settings.MEDIA_ROOT, path) for path in changed],
+                            chunksize=32,
+                        ),
+                    )
+                )
+
+        with transaction.atomic():
+            LibraryFile.objects.bulk_create(
+                [
+                    LibraryFile(
+                        file_path=file_path,
+                        size=disk_files[file_path][0],
+                        mtime_ns=disk_files[file_path][1],
+                        content_hash=content_hash,
+                    )
+                    for file_path, content_hash in hashes.items()
+                ],
+                batch_size=500,
+                update_conflicts=True,
+                unique_fields=["file_path"],
+                update_fields=["size", "mtime_ns", "content_hash"],
+            )
+            for i in range(0, len(deleted), QUERY_CHUNK_SIZE):
+                LibraryFile.objects.filter(
+                    file_path__in=deleted[i : i + QUERY_CHUNK_SIZE]
+                ).delete()
+
+        self.stdout.write(
+            f"Manifest: {len(hashes)} files hashed, {len(deleted)} removed, "
+            f"{len(disk_files) - len(hashes)} unchanged"
+        )
+
+        return {
+            file_path: hashes.get(file_path) or manifest[file_path][2]
+            for file_path in disk_files
+        }
+
+    def fix(
+        self,
+        missing_files: list[str],
+        untracked_files: list[str],
+        disk_files: dict[str, tuple[int, int]],
+        media_paths: dict[str, int],
+        manifest: dict[str, str],
+        seiyuu_by_folder: dict[str, Seiyuu],
+        workers: int | None,
+    ):
+        # a renamed file is missing under its old path and untracked under the new one
+        # with the same content, its Media is moved instead of tracked twice
+        missing_by_hash = {}
+        for i in range(0, len(missing_files), QUERY_CHUNK_SIZE):
+            for media_id, seiyuu_id, content_hash in Media.objects.filter(
+                file_path__in=missing_files[i : i + QUERY_CHUNK_SIZE],
+                content_hash__isnull=False,
+            ).values_list("id", "seiyuu_id", "content_hash"):
+                missing_by_hash[(seiyuu_id, content_hash)] = media_id
+
+        existing_hashes = {
+            seiyuu_instance.id: get_existing_hashes(
+                seiyuu_instance,
+                [
+                    manifest[file_path]
+                    for file_path in untracked_files
+                    if os.path.dirname(file_path) == image_folder
+                ],
+            )
+            for image_folder, seiyuu_instance in seiyuu_by_folder.items()
+        }
+
+        new_media = []
+        moved_media = []
+        for file_path in untracked_files:
+            file_type = get_file_type(file_path)
+            if file_type is None:
+                self.stdout.write(
+                    self.style.ERROR(f"Invalid file type, not tracked: {file_path}")
+                )
+                continue
+            seiyuu_instance = seiyuu_by_folder[os.path.dirname(file_path)]
+            content_hash = manifest[file_path]
+            media_id = missing_by_hash.pop((seiyuu_instance.id, content_hash), None)
+            if media_id is not None:
+                moved_media.append(
+                    Media(
+                        id=media_id,
+                        file_path=file_path,
+                        file_type=file_type,
+                        missing=False,
+                    )
+                )
+                continue
+            if content_hash in existing_hashes[seiyuu_instance.id]:
+                self.stdout.write(
+                    self.style.WARNING(
+                        f"[{seiyuu_instance.id_name}] {file_path} Same content as another Media, not tracked"
+                    )
+                )
+                continue
+            existing_hashes[seiyuu_instance.id].add(content_hash)
+            new_media.append(
+                Media(
+                    file_path=file_path,
+                    file_type=file_type,
+                    seiyuu=seiyuu_instance,
+                    content_hash=content_hash,
+                )
+            )
+
+        # the near-duplicate check of the import and scan_duplicates compare phash
+        phash_paths = [
+            os.path.join(settings.MEDIA_ROOT, media.file_path) for media in new_media
+        ]
+        if len(phash_paths) < POOL_THRESHOLD or workers == 1:
+            phashes = [phash_file(file_path) for file_path in phash_paths]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                phashes = list(executor.map(phash_file, phash_paths, chunksize=16))
+        for media, phash in zip(new_media, phashes):
+            media.phash = phash
+
+        moved_ids = {media.id for media in moved_media}
+        missing_files = [
+            file_path
+            for file_path in missing_files
+            if media_paths[file_path] not in moved_ids
+        ]
+        found_files = list(disk_files.keys() & set(media_paths))
+        with transaction.atomic():
+            Media.objects.bulk_create(new_media, batch_size=500)
+            Media.objects.bulk_update(
+                moved_media, ["file_path", "file_type", "missing"], batch_size=500
+            )
+            # Media with tweets can't be deleted, the flag keeps them from being posted
+            # and their weight is kept for when the file is back
+            flagged = 0
+            for i in range(0, len(missing_files), QUERY_CHUNK_SIZE):
+                flagged += Media.objects.filter(
+                    file_path__in=missing_files[i : i + QUERY_CHUNK_SIZE], missing=False
+                ).update(missing=True)
+            restored = 0
+            for i in range(0, len(found_files), QUERY_CHUNK_SIZE):
+                restored += Media.objects.filter(
+                    file_path__in=found_files[i : i + QUERY_CHUNK_SIZE], missing=True
+                ).update(missing=False)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Created {len(new_media)} Media, moved {len(moved_media)} renamed Media, "
+                f"flagged {flagged} Media without file as missing, "
+                f"{restored} Media found again"
+            )
+        )
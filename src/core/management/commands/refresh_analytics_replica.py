@@ -0,0 +1,65 @@
+import os
+import sqlite3
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+
+
+class Command(BaseCommand):
+    help = "Copy the database to ANALYTICS_DB_PATH with the SQLite online backup API"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--follow",
+            action="store_true",
+            help="Keep running and refresh the replica every interval",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=300.0,
+            help="Seconds between refreshes in follow mode",
+        )
+
+    def handle(self, **options):
+        if not settings.ANALYTICS_DB_PATH:
+            raise CommandError("ANALYTICS_DB_PATH is not set")
+
+        try:
+            while True:
+                self.refresh(
+                    str(settings.DATABASES["default"]["NAME"]), settings.ANALYTICS_DB_PATH
+                )
+                if not options["follow"]:
+                    break
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            pass
+
+    def refresh(self, source_path: str, replica_path: str):
+        start = time.perf_counter()
+        tmp_path = f"{replica_path}.tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        source = sqlite3.connect(source_path)
+        replica = sqlite3.connect(tmp_path)
+        try:
+            # all pages in one step: a WAL read transaction doesn't block the writers,
+            # copying in steps would restart whenever the crawler commits
+            source.backup(replica)
+            # the analytics connection is read-only and can't create the -wal and -shm files
+            replica.execute("PRAGMA journal_mode = DELETE")
+        finally:
+            replica.close()
+            source.close()
+
+        # connections still reading the old replica keep it until they reconnect
+        os.replace(tmp_path, replica_path)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Replica refreshed, {os.path.getsize(replica_path) / 1024 / 1024:.1f} MiB "
+                f"in {time.perf_counter() - start:.2f}s"
+            )
+        )
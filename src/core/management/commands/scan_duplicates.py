@@ -0,0 +1,90 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from core.models import Media, Seiyuu
+from core.phash import BKTree, dhash
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.db import transaction
+
+
+class Command(BaseCommand):
+    help = "Compute missing perceptual hashes and report near-duplicate images in the Library"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--distance",
+            type=int,
+            default=settings.PHASH_MAX_DISTANCE,
+            help="Max hamming distance between two near-duplicates",
+        )
+        parser.add_argument(
+            "--seiyuu", default=None, help="Only scan the seiyuu with this id_name"
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Number of hashing processes, default is the number of CPUs",
+        )
+
+    def handle(self, **options):
+        seiyuu_query = Seiyuu.objects.all()
+        if options["seiyuu"]:
+            seiyuu_query = seiyuu_query.filter(id_name=options["seiyuu"])
+
+        for the_seiyuu_instance in seiyuu_query:
+            hashed = self.hash_missing(the_seiyuu_instance, options["workers"])
+            if hashed:
+                self.stdout.write(
+                    f"[{the_seiyuu_instance.id_name}] Computed {hashed} perceptual hashes"
+                )
+            self.report_duplicates(the_seiyuu_instance, options["distance"])
+
+    def hash_missing(self, seiyuu_instance: Seiyuu, workers: int | None) -> int:
+        media_list = [
+            media
+            for media in Media.objects.filter(
+                seiyuu=seiyuu_instance, phash__isnull=True
+            ).exclude(file_type="video/mp4")
+            if os.path.isfile(os.path.join(settings.MEDIA_ROOT, media.file_path))
+        ]
+        if not media_list:
+            return 0
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            hashes = executor.map(
+                dhash,
+                [os.path.join(settings.MEDIA_ROOT, media.file_path) for media in media_list],
+                chunksize=32,
+            )
+            for media, phash in zip(media_list, hashes):
+                media.phash = phash
+
+        media_list = [media for media in media_list if media.phash is not None]
+        with transaction.atomic():
+            Media.objects.bulk_update(media_list, ["phash"], batch_size=500)
+        return len(media_list)
+
+    def report_duplicates(self, seiyuu_instance: Seiyuu, max_distance: int):
+        tree = BKTree()
+        pairs = 0
+        for media_id, file_path, phash in (
+            Media.objects.filter(seiyuu=seiyuu_instance, phash__isnull=False)
+            .order_by("id")
+            .values_list("id", "file_path", "phash")
+        ):
+            # only compare with earlier media, so each pair is reported once
+            for distance, (other_id, other_path) in tree.search(phash, max_distance):
+                self.stdout.write(
+                    self.style.WARNING(
+                        f"[{seiyuu_instance.id_name}] {media_id} {file_path} ~ {other_id} {other_path} (distance {distance})"
+                    )
+                )
+                pairs += 1
+            tree.add(phash, (media_id, file_path))
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"[{seiyuu_instance.id_name}] {pairs} near-duplicate pairs in {len(tree)} images"
+            )
+        )
@@ -1,12 +1,17 @@
-from ._post_handler import auth_api, mediaUpload
+from ._post_handler import auth_api, mediaUpload, elapsed_ms
+import time
 import os
 from django.utils.timezone import now
 from random import choices
 from django.core.management.base import BaseCommand
 from pathlib import Path
-from core.models import Seiyuu, Tweet, Media
+from core.models import Seiyuu, Tweet, Media, UploadTiming
+from core.rate_limit import RateLimitExceeded
 from datetime import timedelta
 from django.conf import settings
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 class Command(BaseCommand):
@@ -21,14 +26,18 @@ class Command(BaseCommand):
 
             # check if last post time is older than now - interval
             if Tweet.objects.filter(
-                media__seiyuu=the_seiyuu_instance,
+                seiyuu=the_seiyuu_instance,
                 post_time__gt=(curr_time - timedelta(minutes=(post_interval * 60 - 5))),
             ).exists():
                 self.stdout.write(
                     f"[{the_seiyuu_instance.id_name}] Interval not reach, pass"
                 )
                 continue
-            ret = self.post_once(the_seiyuu_instance)
+            try:
+                ret = self.post_once(the_seiyuu_instance)
+            except RateLimitExceeded as e:
+                self.stdout.write(self.style.ERROR(str(e)))
+                ret = False
             if ret:
                 self.stdout.write(f"[{the_seiyuu_instance.id_name}] Post success")
             else:
@@ -36,7 +45,16 @@ class Command(BaseCommand):
 
     def post_once(self, seiyuu_instance: Seiyuu):
 
-        api, oauth, client = auth_api(seiyuu_instance)
+        start = time.perf_counter()
+        try:
+            api, oauth, client = auth_api(seiyuu_instance)
+        except (FileNotFoundError, ValueError) as e:
+            # no credentials file or no token of this seiyuu in it
+            self.stdout.write(
+                self.style.ERROR(f"[{seiyuu_instance.id_name}] Credentials missing: {e}")
+            )
+            return False
+        timings = {"auth_ms": elapsed_ms(start)}
 
         if not (api and oauth and client):
             self.stdout.write(
@@ -50,10 +68,15 @@ class Command(BaseCommand):
             self.style.SUCCESS(f"[{seiyuu_instance.id_name}] Authentication OK")
         )
 
-        media_q = Media.objects.filter(seiyuu=seiyuu_instance)
-        media_pks = media_q.values_list("pk", flat=True)
-        media_weights = media_q.values_list("weight", flat=True)
-        random_pk = choices(media_pks, media_weights)[0]
+        media_q = Media.objects.filter(seiyuu=seiyuu_instance, missing=False)
+        media_weights = dict(media_q.values_list("pk", "weight"))
+        # choices() raises if there is nothing to pick or all weights are 0
+        if sum(media_weights.values()) <= 0:
+            self.stdout.write(
+                self.style.ERROR(f"[{seiyuu_instance.id_name}] No media to post")
+            )
+            return False
+        random_pk = choices(list(media_weights), list(media_weights.values()))[0]
         random_media = media_q.get(pk=random_pk)
         random_file_path = random_media.file_path
 
@@ -68,12 +91,14 @@ class Command(BaseCommand):
         )
         f_type = random_media.file_type
         f_format = [f_type, f"tweet_{f_type.split('/')[0]}"]
-        tweet_id = mediaUpload(f_path, oauth, f_format, client)
+        tweet_id = mediaUpload(
+            f_path, oauth, f_format, client, seiyuu_instance.id_name, timings
+        )
 
         # the_tweet = api.user_timeline(user_id=bot_id, count=1)[0]  # v1
         # the_tweet = client.get_users_tweets(id=bot_user_id, max_results=5)[0] # v2
 
-        print(f"[{seiyuu_instance.id_name}] Posted tweet ID: {tweet_id}")
+        logger.info(f"[{seiyuu_instance.id_name}] Posted tweet ID: {tweet_id}")
 
         tweet_instance = Tweet(
             # id=the_tweet.id, # v1
@@ -81,7 +106,11 @@ class Command(BaseCommand):
             id=int(tweet_id),
             post_time=now(),
             media=random_media,
+            seiyuu=seiyuu_instance,
         )
         tweet_instance.save()
 
+        UploadTiming.objects.create(tweet=tweet_instance, **timings)
+        self.stdout.write(f"[{seiyuu_instance.id_name}] Upload timings: {timings}")
+
         return True
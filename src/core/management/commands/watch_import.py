@@ -0,0 +1,238 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+from core.models import Seiyuu
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from ._import_handler import MediaImporter, get_import_path
+
+
+# from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+EVENT_HEADER = struct.Struct("iIII")
+
+# names of files that are still being written by common upload tools
+PARTIAL_SUFFIXES = (".part", ".tmp", ".crdownload", ".partial")
+
+
+def is_partial(file_name: str) -> bool:
+    return file_name.startswith(".") or file_name.lower().endswith(PARTIAL_SUFFIXES)
+
+
+class InotifyWatcher(object):
+
+    def __init__(self, folders: dict[str, str]):
+        """
+        Watch the import folders with Linux inotify.
+        folders: {path: key}, events are returned as (key, file name)
+        """
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        self.keys = {}
+        for path, key in folders.items():
+            wd = libc.inotify_add_watch(
+                self.fd, os.fsencode(path), IN_CLOSE_WRITE | IN_MOVED_TO
+            )
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch failed: {path}")
+            self.keys[wd] = key
+        self.overflowed = False
+
+    def wait(self, timeout: float) -> list[tuple[str, str]]:
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+
+        events = []
+        buffer = os.read(self.fd, 64 * 1024)
+        offset = 0
+        while offset < len(buffer):
+            wd, mask, _, name_len = EVENT_HEADER.unpack_from(buffer, offset)
+            offset += EVENT_HEADER.size
+            name = buffer[offset : offset + name_len].rstrip(b"\0")
+            offset += name_len
+            if mask & IN_Q_OVERFLOW:
+                # events were dropped, the caller has to rescan
+                self.overflowed = True
+                continue
+            if wd in self.keys and name:
+                events.append((self.keys[wd], os.fsdecode(name)))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher(object):
+
+    def __init__(self, folders: dict[str, str], interval: float):
+        """
+        Fallback for platforms without inotify, scans the import folders every interval
+        """
+        self.folders = folders
+        self.interval = interval
+        self.seen: dict[tuple[str, str], tuple[int, int]] = {}
+        self.overflowed = False
+
+    def wait(self, timeout: float) -> list[tuple[str, str]]:
+        time.sleep(min(timeout, self.interval))
+
+        events = []
+        current = {}
+        for path, key in self.folders.items():
+            try:
+                entries = list(os.scandir(path))
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+                signature = (stat.st_size, stat.st_mtime_ns)
+                current[(key, entry.name)] = signature
+                if self.seen.get((key, entry.name)) != signature:
+                    events.append((key, entry.name))
+        self.seen = current
+        return events
+
+    def close(self):
+        pass
+
+
+class Command(BaseCommand):
+    help = "Watch the ImportQueue folders and import new files as they arrive"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--debounce",
+            type=float,
+            default=1.0,
+            help="Seconds a file must stay unchanged before it is imported",
+        )
+        parser.add_argument(
+            "--poll",
+            action="store_true",
+            help="Scan the folders periodically instead of using inotify",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=5.0,
+            help="Seconds between scans in polling mode",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Number of hashing processes, default is the number of CPUs",
+        )
+
+    def handle(self, **options):
+        seiyuu_instances = {
+            the_seiyuu_instance.id_name: the_seiyuu_instance
+            for the_seiyuu_instance in Seiyuu.objects.filter(image_folder__isnull=False)
+        }
+        folders = {}
+        for id_name, the_seiyuu_instance in seiyuu_instances.items():
+            import_path = get_import_path(the_seiyuu_instance)
+            os.makedirs(import_path, exist_ok=True)
+            folders[import_path] = id_name
+
+        self.importer = MediaImporter(
+            self.stdout, self.style, workers=options["workers"]
+        )
+        self.seiyuu_instances = seiyuu_instances
+        debounce = options["debounce"]
+
+        watcher = None
+        if not options["poll"]:
+            try:
+                watcher = InotifyWatcher(folders)
+                self.stdout.write(f"Watching {len(folders)} folders with inotify")
+            except (OSError, AttributeError) as e:
+                self.stdout.write(
+                    self.style.WARNING(f"inotify unavailable ({e}), polling instead")
+                )
+        if watcher is None:
+            watcher = PollingWatcher(folders, options["poll_interval"])
+            self.stdout.write(f"Polling {len(folders)} folders")
+
+        # files already waiting in the queue are imported first
+        pending: dict[tuple[str, str], tuple[float, int]] = {}
+        self.rescan(folders, pending)
+
+        try:
+            while True:
+                # sleep until the next event, or until the oldest pending file settles
+                timeout = 60.0
+                if pending:
+                    oldest = min(last_seen for last_seen, _ in pending.values())
+                    timeout = max(oldest + debounce - time.monotonic(), 0.05)
+
+                for key in watcher.wait(timeout):
+                    if not is_partial(key[1]):
+                        pending[key] = (time.monotonic(), -1)
+
+                if watcher.overflowed:
+                    watcher.overflowed = False
+                    self.rescan(folders, pending)
+
+                self.import_settled(pending, debounce)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            watcher.close()
+
+    def rescan(self, folders: dict[str, str], pending: dict):
+        for path, id_name in folders.items():
+            for file_name in os.listdir(path):
+                if not is_partial(file_name):
+                    pending[(id_name, file_name)] = (time.monotonic(), -1)
+
+    def import_settled(self, pending: dict, debounce: float):
+        """
+        Import pending files that have not changed for the debounce time
+        """
+        now = time.monotonic()
+        ready: dict[str, list[str]] = {}
+        for key, (last_seen, last_size) in list(pending.items()):
+            if now - last_seen < debounce:
+                continue
+            id_name, file_name = key
+            file_path = os.path.join(
+                get_import_path(self.seiyuu_instances[id_name]), file_name
+            )
+            try:
+                size = os.path.getsize(file_path)
+            except FileNotFoundError:
+                # moved away or imported already
+                del pending[key]
+                continue
+            if size != last_size:
+                # still growing, check again after another debounce period
+                pending[key] = (now, size)
+                continue
+            del pending[key]
+            ready.setdefault(id_name, []).append(file_name)
+
+        if not ready:
+            return
+
+        close_old_connections()
+        for id_name, file_names in ready.items():
+            try:
+                self.importer.import_seiyuu(self.seiyuu_instances[id_name], file_names)
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f"[{id_name}] Import failed: {e}"))
+        close_old_connections()
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-19 14:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadTiming',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('auth_ms', models.IntegerField(default=0, help_text='Authentication time in ms')),
+                ('init_ms', models.IntegerField(default=0, help_text='Upload INIT time in ms')),
+                ('append_ms', models.IntegerField(default=0, help_text='Upload APPEND time in ms')),
+                ('finalize_ms', models.IntegerField(default=0, help_text='Upload FINALIZE time in ms')),
+                ('processing_ms', models.IntegerField(default=0, help_text='Media processing wait time in ms')),
+                ('create_tweet_ms', models.IntegerField(default=0, help_text='Create tweet time in ms')),
+                ('total_bytes', models.IntegerField(default=0, help_text='Bytes uploaded')),
+                ('chunks', models.SmallIntegerField(default=0, help_text='Number of APPEND chunks')),
+                ('tweet', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='upload_timing', to='core.tweet')),
+            ],
+            options={
+                'db_table': 'core_upload_timing',
+            },
+        ),
+    ]
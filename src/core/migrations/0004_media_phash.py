@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 14:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_media_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='media',
+            name='phash',
+            field=models.BigIntegerField(blank=True, help_text='64-bit perceptual hash (dHash) of the image', null=True),
+        ),
+    ]
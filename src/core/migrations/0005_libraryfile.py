@@ -0,0 +1,26 @@
+# Generated by Django 4.2.30 on 2026-10-19 14:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_media_phash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LibraryFile',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('file_path', models.CharField(help_text='The file path relative to the Library', max_length=1000, unique=True)),
+                ('size', models.BigIntegerField(help_text='File size in bytes')),
+                ('mtime_ns', models.BigIntegerField(help_text='File modification time in ns')),
+                ('content_hash', models.CharField(help_text='SHA-256 of the file content', max_length=64)),
+            ],
+            options={
+                'db_table': 'core_library_file',
+            },
+        ),
+    ]
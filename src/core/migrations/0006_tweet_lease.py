@@ -0,0 +1,27 @@
+# Generated by Django 4.2.30 on 2026-10-19 14:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_libraryfile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tweet',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, help_text='The tweet can be claimed again after this time', null=True),
+        ),
+        migrations.AddField(
+            model_name='tweet',
+            name='lease_token',
+            field=models.CharField(blank=True, help_text='Crawl worker lease holding the tweet', max_length=32, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='tweet',
+            index=models.Index(condition=models.Q(('data_time__isnull', True)), fields=['post_time'], name='core_tweet_no_data_idx'),
+        ),
+    ]
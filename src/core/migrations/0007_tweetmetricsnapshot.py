@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-19 14:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_tweet_lease'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TweetMetricSnapshot',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('age', models.IntegerField(help_text='Seconds between the tweet and the snapshot')),
+                ('like', models.IntegerField(default=0, help_text='Likes')),
+                ('rt', models.IntegerField(default=0, help_text='Retweets')),
+                ('quote', models.IntegerField(default=0, help_text='Quotes')),
+                ('reply', models.IntegerField(default=0, help_text='Replies')),
+                ('seiyuu', models.ForeignKey(db_index=False, help_text='Seiyuu of the tweet media, copied so curves need no join', on_delete=django.db.models.deletion.CASCADE, to='core.seiyuu')),
+                ('tweet', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='core.tweet')),
+            ],
+            options={
+                'db_table': 'core_tweet_metric_snapshot',
+                'indexes': [models.Index(fields=['tweet', 'age'], name='core_snapshot_tweet_age'), models.Index(fields=['seiyuu', 'age'], name='core_snapshot_seiyuu_age')],
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.30 on 2026-10-19 14:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_tweetmetricsnapshot'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='followers',
+            name='seiyuu',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, to='core.seiyuu'),
+        ),
+        migrations.AlterField(
+            model_name='seiyuu',
+            name='id_name',
+            field=models.CharField(blank=True, db_index=True, help_text='Seiyuu short name, example: kaorin', max_length=20, null=True),
+        ),
+        migrations.AlterField(
+            model_name='seiyuu',
+            name='screen_name',
+            field=models.CharField(blank=True, db_index=True, help_text='Bot account screen name, example: kaorin__bot', max_length=20, null=True),
+        ),
+        migrations.AlterField(
+            model_name='tweet',
+            name='media',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, to='core.media'),
+        ),
+        migrations.AddIndex(
+            model_name='followers',
+            index=models.Index(fields=['seiyuu', 'data_time'], name='core_followers_seiyuu_time'),
+        ),
+        migrations.AddIndex(
+            model_name='tweet',
+            index=models.Index(fields=['media', 'post_time'], name='core_tweet_media_post_time'),
+        ),
+        migrations.AddIndex(
+            model_name='tweet',
+            index=models.Index(fields=['post_time'], name='core_tweet_post_time'),
+        ),
+        migrations.AddIndex(
+            model_name='tweet',
+            index=models.Index(condition=models.Q(('lease_token__isnull', False)), fields=['lease_token'], name='core_tweet_lease_idx'),
+        ),
+    ]
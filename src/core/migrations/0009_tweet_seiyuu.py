@@ -0,0 +1,41 @@
+# Generated by Django 4.2.30 on 2026-10-19 15:02
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+def backfill_tweet_seiyuu(apps, schema_editor):
+    Tweet = apps.get_model("core", "Tweet")
+    Media = apps.get_model("core", "Media")
+    # one UPDATE ... SET seiyuu_id = (SELECT ...) instead of a save per tweet
+    Tweet.objects.filter(seiyuu__isnull=True).update(
+        seiyuu_id=Subquery(
+            Media.objects.filter(id=OuterRef("media_id")).values("seiyuu_id")[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tweet',
+            name='seiyuu',
+            field=models.ForeignKey(db_index=False, help_text='Seiyuu of the media, copied so seiyuu queries skip the media join', null=True, on_delete=django.db.models.deletion.PROTECT, to='core.seiyuu'),
+        ),
+        migrations.RunPython(backfill_tweet_seiyuu, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='tweet',
+            name='seiyuu',
+            field=models.ForeignKey(db_index=False, help_text='Seiyuu of the media, copied so seiyuu queries skip the media join', on_delete=django.db.models.deletion.PROTECT, to='core.seiyuu'),
+        ),
+        migrations.AddIndex(
+            model_name='tweet',
+            index=models.Index(fields=['seiyuu', 'post_time'], name='core_tweet_seiyuu_post_time'),
+        ),
+    ]
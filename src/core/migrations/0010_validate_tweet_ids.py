@@ -0,0 +1,50 @@
+# Generated by Django 4.2.30 on 2026-10-19 14:46
+
+from django.db import migrations, models
+
+# ids checked per query, every chunk is a short read so the bot keeps posting
+CHUNK_SIZE = 5000
+
+
+def validate_tweet_ids(apps, schema_editor):
+    """
+    The next migration converts the text ids to integers, stop before it if an id
+    is not a 64-bit integer. Read only, it can be run again after fixing the rows.
+    """
+    Tweet = apps.get_model("core", "Tweet")
+    invalid = []
+    last_id = None
+    while True:
+        tweet_query = Tweet.objects.order_by("id")
+        if last_id is not None:
+            tweet_query = tweet_query.filter(id__gt=last_id)
+        ids = list(tweet_query.values_list("id", flat=True)[:CHUNK_SIZE])
+        if not ids:
+            break
+        invalid.extend(
+            tweet_id
+            for tweet_id in ids
+            if not (tweet_id.isascii() and tweet_id.isdigit())
+            or int(tweet_id) > models.BigIntegerField.MAX_BIGINT
+        )
+        last_id = ids[-1]
+
+    if invalid:
+        raise ValueError(
+            f"{len(invalid)} tweet ids are not 64-bit integers, fix or delete them "
+            f"before migrating: {', '.join(invalid[:20])}"
+        )
+
+
+class Migration(migrations.Migration):
+
+    # each chunk is its own read, nothing is locked for the whole scan
+    atomic = False
+
+    dependencies = [
+        ('core', '0009_tweet_seiyuu'),
+    ]
+
+    operations = [
+        migrations.RunPython(validate_tweet_ids, migrations.RunPython.noop),
+    ]
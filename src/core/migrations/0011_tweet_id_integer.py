@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-19 14:47
+
+import core.models
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_validate_tweet_ids'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='tweet',
+            name='id',
+            field=core.models.TweetIdField(help_text='Tweet ID', primary_key=True, serialize=False),
+        ),
+    ]
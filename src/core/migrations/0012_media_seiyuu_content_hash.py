@@ -0,0 +1,35 @@
+# Generated by Django 4.2.30 on 2026-10-19 15:06
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def clear_duplicate_hashes(apps, schema_editor):
+    Media = apps.get_model("core", "Media")
+    # the oldest Media of a duplicated content keeps its hash, the copies are left
+    # unhashed so they can still be found and removed
+    duplicates = (
+        Media.objects.filter(content_hash__isnull=False)
+        .values("seiyuu_id", "content_hash")
+        .annotate(count=Count("id"), first_id=Min("id"))
+        .filter(count__gt=1)
+    )
+    for duplicate in duplicates:
+        Media.objects.filter(
+            seiyuu_id=duplicate["seiyuu_id"], content_hash=duplicate["content_hash"]
+        ).exclude(id=duplicate["first_id"]).update(content_hash=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_tweet_id_integer'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_duplicate_hashes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='media',
+            constraint=models.UniqueConstraint(fields=('seiyuu', 'content_hash'), name='core_media_seiyuu_content_hash'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 15:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_media_seiyuu_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='media',
+            name='missing',
+            field=models.BooleanField(default=False, help_text='The file is missing from the Library, the media is not posted'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_media_missing'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='tweetmetricsnapshot',
+            name='reply',
+            field=models.IntegerField(blank=True, help_text="Replies, null if the crawler didn't send them", null=True),
+        ),
+    ]
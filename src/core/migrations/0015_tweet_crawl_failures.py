@@ -0,0 +1,26 @@
+# Generated by Django 4.2.30 on 2026-10-19 15:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_snapshot_reply_nullable'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='tweet',
+            name='core_tweet_no_data_idx',
+        ),
+        migrations.AddField(
+            model_name='tweet',
+            name='crawl_failures',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Times the tweet was deleted, protected or had no credentials when crawled'),
+        ),
+        migrations.AddIndex(
+            model_name='tweet',
+            index=models.Index(condition=models.Q(('crawl_failures__lt', 3), ('data_time__isnull', True)), fields=['post_time'], name='core_tweet_no_data_idx'),
+        ),
+    ]
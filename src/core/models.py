@@ -15,12 +15,14 @@ class Seiyuu(models.Model):
         max_length=20,
         blank=True,
         null=True,
+        db_index=True,
     )
     id_name = models.CharField(
         help_text="Seiyuu short name, example: kaorin",
         max_length=20,
         blank=True,
         null=True,
+        db_index=True,
     )
     activated = models.BooleanField(help_text="If the bot is activated", default=True)
     interval = models.IntegerField(
@@ -41,6 +43,12 @@ class Seiyuu(models.Model):
 class Media(models.Model):
     class Meta:
         db_table = "core_media"
+        constraints = [
+            # the same file may be imported for two seiyuu, but only once for each
+            models.UniqueConstraint(
+                fields=["seiyuu", "content_hash"], name="core_media_seiyuu_content_hash"
+            ),
+        ]
 
     id = models.BigAutoField(primary_key=True)
     file_path = models.CharField(
@@ -59,18 +67,84 @@ class Media(models.Model):
     )
 
     weight = models.FloatField(help_text="Weight for random choice", default=1.0)
+    missing = models.BooleanField(
+        help_text="The file is missing from the Library, the media is not posted",
+        default=False,
+    )
+
+    content_hash = models.CharField(
+        help_text="SHA-256 of the file content",
+        max_length=64,
+        blank=True,
+        null=True,
+        db_index=True,
+    )
+    phash = models.BigIntegerField(
+        help_text="64-bit perceptual hash (dHash) of the image",
+        blank=True,
+        null=True,
+    )
 
     seiyuu = models.ForeignKey(Seiyuu, on_delete=models.PROTECT)
 
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get("update_fields")
+        if not adding and (update_fields is None or "seiyuu" in update_fields):
+            # keep the copy on the tweets in sync when the media is moved to another seiyuu
+            self.tweet_set.exclude(seiyuu_id=self.seiyuu_id).update(
+                seiyuu_id=self.seiyuu_id
+            )
+
     def __str__(self):
         return f"{self.seiyuu.name}-{self.id}"
 
 
+class TweetIdField(models.BigIntegerField):
+    """
+    64-bit tweet id. The SQLite column is declared "integer" so the primary key is
+    the rowid itself, a "bigint" primary key gets a separate index.
+    """
+
+    def db_type(self, connection):
+        if connection.vendor == "sqlite":
+            return "integer"
+        return super().db_type(connection)
+
+
+# a tweet the crawler failed to get data of this many times is no longer due,
+# it is part of the partial index condition so changing it needs a migration
+MAX_CRAWL_FAILURES = 3
+
+
 class Tweet(models.Model):
     class Meta:
         db_table = "core_tweet"
+        indexes = [
+            # the crawl queue only looks at tweets without data
+            models.Index(
+                fields=["post_time"],
+                name="core_tweet_no_data_idx",
+                condition=models.Q(
+                    data_time__isnull=True, crawl_failures__lt=MAX_CRAWL_FAILURES
+                ),
+            ),
+            # stats of a seiyuu in a time range, also covers the seiyuu FK lookups
+            models.Index(fields=["seiyuu", "post_time"], name="core_tweet_seiyuu_post_time"),
+            # tweets of an image, also covers the media FK lookups
+            models.Index(fields=["media", "post_time"], name="core_tweet_media_post_time"),
+            # time range reports across all seiyuu
+            models.Index(fields=["post_time"], name="core_tweet_post_time"),
+            # submit and release of a crawl lease, only leased tweets are indexed
+            models.Index(
+                fields=["lease_token"],
+                name="core_tweet_lease_idx",
+                condition=models.Q(lease_token__isnull=False),
+            ),
+        ]
 
-    id = models.CharField(help_text="Tweet ID", primary_key=True, max_length=50)
+    id = TweetIdField(help_text="Tweet ID", primary_key=True)
     post_time = models.DateTimeField(help_text="Tweet time", blank=True, null=True)
     data_time = models.DateTimeField(
         help_text="Data collected time", blank=True, null=True
@@ -84,18 +158,46 @@ class Tweet(models.Model):
         help_text="number of quotes", blank=True, null=True
     )
 
-    media = models.ForeignKey(Media, on_delete=models.PROTECT)
+    lease_token = models.CharField(
+        help_text="Crawl worker lease holding the tweet", max_length=32, blank=True, null=True
+    )
+    lease_expires_at = models.DateTimeField(
+        help_text="The tweet can be claimed again after this time", blank=True, null=True
+    )
+    crawl_failures = models.PositiveSmallIntegerField(
+        help_text="Times the tweet was deleted, protected or had no credentials when crawled",
+        default=0,
+    )
+
+    media = models.ForeignKey(Media, on_delete=models.PROTECT, db_index=False)
+    seiyuu = models.ForeignKey(
+        Seiyuu,
+        help_text="Seiyuu of the media, copied so seiyuu queries skip the media join",
+        on_delete=models.PROTECT,
+        db_index=False,
+    )
+
+    def save(self, *args, **kwargs):
+        if self.seiyuu_id is None:
+            self.seiyuu_id = self.media.seiyuu_id
+        super().save(*args, **kwargs)
 
     def __str__(self):
-        return f"[{self.media.seiyuu.name}]-{self.post_time}-{self.id}"
+        return f"[{self.seiyuu.name}]-{self.post_time}-{self.id}"
 
 
 class Followers(models.Model):
     class Meta:
         db_table = "core_followers"
+        indexes = [
+            # follower history of a seiyuu, also covers the seiyuu FK lookups
+            models.Index(fields=["seiyuu", "data_time"], name="core_followers_seiyuu_time"),
+        ]
 
     id = models.AutoField(primary_key=True)
-    seiyuu = models.ForeignKey(Seiyuu, on_delete=models.PROTECT, blank=True, null=True)
+    seiyuu = models.ForeignKey(
+        Seiyuu, on_delete=models.PROTECT, blank=True, null=True, db_index=False
+    )
     data_time = models.DateTimeField(
         help_text="Data collected time", blank=True, null=True
     )
@@ -105,3 +207,84 @@ class Followers(models.Model):
 
     def __str__(self):
         return f"[{self.seiyuu.name} Followers]-{self.data_time}-{self.followers}"
+
+
+class TweetMetricSnapshot(models.Model):
+    class Meta:
+        db_table = "core_tweet_metric_snapshot"
+        indexes = [
+            # consecutive snapshots of a tweet are adjacent, for deltas
+            models.Index(fields=["tweet", "age"], name="core_snapshot_tweet_age"),
+            # engagement curves per seiyuu
+            models.Index(fields=["seiyuu", "age"], name="core_snapshot_seiyuu_age"),
+        ]
+
+    id = models.BigAutoField(primary_key=True)
+    tweet = models.ForeignKey(
+        Tweet, on_delete=models.CASCADE, related_name="snapshots", db_index=False
+    )
+    seiyuu = models.ForeignKey(
+        Seiyuu,
+        on_delete=models.CASCADE,
+        help_text="Seiyuu of the tweet media, copied so curves need no join",
+        db_index=False,
+    )
+    age = models.IntegerField(help_text="Seconds between the tweet and the snapshot")
+    like = models.IntegerField(help_text="Likes", default=0)
+    rt = models.IntegerField(help_text="Retweets", default=0)
+    quote = models.IntegerField(help_text="Quotes", default=0)
+    reply = models.IntegerField(
+        help_text="Replies, null if the crawler didn't send them", blank=True, null=True
+    )
+
+    def __str__(self):
+        return f"[Tweet Metric Snapshot]-{self.tweet_id}-{self.age}s"
+
+
+class UploadTiming(models.Model):
+    class Meta:
+        db_table = "core_upload_timing"
+
+    id = models.AutoField(primary_key=True)
+    tweet = models.OneToOneField(
+        Tweet, on_delete=models.CASCADE, related_name="upload_timing"
+    )
+    auth_ms = models.IntegerField(help_text="Authentication time in ms", default=0)
+    init_ms = models.IntegerField(help_text="Upload INIT time in ms", default=0)
+    append_ms = models.IntegerField(help_text="Upload APPEND time in ms", default=0)
+    finalize_ms = models.IntegerField(
+        help_text="Upload FINALIZE time in ms", default=0
+    )
+    processing_ms = models.IntegerField(
+        help_text="Media processing wait time in ms", default=0
+    )
+    create_tweet_ms = models.IntegerField(
+        help_text="Create tweet time in ms", default=0
+    )
+    total_bytes = models.IntegerField(help_text="Bytes uploaded", default=0)
+    chunks = models.SmallIntegerField(help_text="Number of APPEND chunks", default=0)
+
+    PHASES = ["auth", "init", "append", "finalize", "processing", "create_tweet"]
+
+    def __str__(self):
+        return f"[Upload Timing]-{self.tweet_id}"
+
+
+class LibraryFile(models.Model):
+    class Meta:
+        db_table = "core_library_file"
+
+    id = models.BigAutoField(primary_key=True)
+    file_path = models.CharField(
+        help_text="The file path relative to the Library",
+        max_length=1000,
+        unique=True,
+    )
+    size = models.BigIntegerField(help_text="File size in bytes")
+    mtime_ns = models.BigIntegerField(help_text="File modification time in ns")
+    content_hash = models.CharField(
+        help_text="SHA-256 of the file content", max_length=64
+    )
+
+    def __str__(self):
+        return f"[Library File]-{self.file_path}"
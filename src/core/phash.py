@@ -0,0 +1,91 @@
+from PIL import Image, UnidentifiedImageError
+
+
+HASH_BITS = 64
+HASH_MASK = (1 << HASH_BITS) - 1
+
+
+def dhash(file_path: str) -> int | None:
+    """
+    64-bit difference hash of an image (first frame for GIF), stored as a signed
+    integer so it fits a BigIntegerField. Return None for files Pillow can't read.
+    """
+    try:
+        with Image.open(file_path) as image:
+            # 9x8 grayscale, each bit compares a pixel with its right neighbour
+            small = image.convert("L").resize((9, 8), Image.Resampling.LANCZOS)
+            pixels = list(small.getdata())
+    except (UnidentifiedImageError, OSError):
+        return None
+
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (left < right)
+
+    return to_signed(value)
+
+
+def to_signed(value: int) -> int:
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+def hamming(a: int, b: int) -> int:
+    return ((a ^ b) & HASH_MASK).bit_count()
+
+
+class BKTree(object):
+
+    def __init__(self):
+        """
+        Burkhard-Keller tree over hamming distance.
+        Each node is [hash, items, children], children are keyed by their
+        distance to the node, so a search only visits subtrees whose distance
+        band can contain a match.
+        """
+        self.root = None
+        self.size = 0
+
+    def add(self, value: int, item):
+        self.size += 1
+        if self.root is None:
+            self.root = [value, [item], {}]
+            return
+
+        node = self.root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                return
+            node = child
+
+    def search(self, value: int, max_distance: int) -> list[tuple[int, object]]:
+        """
+        All (distance, item) within max_distance of value, closest first
+        """
+        if self.root is None:
+            return []
+
+        found = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= max_distance:
+                found.extend((distance, item) for item in node[1])
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+
+        found.sort(key=lambda match: match[0])
+        return found
+
+    def __len__(self):
+        return self.size
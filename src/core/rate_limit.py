@@ -0,0 +1,287 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable
+
+from django.conf import settings
+
+if TYPE_CHECKING:
+    from requests import Response
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitExceeded(Exception):
+    """
+    Raised when a request can not be sent within the allowed waiting time
+    """
+
+    def __init__(self, account: str, endpoint: str, wait: float):
+        self.account = account
+        self.endpoint = endpoint
+        self.wait = wait
+        super().__init__(
+            f"[{account}] Rate limit of {endpoint} exhausted, reset in {wait:.0f}s"
+        )
+
+
+# pseudo endpoint of the 24 hour user limit, it is shared by all endpoints of an account
+USER_24HOUR = "user_24hour"
+USER_24HOUR_WINDOW = 24 * 60 * 60
+
+
+class TokenBucket(object):
+
+    def __init__(self, limit: int, window: float):
+        """
+        Budget of one endpoint for one account, a fixed window like the one of the API.
+        The remaining count is spent until reset, then the full limit is available again.
+        The x-rate-limit-* headers of every response correct both.
+        """
+        self.limit = limit
+        self.window = window
+        self.tokens = float(limit)
+        self.reset = time.time() + window
+        self.updated = time.time()
+
+    def refill(self, now: float):
+        if now >= self.reset:
+            # the server side window is over, the full budget is available again
+            self.tokens = float(self.limit)
+            while self.reset <= now:
+                self.reset += self.window
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """
+        Seconds to wait until one token is available
+        """
+        self.refill(now)
+        if self.tokens >= 1:
+            return 0
+        return max(self.reset - now, 0)
+
+    def update_from_headers(self, limit: int, remaining: int, reset: float):
+        now = time.time()
+        self.limit = max(limit, 1)
+        self.tokens = float(remaining)
+        if reset > now:
+            self.reset = reset
+        self.updated = now
+
+    def to_dict(self) -> dict:
+        return {
+            "limit": self.limit,
+            "remaining": int(self.tokens),
+            "reset": self.reset,
+            "window": self.window,
+            "updated": self.updated,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "TokenBucket":
+        bucket = cls(data["limit"], data["window"])
+        bucket.tokens = float(data["remaining"])
+        bucket.reset = data["reset"]
+        bucket.updated = data["updated"]
+        return bucket
+
+
+def parse_rate_limit_headers(
+    response: "Response",
+) -> dict[str, tuple[int, int, float]]:
+    """
+    Get {"endpoint": (limit, remaining, reset), USER_24HOUR: (...)} from the response
+    headers, a limit is missing if the response doesn't report it
+    """
+    found = {}
+    for key, prefix in (
+        ("endpoint", "x-rate-limit"),
+        (USER_24HOUR, "x-user-limit-24hour"),
+    ):
+        try:
+            found[key] = (
+                int(response.headers[f"{prefix}-limit"]),
+                int(response.headers[f"{prefix}-remaining"]),
+                float(response.headers[f"{prefix}-reset"]),
+            )
+        except (KeyError, ValueError):
+            continue
+    return found
+
+
+class RateLimitBudgeter(object):
+
+    def __init__(self, state_file: Path | str | None = None):
+        """
+        Per account, per endpoint token buckets for the Twitter API.
+        The state is saved to state_file so the budget is shared between cron runs.
+        """
+        config = settings.TWITTER_RATE_LIMIT
+        self.state_file = state_file
+        self.default_limit = config["DEFAULT_LIMIT"]
+        self.default_window = config["DEFAULT_WINDOW"]
+        self.max_retries = config["MAX_RETRIES"]
+        self.backoff_base = config["BACKOFF_BASE"]
+        self.backoff_max = config["BACKOFF_MAX"]
+        self.max_wait = config["MAX_WAIT"]
+        self.buckets: dict[str, dict[str, TokenBucket]] = {}
+        self.lock = threading.Lock()
+        self.load_state()
+
+    def get_bucket(self, account: str, endpoint: str) -> TokenBucket:
+        account_buckets = self.buckets.setdefault(account, {})
+        if endpoint not in account_buckets:
+            account_buckets[endpoint] = TokenBucket(
+                self.default_limit, self.default_window
+            )
+        return account_buckets[endpoint]
+
+    def acquire(self, account: str, endpoint: str):
+        """
+        Block until a request to the endpoint fits in the budget, then spend one token.
+        Once the 24 hour user limit of the account is known it has to fit as well.
+        """
+        while True:
+            with self.lock:
+                buckets = [self.get_bucket(account, endpoint)]
+                user_bucket = self.buckets.get(account, {}).get(USER_24HOUR)
+                if user_bucket is not None:
+                    buckets.append(user_bucket)
+                now = time.time()
+                wait = max(bucket.wait_time(now) for bucket in buckets)
+                if wait <= 0:
+                    for bucket in buckets:
+                        bucket.tokens -= 1
+                    return
+            if wait > self.max_wait:
+                raise RateLimitExceeded(account, endpoint, wait)
+            time.sleep(wait)
+
+    def update(self, account: str, endpoint: str, response: "Response"):
+        rate_limits = parse_rate_limit_headers(response)
+        if not rate_limits:
+            return
+        with self.lock:
+            if "endpoint" in rate_limits:
+                self.get_bucket(account, endpoint).update_from_headers(
+                    *rate_limits["endpoint"]
+                )
+            if USER_24HOUR in rate_limits:
+                account_buckets = self.buckets.setdefault(account, {})
+                if USER_24HOUR not in account_buckets:
+                    account_buckets[USER_24HOUR] = TokenBucket(
+                        rate_limits[USER_24HOUR][0], USER_24HOUR_WINDOW
+                    )
+                account_buckets[USER_24HOUR].update_from_headers(
+                    *rate_limits[USER_24HOUR]
+                )
+            self.save_state()
+
+    def backoff(self, attempt: int) -> float:
+        """
+        Exponential backoff with full jitter
+        """
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+    def request(
+        self, account: str, endpoint: str, send: Callable[[], "Response"]
+    ) -> "Response":
+        """
+        Send a request within the budget of account/endpoint.
+        429 and 5xx responses are retried with backoff, other responses are
+        returned to the caller as is.
+        """
+        for attempt in range(self.max_retries + 1):
+            self.acquire(account, endpoint)
+            response = send()
+            self.update(account, endpoint, response)
+
+            if response.status_code != 429 and response.status_code < 500:
+                return response
+
+            if attempt == self.max_retries:
+                break
+
+            wait = self.backoff(attempt)
+            if response.status_code == 429:
+                # the exhausted limit is the one with nothing remaining
+                rate_limits = parse_rate_limit_headers(response)
+                exhausted = [
+                    reset
+                    for _, remaining, reset in rate_limits.values()
+                    if remaining <= 0
+                ]
+                if exhausted:
+                    reset_wait = max(exhausted) - time.time()
+                    if reset_wait > self.max_wait:
+                        raise RateLimitExceeded(account, endpoint, reset_wait)
+                    wait = max(wait, reset_wait)
+
+            logger.warning(
+                f"[{account}] {endpoint} returned {response.status_code}, retry in {wait:.1f}s"
+            )
+            time.sleep(wait)
+
+        return response
+
+    def state(self) -> dict:
+        """
+        Current budget of all accounts and endpoints
+        """
+        now = time.time()
+        with self.lock:
+            for account_buckets in self.buckets.values():
+                for bucket in account_buckets.values():
+                    bucket.refill(now)
+            return {
+                account: {
+                    endpoint: bucket.to_dict()
+                    for endpoint, bucket in account_buckets.items()
+                }
+                for account, account_buckets in self.buckets.items()
+            }
+
+    def load_state(self):
+        if not self.state_file or not os.path.exists(self.state_file):
+            return
+        try:
+            with open(self.state_file, "r", encoding="UTF-8") as f:
+                data = json.load(f)
+            self.buckets = {
+                account: {
+                    endpoint: TokenBucket.from_dict(bucket)
+                    for endpoint, bucket in account_buckets.items()
+                }
+                for account, account_buckets in data.items()
+            }
+        except (ValueError, KeyError, TypeError):
+            # corrupted state file, start with a fresh budget
+            self.buckets = {}
+
+    def save_state(self):
+        if not self.state_file:
+            return
+        tmp_file = f"{self.state_file}.tmp"
+        with open(tmp_file, "w", encoding="UTF-8") as f:
+            json.dump(
+                {
+                    account: {
+                        endpoint: bucket.to_dict()
+                        for endpoint, bucket in account_buckets.items()
+                    }
+                    for account, account_buckets in self.buckets.items()
+                },
+                f,
+            )
+        os.replace(tmp_file, self.state_file)
+
+
+@lru_cache(maxsize=None)
+def get_budgeter() -> RateLimitBudgeter:
+    return RateLimitBudgeter(settings.TWITTER_RATE_LIMIT["STATE_FILE"])
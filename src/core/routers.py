@@ -0,0 +1,52 @@
+import os
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+
+# alias of the read-only connection, see DATABASES in settings
+ANALYTICS_DB = "analytics"
+
+use_analytics_db = ContextVar("use_analytics_db", default=False)
+
+
+class AnalyticsRouter:
+    """
+    Reads inside an analytics_reads view go to the read-only alias, everything
+    else (and every write) stays on default. Until refresh_analytics_replica has
+    created the replica of ANALYTICS_DB_PATH, they stay on default too.
+    """
+
+    def db_for_read(self, model, **hints):
+        if use_analytics_db.get() and (
+            not settings.ANALYTICS_DB_PATH or os.path.exists(settings.ANALYTICS_DB_PATH)
+        ):
+            return ANALYTICS_DB
+        return None
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # both aliases hold the same tables
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != ANALYTICS_DB
+
+
+def analytics_reads(view_func):
+    """
+    Route the reads of the view to the analytics connection. Put it under
+    @api_view, authentication and throttling keep using default.
+    """
+
+    @wraps(view_func)
+    def wrapper(*args, **kwargs):
+        token = use_analytics_db.set(True)
+        try:
+            return view_func(*args, **kwargs)
+        finally:
+            use_analytics_db.reset(token)
+
+    return wrapper
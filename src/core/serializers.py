@@ -1,6 +1,27 @@
 from .models import Seiyuu, Media, Followers, Tweet
+from .thumbnails import get_thumbnail_name
+from .utils import parse_tweet_id
 from rest_framework import serializers
+from django.conf import settings
 from django.db.models import Sum
+from django.urls import reverse
+
+
+class TweetIdStringField(serializers.CharField):
+    """
+    Tweet ids are 64-bit integers, they are sent as strings so JS clients keep every digit
+    """
+
+    default_error_messages = {"invalid": "Tweet id must be a 64-bit integer."}
+
+    def to_internal_value(self, data):
+        value = super().to_internal_value(data)
+        if parse_tweet_id(value) is None:
+            self.fail("invalid")
+        return value
+
+    def to_representation(self, value):
+        return str(value)
 
 
 class SeiyuuSerializer(serializers.ModelSerializer):
@@ -8,10 +29,10 @@ class SeiyuuSerializer(serializers.ModelSerializer):
     last_post = serializers.SerializerMethodField()
 
     def get_last_post(self, obj):
-        if not Tweet.objects.filter(media__seiyuu=obj).exists():
+        if not Tweet.objects.filter(seiyuu=obj).exists():
             return "No data"
         return (
-            Tweet.objects.filter(media__seiyuu=obj)
+            Tweet.objects.filter(seiyuu=obj)
             .latest("post_time")
             .post_time.isoformat()
         )
@@ -46,11 +67,29 @@ class MediaSerializer(serializers.ModelSerializer):
     posts = serializers.IntegerField(read_only=True)
     likes = serializers.IntegerField(read_only=True)
     rts = serializers.IntegerField(read_only=True)
+    thumbnails = serializers.SerializerMethodField(read_only=True)
+
+    def get_thumbnails(self, obj) -> dict[str, str]:
+        """
+        {size: url}, content addressed urls if the file hash is known
+        """
+        if obj.content_hash:
+            return {
+                str(size): reverse(
+                    "serve_thumbnail",
+                    args=[get_thumbnail_name(obj.content_hash, size)],
+                )
+                for size in settings.THUMBNAIL_SIZES
+            }
+        return {
+            str(size): reverse("get_image_thumbnail", args=[obj.pk, size])
+            for size in settings.THUMBNAIL_SIZES
+        }
 
     def get_total_weight(self, obj) -> int:
-        return Media.objects.filter(seiyuu=obj.seiyuu).aggregate(Sum("weight"))[
-            "weight__sum"
-        ]
+        return Media.objects.filter(seiyuu=obj.seiyuu, missing=False).aggregate(
+            Sum("weight")
+        )["weight__sum"]
 
     class Meta:
         model = Media
@@ -66,6 +105,7 @@ class MediaSerializer(serializers.ModelSerializer):
             "posts",
             "likes",
             "rts",
+            "thumbnails",
         ]
         read_only_fields = [
             "id",
@@ -78,6 +118,7 @@ class MediaSerializer(serializers.ModelSerializer):
             "posts",
             "likes",
             "rts",
+            "thumbnails",
         ]
 
 
@@ -87,18 +128,73 @@ class StatsQuerySerializer(serializers.Serializer):
     seiyuu = serializers.PrimaryKeyRelatedField(queryset=Seiyuu.objects.all())
 
 
+class DateRangeQuerySerializer(serializers.Serializer):
+    start_date = serializers.DateTimeField(required=False)
+    end_date = serializers.DateTimeField(required=False)
+
+
+class EngagementCurveQuerySerializer(DateRangeQuerySerializer):
+    seiyuu = serializers.PrimaryKeyRelatedField(queryset=Seiyuu.objects.all())
+    bucket = serializers.IntegerField(
+        required=False, min_value=60, default=3600, help_text="Bucket size in seconds"
+    )
+    max_age = serializers.IntegerField(
+        required=False,
+        min_value=60,
+        default=7 * 86400,
+        help_text="Oldest snapshot age in seconds",
+    )
+
+
+class TweetMetricsSerializer(serializers.Serializer):
+    id = TweetIdStringField()
+    like = serializers.IntegerField(min_value=0)
+    rt = serializers.IntegerField(min_value=0)
+    quote = serializers.IntegerField(min_value=0)
+    reply = serializers.IntegerField(min_value=0, required=False)
+
+
+class TweetClaimSerializer(serializers.Serializer):
+    limit = serializers.IntegerField(min_value=1, max_value=1000, default=100)
+    lease_seconds = serializers.IntegerField(
+        min_value=10, max_value=86400, default=settings.TWEET_LEASE_SECONDS
+    )
+
+
+class TweetSubmitSerializer(serializers.Serializer):
+    lease_token = serializers.CharField(max_length=32)
+    # items are validated one by one, an invalid item doesn't fail the batch
+    tweets = serializers.ListField(child=serializers.JSONField(), max_length=1000)
+
+
+class TweetReleaseSerializer(serializers.Serializer):
+    lease_token = serializers.CharField(max_length=32)
+    ids = serializers.ListField(
+        child=TweetIdStringField(), required=False, max_length=1000
+    )
+
+
+class FollowersSampleSerializer(serializers.Serializer):
+    seiyuu = serializers.CharField(max_length=20, help_text="Seiyuu screen_name")
+    followers = serializers.IntegerField(min_value=0)
+    data_time = serializers.DateTimeField(
+        required=False, help_text="Collected time, default is the time of the request"
+    )
+
+
 class TweetSerializer(serializers.ModelSerializer):
 
+    id = TweetIdStringField(read_only=True)
     followers = serializers.SerializerMethodField()
 
     def get_followers(self, obj) -> int | str:
         if not Followers.objects.filter(
-            data_time__lte=obj.post_time, seiyuu=obj.media.seiyuu
+            data_time__lte=obj.post_time, seiyuu_id=obj.seiyuu_id
         ).exists():
             return "No data"
         return (
             Followers.objects.filter(
-                data_time__lte=obj.post_time, seiyuu=obj.media.seiyuu
+                data_time__lte=obj.post_time, seiyuu_id=obj.seiyuu_id
             )
             .latest("data_time")
             .followers
@@ -1,3 +1,780 @@
-from django.test import TestCase
+import hashlib
+import os
+import re
+import tempfile
+import time
+from datetime import timedelta
+from io import BytesIO, StringIO
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.color import no_style
+from django.db import connection
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from .file_serving import parse_range, serve_file
+from .management.commands._import_handler import MediaImporter, get_import_path
+from .management.commands._lookup_handler import TwitterLookupError
+from .models import Followers, Media, Seiyuu, Tweet, TweetMetricSnapshot, UploadTiming
+from .rate_limit import (
+    USER_24HOUR,
+    RateLimitBudgeter,
+    RateLimitExceeded,
+    TokenBucket,
+    parse_rate_limit_headers,
+)
+from .routers import ANALYTICS_DB, AnalyticsRouter, analytics_reads
+from .serializers import SeiyuuSerializer, TweetReleaseSerializer, TweetSerializer
+from .thumbnails import evict_thumbnails, scan_thumbnail_cache
+from .utils import (
+    claim_due_tweets,
+    get_engagement_curve_from_query_options,
+    get_followers_from_query_options,
+    get_stats_from_query_options,
+    get_upload_timing_percentiles,
+    parse_tweet_id,
+    release_leased_tweets,
+    screen_name_cache,
+    update_tweet_metrics_bulk,
+)
+
+# "SCAN core_tweet" is a full table scan, "SCAN ... USING INDEX" walks an index
+FULL_SCAN_RE = re.compile(r"\bSCAN (\w+)\s*$")
+
+
+class QueryPlanTest(TestCase):
+    """
+    The queries of the hot paths should search an index instead of scanning a table
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        cls.seiyuu = Seiyuu.objects.create(
+            name="前田佳織里", screen_name="kaorin__bot", id_name="kaorin"
+        )
+        media = Media.objects.create(file_path="kaorin/1.jpg", seiyuu=cls.seiyuu)
+        for i in range(10):
+            tweet = Tweet.objects.create(
+                id=str(1700000000000000000 + i),
+                post_time=now - timedelta(days=i),
+                data_time=now if i % 2 else None,
+                like=i,
+                rt=i,
+                media=media,
+            )
+            TweetMetricSnapshot.objects.create(
+                tweet=tweet, seiyuu=cls.seiyuu, age=3600, like=i, rt=i, quote=0
+            )
+            UploadTiming.objects.create(tweet=tweet)
+            Followers.objects.create(
+                seiyuu=cls.seiyuu, data_time=now - timedelta(days=i), followers=1000 + i
+            )
+        cls.start_date = now - timedelta(days=30)
+        cls.end_date = now
+
+    def assert_no_full_scan(self, queries):
+        self.assertTrue(queries, "No query was captured")
+        for query in queries:
+            sql = query["sql"]
+            if not sql.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+                plan = [row[-1] for row in cursor.fetchall()]
+            for line in plan:
+                match = FULL_SCAN_RE.search(line)
+                if match:
+                    self.fail(f"Full scan of {match.group(1)}:\n{sql}\n" + "\n".join(plan))
+
+    def test_stats(self):
+        with CaptureQueriesContext(connection) as context:
+            get_stats_from_query_options(self.seiyuu, self.start_date, self.end_date)
+        self.assert_no_full_scan(context.captured_queries)
+
+    def test_followers(self):
+        with CaptureQueriesContext(connection) as context:
+            get_followers_from_query_options(self.seiyuu, self.start_date, self.end_date)
+        self.assert_no_full_scan(context.captured_queries)
+
+    def test_engagement_curve(self):
+        with CaptureQueriesContext(connection) as context:
+            get_engagement_curve_from_query_options(
+                self.seiyuu, 3600, 86400, self.start_date, self.end_date
+            )
+        self.assert_no_full_scan(context.captured_queries)
+
+    def test_upload_timing(self):
+        with CaptureQueriesContext(connection) as context:
+            get_upload_timing_percentiles(self.start_date, self.end_date)
+        self.assert_no_full_scan(context.captured_queries)
+
+    def test_crawl_queue(self):
+        with CaptureQueriesContext(connection) as context:
+            lease_token, _, _ = claim_due_tweets(5, 600)
+            release_leased_tweets(lease_token)
+        self.assert_no_full_scan(context.captured_queries)
+
+    def test_serializers(self):
+        tweet = Tweet.objects.first()
+        with CaptureQueriesContext(connection) as context:
+            SeiyuuSerializer(self.seiyuu).data
+            TweetSerializer(tweet).data
+        self.assert_no_full_scan(context.captured_queries)
+
+    def test_seiyuu_lookups(self):
+        with CaptureQueriesContext(connection) as context:
+            Seiyuu.objects.get(screen_name="kaorin__bot")
+            Seiyuu.objects.get(id_name="kaorin")
+        self.assert_no_full_scan(context.captured_queries)
+
+    def test_image_tweets(self):
+        media = Media.objects.first()
+        with CaptureQueriesContext(connection) as context:
+            list(Tweet.objects.filter(media=media).order_by("-post_time"))
+            Tweet.objects.filter(
+                seiyuu=self.seiyuu, post_time__gt=self.start_date
+            ).exists()
+        self.assert_no_full_scan(context.captured_queries)
+
+    def test_seiyuu_queries_skip_media(self):
+        tweet = Tweet.objects.first()
+        with CaptureQueriesContext(connection) as context:
+            get_stats_from_query_options(self.seiyuu, self.start_date, self.end_date)
+            SeiyuuSerializer(self.seiyuu).data
+            TweetSerializer(tweet).data
+        for query in context.captured_queries:
+            self.assertNotIn("core_media", query["sql"])
+
+
+class TweetSeiyuuTest(TestCase):
+    def test_seiyuu_follows_media(self):
+        seiyuu = Seiyuu.objects.create(name="a", screen_name="a_bot", id_name="a")
+        other = Seiyuu.objects.create(name="b", screen_name="b_bot", id_name="b")
+        media = Media.objects.create(file_path="a/1.jpg", seiyuu=seiyuu)
+        tweet = Tweet.objects.create(id="1", post_time=timezone.now(), media=media)
+        self.assertEqual(tweet.seiyuu_id, seiyuu.id)
+
+        media.seiyuu = other
+        media.save()
+        tweet.refresh_from_db()
+        self.assertEqual(tweet.seiyuu_id, other.id)
+
+
+class TweetIdTest(TestCase):
+    def test_ids_are_strings(self):
+        seiyuu = Seiyuu.objects.create(name="a", screen_name="a_bot", id_name="a")
+        media = Media.objects.create(file_path="a/1.jpg", seiyuu=seiyuu)
+        # over 2^53, a JS number would round it
+        tweet = Tweet.objects.create(
+            id=1790000000000000001, post_time=timezone.now(), media=media
+        )
+        self.assertEqual(TweetSerializer(tweet).data["id"], "1790000000000000001")
+
+    def test_invalid_ids(self):
+        serializer = TweetReleaseSerializer(
+            data={
+                "lease_token": "x",
+                "ids": ["1790000000000000001", "abc", "9" * 20, "²"],
+            }
+        )
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(set(serializer.errors["ids"]), {1, 2, 3})
+        self.assertIsNone(parse_tweet_id("abc"))
+        self.assertIsNone(parse_tweet_id("²"))
+        self.assertEqual(parse_tweet_id("1790000000000000001"), 1790000000000000001)
+
+
+class AnalyticsRouterTest(SimpleTestCase):
+    def test_reads_of_analytics_views(self):
+        router = AnalyticsRouter()
+
+        @analytics_reads
+        def view():
+            return router.db_for_read(Tweet), router.db_for_write(Tweet)
+
+        self.assertEqual(view(), (ANALYTICS_DB, "default"))
+        self.assertIsNone(router.db_for_read(Tweet))
+        self.assertFalse(router.allow_migrate(ANALYTICS_DB, "core"))
+
+        # the replica isn't created yet
+        with override_settings(ANALYTICS_DB_PATH="/nonexistent/analytics.sqlite3"):
+            self.assertEqual(view(), (None, "default"))
+
+
+class ImportDedupTest(TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        settings_override = override_settings(
+            BASE_DIR=tmp_dir.name,
+            MEDIA_ROOT=os.path.join(tmp_dir.name, "Library"),
+            QUARANTINE_ROOT=os.path.join(tmp_dir.name, "Quarantine"),
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.importer = MediaImporter(
+            StringIO(), no_style(), workers=1, make_thumbnails=False
+        )
+
+    def queue(self, seiyuu: Seiyuu, files: dict[str, bytes]):
+        library_path = os.path.join(settings.MEDIA_ROOT, seiyuu.image_folder)
+        os.makedirs(library_path, exist_ok=True)
+        import_path = get_import_path(seiyuu)
+        os.makedirs(import_path, exist_ok=True)
+        for name, content in files.items():
+            with open(os.path.join(import_path, name), "wb") as f:
+                f.write(content)
+
+    def test_same_content_per_seiyuu(self):
+        seiyuu = Seiyuu.objects.create(name="a", id_name="a", image_folder="a")
+        other = Seiyuu.objects.create(name="b", id_name="b", image_folder="b")
+        self.queue(seiyuu, {"1.mp4": b"same", "2.mp4": b"same", "3.mp4": b"other"})
+        self.queue(other, {"1.mp4": b"same"})
+
+        stats = self.importer.import_seiyuu(seiyuu)
+        self.assertEqual((stats["imported"], stats["skipped"]), (2, 1))
+        # the same content is imported again for another seiyuu
+        stats = self.importer.import_seiyuu(other)
+        self.assertEqual((stats["imported"], stats["skipped"]), (1, 0))
+
+        self.queue(seiyuu, {"4.mp4": b"other"})
+        stats = self.importer.import_seiyuu(seiyuu)
+        # 2.mp4 is still in the queue as well
+        self.assertEqual((stats["imported"], stats["skipped"]), (0, 2))
+        self.assertEqual(Media.objects.filter(seiyuu=seiyuu).count(), 2)
+        self.assertEqual(Media.objects.filter(seiyuu=other).count(), 1)
+
+    def test_thumbnail_cache_size_estimate(self):
+        seiyuu = Seiyuu.objects.create(name="a", id_name="a", image_folder="a")
+        importer = MediaImporter(
+            StringIO(), no_style(), workers=1, check_near_duplicates=False
+        )
+        thumbnail_root = os.path.join(settings.BASE_DIR, "Thumbnails")
+        handler = "core.management.commands._import_handler"
+        with override_settings(THUMBNAIL_ROOT=thumbnail_root), mock.patch(
+            f"{handler}.scan_thumbnail_cache", wraps=scan_thumbnail_cache
+        ) as scan, mock.patch(
+            f"{handler}.evict_thumbnails", wraps=evict_thumbnails
+        ) as evict:
+            for i, color in enumerate(["red", "green", "blue"]):
+                image = BytesIO()
+                Image.new("RGB", (64, 64), color).save(image, "PNG")
+                self.queue(seiyuu, {f"{i}.png": image.getvalue()})
+                self.assertEqual(importer.import_seiyuu(seiyuu)["imported"], 1)
+            # measured once, then counted without walking the cache
+            self.assertEqual(scan.call_count, 1)
+            self.assertFalse(evict.called)
+            measured = sum(size for _, size, _ in scan_thumbnail_cache())
+            self.assertEqual(importer.thumbnail_cache_bytes, measured)
+
+            # the next thumbnails pass the limit
+            with override_settings(THUMBNAIL_CACHE_MAX_BYTES=measured):
+                image = BytesIO()
+                Image.new("RGB", (64, 64), "white").save(image, "PNG")
+                self.queue(seiyuu, {"3.png": image.getvalue()})
+                importer.import_seiyuu(seiyuu)
+            self.assertEqual(evict.call_count, 1)
+            self.assertLessEqual(importer.thumbnail_cache_bytes, measured * 0.9)
+
+
+class ImmediateTransactionTest(TransactionTestCase):
+    def test_begin_immediate(self):
+        seiyuu = Seiyuu.objects.create(name="a", screen_name="a_bot", id_name="a")
+        Tweet.objects.create(
+            id=1790000000000000001,
+            post_time=timezone.now() - timedelta(days=10),
+            media=Media.objects.create(file_path="a/1.jpg", seiyuu=seiyuu),
+        )
+        with CaptureQueriesContext(connection) as context:
+            lease_token, _, _ = claim_due_tweets(5, 600)
+            update_tweet_metrics_bulk(
+                [{"id": "1790000000000000001", "like": 5, "rt": 1, "quote": 0}],
+                lease_token=lease_token,
+            )
+        # the claim and the metric write take the write lock up front
+        self.assertEqual(
+            [query["sql"] for query in context.captured_queries].count(
+                "BEGIN IMMEDIATE"
+            ),
+            2,
+        )
+        self.assertEqual(Tweet.objects.get().like, 5)
+
+class ReconcileLibraryTest(TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=tmp_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.seiyuu = Seiyuu.objects.create(name="a", id_name="a", image_folder="a")
+        os.makedirs(os.path.join(tmp_dir.name, "a"))
+
+    def write(self, file_path: str, content: bytes):
+        with open(os.path.join(settings.MEDIA_ROOT, file_path), "wb") as f:
+            f.write(content)
+
+    def test_fix_renamed_and_duplicate_files(self):
+        renamed = Media.objects.create(
+            file_path="a/old.mp4",
+            file_type="video/mp4",
+            seiyuu=self.seiyuu,
+            content_hash=hashlib.sha256(b"video").hexdigest(),
+        )
+        self.write("a/new.mp4", b"video")
+        self.write("a/copy.mp4", b"video")
+        image = BytesIO()
+        Image.new("RGB", (16, 16), "red").save(image, "PNG")
+        self.write("a/1.png", image.getvalue())
+        self.write("a/2.png", image.getvalue())
+
+        call_command("reconcile_library", "--fix", workers=1, stdout=StringIO())
+
+        # one copy takes the place of the renamed file, the other one is a duplicate
+        renamed.refresh_from_db()
+        self.assertIn(renamed.file_path, {"a/new.mp4", "a/copy.mp4"})
+        self.assertFalse(renamed.missing)
+        new_media = Media.objects.exclude(id=renamed.id)
+        self.assertEqual(len(new_media), 1)
+        self.assertIn(new_media[0].file_path, {"a/1.png", "a/2.png"})
+        self.assertIsNotNone(new_media[0].phash)
+
+        # nothing is left to fix
+        stdout = StringIO()
+        call_command("reconcile_library", "--fix", workers=1, stdout=stdout)
+        self.assertIn("Created 0 Media, moved 0 renamed Media", stdout.getvalue())
+        self.assertEqual(Media.objects.count(), 2)
+
+
+@override_settings(MEDIA_SENDFILE_BACKEND="")
+class FileServingTest(SimpleTestCase):
+    def setUp(self):
+        tmp_file = tempfile.NamedTemporaryFile(suffix=".jpg", delete=False)
+        tmp_file.write(bytes(range(100)))
+        tmp_file.close()
+        self.addCleanup(os.remove, tmp_file.name)
+        self.file_path = tmp_file.name
+        self.factory = RequestFactory()
+
+    def test_parse_range(self):
+        self.assertEqual(parse_range("bytes=0-9", 100), (0, 9))
+        self.assertEqual(parse_range("bytes=90-", 100), (90, 99))
+        self.assertEqual(parse_range("bytes=-10", 100), (90, 99))
+        self.assertEqual(parse_range("bytes=50-500", 100), (50, 99))
+        self.assertEqual(parse_range("bytes=-500", 100), (0, 99))
+        self.assertIsNone(parse_range("bytes=0-1,5-6", 100))
+        self.assertIsNone(parse_range("items=0-1", 100))
+        self.assertIsNone(parse_range("bytes=-", 100))
+        self.assertIs(parse_range("bytes=100-", 100), False)
+        self.assertIs(parse_range("bytes=10-5", 100), False)
+        self.assertIs(parse_range("bytes=-0", 100), False)
+
+    def test_range(self):
+        response = serve_file(
+            self.factory.get("/", HTTP_RANGE="bytes=10-19"), self.file_path
+        )
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], "bytes 10-19/100")
+        self.assertEqual(b"".join(response.streaming_content), bytes(range(10, 20)))
+
+    def test_unsatisfiable_range(self):
+        response = serve_file(
+            self.factory.get("/", HTTP_RANGE="bytes=200-"), self.file_path
+        )
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], "bytes */100")
+
+    def test_etag(self):
+        response = serve_file(self.factory.get("/"), self.file_path, etag="abc")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["ETag"], '"abc"')
+        response.close()
+
+        response = serve_file(
+            self.factory.get("/", HTTP_IF_NONE_MATCH='"abc"'),
+            self.file_path,
+            etag="abc",
+        )
+        self.assertEqual(response.status_code, 304)
+        # an outdated If-Range gets the whole file instead of the range
+        response = serve_file(
+            self.factory.get("/", HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"old"'),
+            self.file_path,
+            etag="abc",
+        )
+        self.assertEqual(response.status_code, 200)
+        response.close()
+
+
+class EngagementCurveTest(TestCase):
+    def test_missing_replies(self):
+        seiyuu = Seiyuu.objects.create(name="a", screen_name="a_bot", id_name="a")
+        media = Media.objects.create(file_path="a/1.jpg", seiyuu=seiyuu)
+        post_time = timezone.now() - timedelta(minutes=10)
+        for tweet_id in (1, 2):
+            Tweet.objects.create(id=tweet_id, post_time=post_time, media=media)
+
+        update_tweet_metrics_bulk(
+            [
+                {"id": 1, "like": 10, "rt": 0, "quote": 0, "reply": 4},
+                {"id": 2, "like": 20, "rt": 0, "quote": 0},
+            ]
+        )
+        self.assertIsNone(TweetMetricSnapshot.objects.get(tweet_id=2).reply)
+
+        [bucket] = get_engagement_curve_from_query_options(seiyuu, 3600, 86400)
+        self.assertEqual(bucket["like"], 15)
+        # the snapshot without replies is left out of the average
+        self.assertEqual(bucket["reply"], 4)
+
+
+@override_settings(LOCAL_HOSTS=["testserver"])
+class BatchEndpointTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seiyuu = Seiyuu.objects.create(name="a", screen_name="a_bot", id_name="a")
+        media = Media.objects.create(file_path="a/1.jpg", seiyuu=cls.seiyuu)
+        cls.tweet = Tweet.objects.create(
+            id=1790000000000000001, post_time=timezone.now(), media=media, reply=3
+        )
+
+    def setUp(self):
+        screen_name_cache["loaded_at"] = None
+
+    def test_update_tweet_data_batch(self):
+        response = self.client.post(
+            reverse("update_tweet_data_batch"),
+            [
+                {"id": "1790000000000000001", "like": 10, "rt": 2, "quote": 1},
+                {"id": "1790000000000000002", "like": 1, "rt": 0, "quote": 0},
+                {"id": "abc", "like": 1, "rt": 0, "quote": 0},
+                {"id": "1790000000000000003", "like": -1, "rt": 0, "quote": 0},
+            ],
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["updated"], 1)
+        results = {result["id"]: result for result in response.data["results"]}
+        self.assertEqual(len(results), 4)
+        self.assertTrue(results["1790000000000000001"]["status"])
+        self.assertEqual(results["1790000000000000002"]["message"], "Tweet not found")
+        self.assertFalse(results["abc"]["status"])
+        self.assertFalse(results["1790000000000000003"]["status"])
+
+        self.tweet.refresh_from_db()
+        self.assertEqual((self.tweet.like, self.tweet.rt, self.tweet.quote), (10, 2, 1))
+        # reply was not sent, it is kept
+        self.assertEqual(self.tweet.reply, 3)
+        self.assertIsNotNone(self.tweet.data_time)
+
+    def test_set_followers_batch(self):
+        response = self.client.post(
+            reverse("set_followers_batch"),
+            [
+                {"seiyuu": "a_bot", "followers": 1000},
+                {"seiyuu": "unknown_bot", "followers": 1000},
+                {"seiyuu": "a_bot"},
+            ],
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["created"], 1)
+        # the results are in the order of the samples
+        results = response.data["results"]
+        self.assertEqual(
+            [(result["seiyuu"], result["status"]) for result in results],
+            [("a_bot", True), ("unknown_bot", False), ("a_bot", False)],
+        )
+        self.assertEqual(results[1]["message"], "Seiyuu not found")
+        self.assertEqual(
+            list(Followers.objects.values_list("seiyuu", "followers")),
+            [(self.seiyuu.id, 1000)],
+        )
+
+    def test_batch_limits(self):
+        response = self.client.post(
+            reverse("update_tweet_data_batch"),
+            {"id": "1790000000000000001"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+        with override_settings(LOCAL_HOSTS=["localhost:8000"]):
+            response = self.client.post(
+                reverse("set_followers_batch"), [], content_type="application/json"
+            )
+        self.assertEqual(response.status_code, 403)
+
+
+@override_settings(LOCAL_HOSTS=["testserver"])
+class TweetLeaseTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seiyuu = Seiyuu.objects.create(name="a", screen_name="a_bot", id_name="a")
+        media = Media.objects.create(file_path="a/1.jpg", seiyuu=seiyuu)
+        post_time = timezone.now() - timedelta(days=10)
+        for i in range(3):
+            Tweet.objects.create(
+                id=1790000000000000001 + i,
+                post_time=post_time + timedelta(hours=i),
+                media=media,
+            )
+        # not old enough to be crawled
+        Tweet.objects.create(
+            id=1790000000000000009, post_time=timezone.now(), media=media
+        )
+
+    def post(self, name: str, data: dict):
+        response = self.client.post(
+            reverse(name), data, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_claim_submit_release(self):
+        first = self.post("claim_tweets", {"limit": 2})
+        self.assertEqual(
+            [tweet["id"] for tweet in first["data"]],
+            ["1790000000000000001", "1790000000000000002"],
+        )
+        self.assertEqual(first["data"][0]["media__seiyuu__screen_name"], "a_bot")
+
+        # a second worker only gets the tweets that are not leased
+        second = self.post("claim_tweets", {"limit": 10})
+        self.assertEqual(
+            [tweet["id"] for tweet in second["data"]], ["1790000000000000003"]
+        )
+
+        submitted = self.post(
+            "submit_tweets",
+            {
+                "lease_token": first["lease_token"],
+                "tweets": [
+                    {"id": "1790000000000000001", "like": 5, "rt": 1, "quote": 0},
+                    # leased to the second worker
+                    {"id": "1790000000000000003", "like": 5, "rt": 1, "quote": 0},
+                ],
+            },
+        )
+        self.assertEqual(submitted["updated"], 1)
+        results = {result["id"]: result for result in submitted["results"]}
+        self.assertEqual(
+            results["1790000000000000003"]["message"], "Tweet not found or lease lost"
+        )
+        tweet = Tweet.objects.get(id=1790000000000000001)
+        self.assertEqual(tweet.like, 5)
+        self.assertIsNone(tweet.lease_token)
+
+        released = self.post("release_tweets", {"lease_token": first["lease_token"]})
+        self.assertEqual(released["released"], 1)
+        # the released tweet is due again, the submitted one has data
+        third = self.post("claim_tweets", {"limit": 10})
+        self.assertEqual(
+            [tweet["id"] for tweet in third["data"]], ["1790000000000000002"]
+        )
+
+    def test_expired_lease(self):
+        first = self.post("claim_tweets", {"limit": 1, "lease_seconds": 10})
+        Tweet.objects.filter(lease_token=first["lease_token"]).update(
+            lease_expires_at=timezone.now() - timedelta(seconds=1)
+        )
+        second = self.post("claim_tweets", {"limit": 1})
+        self.assertEqual(second["data"][0]["id"], first["data"][0]["id"])
+
+        # the first worker lost the lease, its submit is not written
+        tweet_id = first["data"][0]["id"]
+        submitted = self.post(
+            "submit_tweets",
+            {
+                "lease_token": first["lease_token"],
+                "tweets": [{"id": tweet_id, "like": 5, "rt": 1, "quote": 0}],
+            },
+        )
+        self.assertEqual(submitted["updated"], 0)
+        released = self.post(
+            "release_tweets", {"lease_token": first["lease_token"], "ids": [tweet_id]}
+        )
+        self.assertEqual(released["released"], 0)
+
+
+def rate_limit_response(status_code=200, **headers):
+    return SimpleNamespace(
+        status_code=status_code,
+        headers={key.replace("_", "-"): str(value) for key, value in headers.items()},
+    )
+
+
+class RateLimitTest(SimpleTestCase):
+    def test_parse_headers(self):
+        response = rate_limit_response(
+            x_rate_limit_limit=50,
+            x_rate_limit_remaining=10,
+            x_rate_limit_reset=1700000900,
+            x_user_limit_24hour_limit=17,
+            x_user_limit_24hour_remaining=0,
+            x_user_limit_24hour_reset=1700086400,
+        )
+        self.assertEqual(
+            parse_rate_limit_headers(response),
+            {
+                "endpoint": (50, 10, 1700000900.0),
+                USER_24HOUR: (17, 0, 1700086400.0),
+            },
+        )
+        self.assertEqual(parse_rate_limit_headers(rate_limit_response()), {})
+
+    def test_exhausted_bucket_waits_for_reset(self):
+        now = time.time()
+        bucket = TokenBucket(50, 900)
+        bucket.update_from_headers(50, 0, now + 600)
+        # no linear refill before the reset of the window
+        self.assertAlmostEqual(bucket.wait_time(now + 300), 300, places=3)
+        self.assertEqual(bucket.wait_time(now + 600), 0)
+        self.assertEqual(bucket.tokens, 50)
+
+    def test_user_limit_is_separate(self):
+        now = time.time()
+        budgeter = RateLimitBudgeter()
+        budgeter.max_wait = 60
+        budgeter.update(
+            "bot",
+            "tweets",
+            rate_limit_response(
+                x_rate_limit_limit=50,
+                x_rate_limit_remaining=49,
+                x_rate_limit_reset=now + 900,
+                x_user_limit_24hour_limit=17,
+                x_user_limit_24hour_remaining=0,
+                x_user_limit_24hour_reset=now + 3600,
+            ),
+        )
+        endpoint_bucket = budgeter.buckets["bot"]["tweets"]
+        user_bucket = budgeter.buckets["bot"][USER_24HOUR]
+        self.assertEqual((endpoint_bucket.limit, endpoint_bucket.tokens), (50, 49))
+        self.assertEqual((user_bucket.limit, user_bucket.tokens), (17, 0))
+
+        # the endpoint has budget left, the user limit of the account doesn't
+        with self.assertRaises(RateLimitExceeded):
+            budgeter.acquire("bot", "tweets")
+        with self.assertRaises(RateLimitExceeded):
+            budgeter.acquire("bot", "media")
+        budgeter.acquire("other_bot", "tweets")
+
+
+class CollectMetricsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        post_time = timezone.now() - timedelta(days=10)
+        # a has credentials, b has credentials but its lookups fail, c has none
+        for i, id_name in enumerate(["a", "a", "b", "c"]):
+            seiyuu, _ = Seiyuu.objects.get_or_create(
+                name=id_name, screen_name=f"{id_name}_bot", id_name=id_name
+            )
+            Tweet.objects.create(
+                id=1790000000000000001 + i,
+                post_time=post_time,
+                media=Media.objects.create(
+                    file_path=f"{id_name}/{i}.jpg", seiyuu=seiyuu
+                ),
+            )
+
+    async def fake_lookup(self, semaphore, account, bearer_token, tweet_ids, base_url):
+        if account == "b":
+            raise TwitterLookupError("tweet_lookup returned 503")
+        self.assertEqual(bearer_token, "token_a")
+        # the second tweet of a was deleted
+        return {
+            tweet_id: {"like": 5, "rt": 1, "quote": 0, "reply": 2}
+            for tweet_id in tweet_ids
+            if tweet_id != "1790000000000000002"
+        }
+
+    def test_collect(self):
+        credentials = {
+            "a": {"bearer_token": "token_a"},
+            "b": {"bearer_token": "token_b"},
+        }
+        command = "core.management.commands.collect_metrics"
+        with mock.patch(
+            f"{command}.get_twitter_credentials", return_value=credentials
+        ), mock.patch(f"{command}.lookup_tweets", self.fake_lookup):
+            stdout = StringIO()
+            call_command("collect_metrics", stdout=stdout)
+        self.assertIn(
+            "4 claimed, 1 updated, 1 missing, 1 failed requests", stdout.getvalue()
+        )
+
+        tweets = Tweet.objects.order_by("id")
+        self.assertEqual(
+            [(tweet.like, tweet.reply, tweet.crawl_failures) for tweet in tweets],
+            [(5, 2, 0), (None, None, 1), (None, None, 0), (None, None, 1)],
+        )
+        self.assertIsNotNone(tweets[0].data_time)
+        self.assertIsNone(tweets[0].lease_token)
+        self.assertEqual(TweetMetricSnapshot.objects.count(), 1)
+        # the failed request and the failures are retried after the lease
+        self.assertTrue(all(tweet.lease_token for tweet in tweets[1:]))
+
+
+class CollectFollowersTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for id_name in ["a", "b", "c"]:
+            Seiyuu.objects.create(
+                name=id_name, screen_name=f"{id_name}_bot", id_name=id_name
+            )
+
+    def collect(self, send_lookup) -> str:
+        stdout = StringIO()
+        with mock.patch(
+            "core.management.commands.collect_followers.get_twitter_credentials",
+            return_value={"b": {"bearer_token": "token_b"}},
+        ), mock.patch(
+            "core.management.commands._lookup_handler.send_lookup", send_lookup
+        ):
+            call_command("collect_followers", stdout=stdout)
+        return stdout.getvalue()
+
+    def test_collect(self):
+        def send_lookup(account, bearer_token, endpoint, path, params, base_url):
+            # the first seiyuu with credentials does the lookups
+            self.assertEqual((account, bearer_token), ("b", "token_b"))
+            self.assertEqual(params["usernames"], "a_bot,b_bot,c_bot")
+            # the API returns the current case of the usernames, c_bot was renamed
+            return {
+                "data": [
+                    {"username": "A_Bot", "public_metrics": {"followers_count": 100}},
+                    {"username": "b_bot", "public_metrics": {"followers_count": 200}},
+                ]
+            }
+
+        stdout = self.collect(send_lookup)
+        self.assertIn("2/3 follower counts saved", stdout)
+        self.assertIn("Not found: c_bot", stdout)
+        self.assertEqual(
+            sorted(Followers.objects.values_list("seiyuu__id_name", "followers")),
+            [("a", 100), ("b", 200)],
+        )
+        # one data time for the whole sample
+        self.assertEqual(Followers.objects.values("data_time").distinct().count(), 1)
+
+    def test_lookup_failure(self):
+        def send_lookup(*args):
+            raise TwitterLookupError("user_lookup returned 503")
+
+        stdout = self.collect(send_lookup)
+        self.assertIn("[b] Lookup failed", stdout)
+        self.assertFalse(Followers.objects.exists())
@@ -0,0 +1,198 @@
+import io
+import os
+import shutil
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+
+# below this number of files generating inline is faster than starting a process pool.
+# Lower than the hashing threshold of the import, decoding, resizing and encoding a
+# file (or running ffmpeg for a video) takes much longer than hashing it.
+POOL_THRESHOLD = 4
+
+
+def get_thumbnail_name(content_hash: str, size: int) -> str:
+    return f"{content_hash}_{size}.{settings.THUMBNAIL_FORMAT}"
+
+
+def get_thumbnail_path(thumbnail_name: str) -> str:
+    """
+    Thumbnails are content addressed and sharded by the first two hash characters
+    """
+    return os.path.join(settings.THUMBNAIL_ROOT, thumbnail_name[:2], thumbnail_name)
+
+
+def parse_thumbnail_name(thumbnail_name: str) -> tuple[str, int] | None:
+    stem, _, extension = thumbnail_name.partition(".")
+    content_hash, _, size = stem.partition("_")
+    if (
+        extension != settings.THUMBNAIL_FORMAT
+        or len(content_hash) != 64
+        or not (size.isascii() and size.isdigit())
+        or int(size) not in settings.THUMBNAIL_SIZES
+    ):
+        return None
+    return content_hash, int(size)
+
+
+def extract_poster_frame(file_path: str) -> Image.Image | None:
+    """
+    First second frame of a video, needs ffmpeg on PATH
+    """
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        return None
+    result = subprocess.run(
+        [
+            ffmpeg,
+            "-loglevel",
+            "error",
+            "-ss",
+            "1",
+            "-i",
+            file_path,
+            "-frames:v",
+            "1",
+            "-f",
+            "image2pipe",
+            "-vcodec",
+            "png",
+            "-",
+        ],
+        capture_output=True,
+        timeout=60,
+    )
+    if result.returncode != 0 or not result.stdout:
+        return None
+    return Image.open(io.BytesIO(result.stdout))
+
+
+def open_source_image(file_path: str, file_type: str) -> Image.Image | None:
+    if file_type == "video/mp4":
+        return extract_poster_frame(file_path)
+    try:
+        # for GIF this is the first frame
+        return Image.open(file_path)
+    except (UnidentifiedImageError, OSError):
+        return None
+
+
+def generate_thumbnails(file_path: str, file_type: str, content_hash: str) -> list[str]:
+    """
+    Write every missing size of the thumbnail, return the names of the thumbnails
+    that exist afterwards
+    """
+    names = [get_thumbnail_name(content_hash, size) for size in settings.THUMBNAIL_SIZES]
+    missing = [
+        (size, name)
+        for size, name in zip(settings.THUMBNAIL_SIZES, names)
+        if not os.path.exists(get_thumbnail_path(name))
+    ]
+    if not missing:
+        return names
+
+    image = open_source_image(file_path, file_type)
+    if image is None:
+        return []
+
+    with image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+        if settings.THUMBNAIL_FORMAT == "jpeg" and image.mode == "RGBA":
+            image = image.convert("RGB")
+
+        # largest first, so each smaller size is resized from the previous one
+        for size, name in sorted(missing, reverse=True):
+            image.thumbnail((size, size), Image.Resampling.LANCZOS)
+            thumbnail_path = get_thumbnail_path(name)
+            os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+            tmp_path = f"{thumbnail_path}.{os.getpid()}.tmp"
+            image.save(
+                tmp_path,
+                format=settings.THUMBNAIL_FORMAT.upper(),
+                quality=settings.THUMBNAIL_QUALITY,
+            )
+            os.replace(tmp_path, thumbnail_path)
+
+    return names
+
+
+def generate_thumbnails_bulk(
+    files: list[tuple[str, str, str]], workers: int | None = None
+) -> int:
+    """
+    Generate thumbnails of (file_path, file_type, content_hash) in a process pool,
+    inline for a few files, return the number of files that have thumbnails
+    """
+    if not files:
+        return 0
+    if len(files) < POOL_THRESHOLD or workers == 1:
+        return sum(1 for args in files if generate_thumbnails(*args))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(generate_thumbnails, *zip(*files), chunksize=8)
+        return sum(1 for names in results if names)
+
+
+def scan_thumbnail_cache() -> list[tuple[float, int, str]]:
+    """
+    (mtime, size, path) of every thumbnail, walks the whole cache
+    """
+    entries = []
+    if not os.path.isdir(settings.THUMBNAIL_ROOT):
+        return entries
+    for shard in os.scandir(settings.THUMBNAIL_ROOT):
+        if not shard.is_dir():
+            continue
+        for entry in os.scandir(shard.path):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    return entries
+
+
+def get_thumbnails_size(content_hashes: list[str]) -> int:
+    """
+    Bytes of the existing thumbnails of these contents, without walking the cache
+    """
+    total_bytes = 0
+    for content_hash in content_hashes:
+        for size in settings.THUMBNAIL_SIZES:
+            try:
+                total_bytes += os.stat(
+                    get_thumbnail_path(get_thumbnail_name(content_hash, size))
+                ).st_size
+            except FileNotFoundError:
+                continue
+    return total_bytes
+
+
+def evict_thumbnails(max_bytes: int | None = None) -> tuple[int, int]:
+    """
+    Delete the least recently used thumbnails until the cache fits in 90% of max_bytes,
+    serving a thumbnail refreshes its mtime. Return (files deleted, bytes freed).
+    """
+    if max_bytes is None:
+        max_bytes = settings.THUMBNAIL_CACHE_MAX_BYTES
+
+    entries = scan_thumbnail_cache()
+    total_bytes = sum(size for _, size, _ in entries)
+    if total_bytes <= max_bytes:
+        return 0, 0
+
+    target = max_bytes * 0.9
+    deleted = 0
+    freed = 0
+    for _, size, path in sorted(entries):
+        if total_bytes - freed <= target:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            continue
+        deleted += 1
+        freed += size
+
+    return deleted, freed
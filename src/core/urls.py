@@ -4,6 +4,7 @@ from . import views
 
 service_config_patterns = [
     path("", views.get_service_config, name="get_service_config"),
+    path("rate_limits/", views.get_rate_limits, name="get_rate_limits"),
     path(
         "update/<str:id_name>/",
         views.update_service_config,
@@ -13,6 +14,14 @@ service_config_patterns = [
 
 image_patterns = [
     path("", views.list_images, name="list_images"),
+    path(
+        "thumbnails/<str:name>", views.serve_thumbnail, name="serve_thumbnail"
+    ),
+    path(
+        "<int:pk>/thumbnail/<int:size>/",
+        views.get_image_thumbnail,
+        name="get_image_thumbnail",
+    ),
     path("<int:pk>/tweets/", views.list_image_tweets, name="list_image_tweets"),
     path(
         "<int:pk>/update_weight/", views.update_image_weight, name="update_image_weight"
@@ -21,16 +30,33 @@ image_patterns = [
 
 local_patterns = [
     path("get_no_data_tweets/", views.get_no_data_tweets, name="get_no_data_tweets"),
+    path("claim_tweets/", views.claim_tweets, name="claim_tweets"),
+    path("submit_tweets/", views.submit_tweets, name="submit_tweets"),
+    path("release_tweets/", views.release_tweets, name="release_tweets"),
+    path(
+        "update_tweet_data/batch/",
+        views.update_tweet_data_batch,
+        name="update_tweet_data_batch",
+    ),
     path(
         "update_tweet_data/<str:pk>/", views.update_tweet_data, name="update_tweet_data"
     ),
     path("set_followers/", views.set_followers, name="set_followers"),
+    path(
+        "set_followers/batch/", views.set_followers_batch, name="set_followers_batch"
+    ),
 ]
 
 
 urlpatterns = [
     path("stats/", views.get_stats, name="get_stats"),
     path("followers/", views.get_followers, name="get_followers"),
+    path("upload_timings/", views.get_upload_timings, name="get_upload_timings"),
+    path(
+        "engagement_curve/",
+        views.get_engagement_curve,
+        name="get_engagement_curve",
+    ),
     path("service_config/", include(service_config_patterns)),
     path("images/", include(image_patterns)),
     path("local/", include(local_patterns)),
@@ -1,6 +1,39 @@
-from .models import Seiyuu, Tweet, Followers
+from .db import immediate_atomic
+from .models import (
+    MAX_CRAWL_FAILURES,
+    Seiyuu,
+    Tweet,
+    TweetMetricSnapshot,
+    Followers,
+    UploadTiming,
+)
 from datetime import datetime, timedelta
-from django.db.models import Avg, Sum
+import math
+import threading
+import time
+import uuid
+from django.conf import settings
+from django.db import transaction
+from django.db.models import (
+    Avg,
+    BigIntegerField,
+    Count,
+    ExpressionWrapper,
+    F,
+    IntegerField,
+    Q,
+    Sum,
+)
+from django.utils import timezone
+
+
+# rows per transaction of the bulk write paths, below the SQLite variable limit
+BULK_WRITE_CHUNK_SIZE = 500
+
+# screen_name -> seiyuu id, reloaded on a miss or after SCREEN_NAME_CACHE_TTL seconds
+SCREEN_NAME_CACHE_TTL = 300
+screen_name_cache = {"loaded_at": None, "ids": {}}
+screen_name_cache_lock = threading.Lock()
 
 
 def get_stats_from_query_options(
@@ -12,7 +45,7 @@ def get_stats_from_query_options(
     Get the stats from the query options
     """
     tweet_query = Tweet.objects.filter(
-        media__seiyuu=seiyuu,
+        seiyuu=seiyuu,
         post_time__gte=start_date,
         post_time__lte=end_date,
         data_time__isnull=False,
@@ -145,3 +178,325 @@ def get_followers_from_query_options(
         )
 
     return {"status": True, "data": json_data}
+
+
+def percentile(sorted_values: list, q: float) -> int | float:
+    """
+    Nearest-rank percentile of an already sorted list
+    """
+    if not sorted_values:
+        return 0
+    rank = max(math.ceil(q / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def get_upload_timing_percentiles(
+    start_date: datetime,  # tz aware
+    end_date: datetime,  # tz aware
+) -> list[dict]:
+    """
+    Get p50/p95 of each upload phase, grouped by seiyuu and media type
+    """
+    phase_fields = [f"{phase}_ms" for phase in UploadTiming.PHASES]
+
+    timing_query = UploadTiming.objects.filter(
+        tweet__post_time__gte=start_date,
+        tweet__post_time__lte=end_date,
+    ).values_list(
+        "tweet__seiyuu__id_name",
+        "tweet__media__file_type",
+        "total_bytes",
+        *phase_fields,
+    )
+
+    groups: dict[tuple[str, str], list[tuple]] = {}
+    for id_name, file_type, *values in timing_query:
+        groups.setdefault((id_name, file_type), []).append(values)
+
+    data = []
+    for (id_name, file_type), rows in sorted(groups.items()):
+        columns = list(zip(*rows))
+        phases = {}
+        for phase, column in zip(UploadTiming.PHASES, columns[1:]):
+            sorted_column = sorted(column)
+            phases[phase] = {
+                "p50": percentile(sorted_column, 50),
+                "p95": percentile(sorted_column, 95),
+            }
+        data.append(
+            {
+                "seiyuu_id_name": id_name,
+                "file_type": file_type,
+                "count": len(rows),
+                "avg_bytes": sum(columns[0]) / len(rows),
+                "phases": phases,
+            }
+        )
+
+    return data
+
+
+def update_tweet_metrics_bulk(
+    metrics: list[dict], lease_token: str | None = None
+) -> dict[str, dict]:
+    """
+    Write like/rt/quote (and reply if given) of many tweets, one transaction per chunk,
+    and append a TweetMetricSnapshot of each.
+    metrics: validated {id, like, rt, quote, reply?}, a later duplicate id wins
+    lease_token: only write tweets still held by this lease
+    The lease of written tweets is cleared. Return {id: {"status", "message"}}
+    """
+    by_id = {str(item["id"]): item for item in metrics}
+    ids = list(by_id)
+    results = {}
+    data_time = timezone.now()
+
+    for i in range(0, len(ids), BULK_WRITE_CHUNK_SIZE):
+        chunk = ids[i : i + BULK_WRITE_CHUNK_SIZE]
+        # reads the tweets before writing them, see immediate_atomic
+        with immediate_atomic():
+            tweet_query = Tweet.objects.filter(id__in=chunk)
+            if lease_token is not None:
+                tweet_query = tweet_query.filter(lease_token=lease_token)
+            existing = {
+                str(tweet_id): (post_time, seiyuu_id)
+                for tweet_id, post_time, seiyuu_id in tweet_query.values_list(
+                    "id", "post_time", "seiyuu_id"
+                )
+            }
+            snapshots = []
+            # reply is only overwritten when the crawler sends it
+            with_reply, without_reply = [], []
+            for tweet_id in chunk:
+                if tweet_id not in existing:
+                    results[tweet_id] = {
+                        "status": False,
+                        "message": "Tweet not found"
+                        if lease_token is None
+                        else "Tweet not found or lease lost",
+                    }
+                    continue
+                item = by_id[tweet_id]
+                tweet = Tweet(
+                    id=tweet_id,
+                    data_time=data_time,
+                    like=item["like"],
+                    rt=item["rt"],
+                    quote=item["quote"],
+                    reply=item.get("reply", 0),
+                )
+                (with_reply if "reply" in item else without_reply).append(tweet)
+                results[tweet_id] = {"status": True, "message": "Updated"}
+
+                post_time, seiyuu_id = existing[tweet_id]
+                if post_time is not None:
+                    snapshots.append(
+                        TweetMetricSnapshot(
+                            tweet_id=tweet_id,
+                            seiyuu_id=seiyuu_id,
+                            age=int((data_time - post_time).total_seconds()),
+                            like=item["like"],
+                            rt=item["rt"],
+                            quote=item["quote"],
+                            # unknown rather than 0, so it doesn't pull the averages down
+                            reply=item.get("reply"),
+                        )
+                    )
+
+            fields = ["data_time", "like", "rt", "quote", "lease_token", "lease_expires_at"]
+            Tweet.objects.bulk_update(with_reply, fields + ["reply"])
+            Tweet.objects.bulk_update(without_reply, fields)
+            # the history is append only, the tweet row keeps the latest values
+            TweetMetricSnapshot.objects.bulk_create(snapshots)
+
+    return results
+
+
+def parse_tweet_id(value: str) -> int | None:
+    """
+    The tweet id of a url or query param, None if it can't be one. Filtering by
+    None matches no tweet.
+    """
+    # isdigit() alone accepts digits like "²" that int() can't parse
+    if not (value.isascii() and value.isdigit()):
+        return None
+    if int(value) > BigIntegerField.MAX_BIGINT:
+        return None
+    return int(value)
+
+
+def get_crawl_tweet_values(tweet_query) -> list[dict]:
+    """
+    [{id, post_time, media__seiyuu__screen_name}] of the tweets for the crawler.
+    Ids are strings for JS clients, the screen name keeps the key of the old media join.
+    """
+    return [
+        {**tweet, "id": str(tweet["id"])}
+        for tweet in tweet_query.values(
+            "id", "post_time", media__seiyuu__screen_name=F("seiyuu__screen_name")
+        )
+    ]
+
+
+def get_due_tweets():
+    """
+    Tweets old enough to be crawled, without data, not held by a live lease
+    and not given up on after MAX_CRAWL_FAILURES
+    """
+    current_time = timezone.now()
+    return Tweet.objects.filter(
+        Q(lease_expires_at__isnull=True) | Q(lease_expires_at__lt=current_time),
+        data_time__isnull=True,
+        crawl_failures__lt=MAX_CRAWL_FAILURES,
+        post_time__lte=current_time - timedelta(hours=settings.TWEET_DATA_DELAY_HOURS),
+    )
+
+
+def claim_due_tweets(limit: int, lease_seconds: int) -> tuple[str, datetime, list[dict]]:
+    """
+    Lease the oldest due tweets to one crawl worker, expired leases are claimed again.
+    The claim is a single UPDATE ... WHERE id IN (SELECT ... LIMIT), so concurrent
+    workers never get the same tweet.
+    Return (lease token, lease expiry, [{id, post_time, media__seiyuu__screen_name}])
+    """
+    lease_token = uuid.uuid4().hex
+    lease_expires_at = timezone.now() + timedelta(seconds=lease_seconds)
+
+    due_ids = get_due_tweets().order_by("post_time").values("id")[:limit]
+    with immediate_atomic():
+        Tweet.objects.filter(id__in=due_ids).update(
+            lease_token=lease_token, lease_expires_at=lease_expires_at
+        )
+        tweets = get_crawl_tweet_values(
+            Tweet.objects.filter(lease_token=lease_token).order_by("post_time")
+        )
+    return lease_token, lease_expires_at, tweets
+
+
+def release_leased_tweets(lease_token: str, ids: list[str] | None = None) -> int:
+    """
+    Give back leased tweets without data, all of the lease if ids is None
+    """
+    tweet_query = Tweet.objects.filter(lease_token=lease_token)
+    if ids is not None:
+        tweet_query = tweet_query.filter(id__in=ids)
+    return tweet_query.update(lease_token=None, lease_expires_at=None)
+
+
+def record_crawl_failures(lease_token: str, ids: list[str]) -> int:
+    """
+    Count a failed crawl of leased tweets that can't get data (deleted, protected or
+    no credentials). They keep their lease, so they are retried after it expires.
+    """
+    updated = 0
+    for i in range(0, len(ids), BULK_WRITE_CHUNK_SIZE):
+        updated += Tweet.objects.filter(
+            lease_token=lease_token, id__in=ids[i : i + BULK_WRITE_CHUNK_SIZE]
+        ).update(crawl_failures=F("crawl_failures") + 1)
+    return updated
+
+
+def get_seiyuu_ids_by_screen_name(screen_names: set[str]) -> dict[str, int]:
+    """
+    Seiyuu ids of the screen names from the in-process cache,
+    the whole mapping is one small query when it is stale or a name is missing
+    """
+    with screen_name_cache_lock:
+        loaded_at = screen_name_cache["loaded_at"]
+        if (
+            loaded_at is None
+            or time.monotonic() - loaded_at > SCREEN_NAME_CACHE_TTL
+            or not screen_names <= screen_name_cache["ids"].keys()
+        ):
+            screen_name_cache["ids"] = dict(
+                Seiyuu.objects.filter(screen_name__isnull=False).values_list(
+                    "screen_name", "id"
+                )
+            )
+            screen_name_cache["loaded_at"] = time.monotonic()
+        ids = screen_name_cache["ids"]
+        return {name: ids[name] for name in screen_names if name in ids}
+
+
+def create_followers_bulk(samples: list[dict]) -> list[dict]:
+    """
+    Insert follower samples in one transaction.
+    samples: validated {seiyuu (screen_name), followers, data_time?}
+    Return {seiyuu, status, message} of every sample in order
+    """
+    seiyuu_ids = get_seiyuu_ids_by_screen_name({sample["seiyuu"] for sample in samples})
+    data_time = timezone.now()
+
+    new_followers = []
+    results = []
+    for sample in samples:
+        seiyuu_id = seiyuu_ids.get(sample["seiyuu"])
+        if seiyuu_id is None:
+            results.append(
+                {"seiyuu": sample["seiyuu"], "status": False, "message": "Seiyuu not found"}
+            )
+            continue
+        new_followers.append(
+            Followers(
+                seiyuu_id=seiyuu_id,
+                data_time=sample.get("data_time") or data_time,
+                followers=sample["followers"],
+            )
+        )
+        results.append({"seiyuu": sample["seiyuu"], "status": True, "message": "Created"})
+
+    # no aggregates are stored, the follower stats are computed from these rows when read
+    with transaction.atomic():
+        Followers.objects.bulk_create(new_followers, batch_size=BULK_WRITE_CHUNK_SIZE)
+
+    return results
+
+
+def get_engagement_curve_from_query_options(
+    seiyuu: Seiyuu,
+    bucket_seconds: int,
+    max_age: int,
+    start_date: datetime | None = None,  # tz aware, tweet post time
+    end_date: datetime | None = None,  # tz aware, tweet post time
+) -> list[dict]:
+    """
+    Average metrics of the seiyuu tweets by age bucket, aggregated in SQL.
+    reply averages only the snapshots that have it.
+    """
+    snapshot_query = TweetMetricSnapshot.objects.filter(seiyuu=seiyuu, age__lt=max_age)
+    if start_date is not None:
+        snapshot_query = snapshot_query.filter(tweet__post_time__gte=start_date)
+    if end_date is not None:
+        snapshot_query = snapshot_query.filter(tweet__post_time__lte=end_date)
+
+    # integer division, both sides are integers
+    buckets = (
+        snapshot_query.annotate(
+            bucket=ExpressionWrapper(
+                F("age") / bucket_seconds, output_field=IntegerField()
+            )
+        )
+        .values("bucket")
+        .annotate(
+            samples=Count("id"),
+            tweets=Count("tweet", distinct=True),
+            like=Avg("like"),
+            rt=Avg("rt"),
+            quote=Avg("quote"),
+            reply=Avg("reply"),
+        )
+        .order_by("bucket")
+    )
+
+    return [
+        {
+            "age": row["bucket"] * bucket_seconds,
+            "samples": row["samples"],
+            "tweets": row["tweets"],
+            "like": row["like"],
+            "rt": row["rt"],
+            "quote": row["quote"],
+            "reply": row["reply"],
+        }
+        for row in buckets
+    ]
@@ -1,4 +1,13 @@
+import os
+import time
+
 from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import Http404, HttpRequest, HttpResponse
+from django.shortcuts import redirect
+from django.urls import reverse
+from django.utils._os import safe_join
+from django.views.decorators.http import require_safe
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.request import Request
@@ -8,6 +17,8 @@ from rest_framework import serializers
 from django.db.models import Avg, Count, Sum, Max
 
 from core.paginators import StandardResultsSetPagination
+from core.file_serving import serve_file
+from core.routers import analytics_reads
 
 from .models import Seiyuu, Tweet, Followers, Media
 from .serializers import (
@@ -15,8 +26,35 @@ from .serializers import (
     MediaSerializer,
     StatsQuerySerializer,
     TweetSerializer,
+    DateRangeQuerySerializer,
+    EngagementCurveQuerySerializer,
+    TweetMetricsSerializer,
+    FollowersSampleSerializer,
+    TweetClaimSerializer,
+    TweetSubmitSerializer,
+    TweetReleaseSerializer,
+)
+from .utils import (
+    get_stats_from_query_options,
+    get_followers_from_query_options,
+    get_upload_timing_percentiles,
+    get_engagement_curve_from_query_options,
+    update_tweet_metrics_bulk,
+    create_followers_bulk,
+    get_due_tweets,
+    get_crawl_tweet_values,
+    parse_tweet_id,
+    claim_due_tweets,
+    release_leased_tweets,
+)
+from .hashing import hash_file
+from .rate_limit import RateLimitBudgeter
+from .thumbnails import (
+    generate_thumbnails,
+    get_thumbnail_name,
+    get_thumbnail_path,
+    parse_thumbnail_name,
 )
-from .utils import get_stats_from_query_options, get_followers_from_query_options
 
 import math
 
@@ -85,6 +123,7 @@ from drf_spectacular.utils import (
     },
 )
 @api_view(["GET"])
+@analytics_reads
 def get_stats(request: Request) -> Response:
     """
     get post, like, rt, follower stats, given query options
@@ -144,6 +183,7 @@ def get_stats(request: Request) -> Response:
     },
 )
 @api_view(["GET"])
+@analytics_reads
 def get_followers(request: Request) -> Response:
     """
     get followers, given query options
@@ -166,6 +206,125 @@ def get_followers(request: Request) -> Response:
     )
 
 
+@extend_schema(
+    tags=["Stats"],
+    parameters=[
+        OpenApiParameter(
+            name="start_date",
+            type=str,
+            location=OpenApiParameter.QUERY,
+            description="Start date in iso format, default is 30 days ago",
+        ),
+        OpenApiParameter(
+            name="end_date",
+            type=str,
+            location=OpenApiParameter.QUERY,
+            description="End date in iso format, default is now",
+        ),
+    ],
+    responses={
+        200: OpenApiResponse(
+            description="Upload timings response",
+            response=inline_serializer(
+                name="UploadTimingsResponse",
+                fields={
+                    "status": serializers.BooleanField(),
+                    "data": inline_serializer(
+                        name="UploadTimings",
+                        fields={
+                            "seiyuu_id_name": serializers.CharField(),
+                            "file_type": serializers.CharField(),
+                            "count": serializers.IntegerField(),
+                            "avg_bytes": serializers.FloatField(),
+                            "phases": serializers.DictField(
+                                child=serializers.DictField(
+                                    child=serializers.IntegerField()
+                                )
+                            ),
+                        },
+                        many=True,
+                    ),
+                },
+            ),
+        ),
+    },
+)
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+@analytics_reads
+def get_upload_timings(request: Request) -> Response:
+    """
+    get p50/p95 of each upload phase per seiyuu and media type
+    """
+    serializer = DateRangeQuerySerializer(data=request.query_params)
+    serializer.is_valid(raise_exception=True)
+
+    end_date = serializer.validated_data.get("end_date") or timezone.now()
+    start_date = serializer.validated_data.get("start_date") or (
+        end_date - timedelta(days=30)
+    )
+
+    return Response(
+        {"status": True, "data": get_upload_timing_percentiles(start_date, end_date)},
+        status=status.HTTP_200_OK,
+    )
+
+
+@extend_schema(
+    tags=["Stats"],
+    parameters=[EngagementCurveQuerySerializer],
+    responses={
+        200: OpenApiResponse(
+            description="Engagement curve response",
+            response=inline_serializer(
+                name="EngagementCurveResponse",
+                fields={
+                    "status": serializers.BooleanField(),
+                    "data": inline_serializer(
+                        name="EngagementCurvePoint",
+                        fields={
+                            "age": serializers.IntegerField(),
+                            "samples": serializers.IntegerField(),
+                            "tweets": serializers.IntegerField(),
+                            "like": serializers.FloatField(),
+                            "rt": serializers.FloatField(),
+                            "quote": serializers.FloatField(),
+                            # null if no snapshot of the bucket has replies
+                            "reply": serializers.FloatField(allow_null=True),
+                        },
+                        many=True,
+                    ),
+                },
+            ),
+        ),
+    },
+)
+@api_view(["GET"])
+@analytics_reads
+def get_engagement_curve(request: Request) -> Response:
+    """
+    get average likes/rts/quotes/replies by tweet age of a seiyuu, from the metric snapshots
+    start_date and end_date filter on the tweet post time
+    """
+    serializer = EngagementCurveQuerySerializer(data=request.query_params)
+    serializer.is_valid(raise_exception=True)
+    query = serializer.validated_data
+
+    return Response(
+        {
+            "status": True,
+            "data": get_engagement_curve_from_query_options(
+                query["seiyuu"],
+                query["bucket"],
+                query["max_age"],
+                query.get("start_date"),
+                query.get("end_date"),
+            ),
+        },
+        status=status.HTTP_200_OK,
+    )
+
+
 @extend_schema(
     tags=["Seiyuu"],
     responses={
@@ -246,6 +405,48 @@ def update_service_config(request: Request, id_name) -> Response:
     )
 
 
+@extend_schema(
+    tags=["Seiyuu"],
+    responses={
+        200: OpenApiResponse(
+            description="Rate limit budget response",
+            response=inline_serializer(
+                name="RateLimitResponse",
+                fields={
+                    "status": serializers.BooleanField(),
+                    "data": serializers.DictField(
+                        child=serializers.DictField(
+                            child=inline_serializer(
+                                name="RateLimitBucket",
+                                fields={
+                                    "limit": serializers.IntegerField(),
+                                    "remaining": serializers.IntegerField(),
+                                    "reset": serializers.FloatField(),
+                                    "window": serializers.FloatField(),
+                                    "updated": serializers.FloatField(),
+                                },
+                            )
+                        )
+                    ),
+                },
+            ),
+        )
+    },
+)
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def get_rate_limits(request: Request) -> Response:
+    """
+    current twitter api budget of each account and endpoint, as saved by the last post run
+    """
+    budgeter = RateLimitBudgeter(settings.TWITTER_RATE_LIMIT["STATE_FILE"])
+
+    return Response(
+        {"status": True, "data": budgeter.state()},
+        status=status.HTTP_200_OK,
+    )
+
+
 @extend_schema(
     tags=["Images"],
     parameters=[
@@ -352,12 +553,15 @@ def update_service_config(request: Request, id_name) -> Response:
 )
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@analytics_reads
 def list_images(request: Request) -> Response:
     """
     list images in the database, given query options
     """
     if request.query_params.get("tweet_id"):
-        the_tweet_query = Tweet.objects.filter(id=request.query_params.get("tweet_id"))
+        the_tweet_query = Tweet.objects.filter(
+            id=parse_tweet_id(request.query_params.get("tweet_id"))
+        )
         if not the_tweet_query.exists():
             return Response(
                 {"status": False, "message": "Tweet not found"},
@@ -438,6 +642,7 @@ def list_images(request: Request) -> Response:
                 core_media.file_path,
                 core_media.file_type,
                 core_media.weight,
+                core_media.content_hash,
                 core_seiyuu.name AS seiyuu_name,
                 core_seiyuu.screen_name AS seiyuu_screen_name,
                 core_seiyuu.id_name AS seiyuu_id_name,
@@ -678,6 +883,85 @@ def update_image_weight(request: Request, pk: int) -> Response:
     )
 
 
+@require_safe
+def serve_media(request: HttpRequest, path: str) -> HttpResponse:
+    """
+    serve a Library file, with Range and ETag support for seeking in videos
+    """
+    try:
+        file_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404("Invalid path")
+
+    if not os.path.isfile(file_path):
+        raise Http404("File not found")
+
+    return serve_file(request, file_path)
+
+
+@require_safe
+def get_image_thumbnail(request: HttpRequest, pk: int, size: int) -> HttpResponse:
+    """
+    redirect to the content addressed thumbnail of an image, hashing the file if needed
+    """
+    if size not in settings.THUMBNAIL_SIZES:
+        raise Http404("Invalid thumbnail size")
+
+    try:
+        the_image = Media.objects.get(pk=pk)
+    except Media.DoesNotExist:
+        raise Http404("Image not found")
+
+    if not the_image.content_hash:
+        file_path = os.path.join(settings.MEDIA_ROOT, the_image.file_path)
+        if not os.path.isfile(file_path):
+            raise Http404("Image file not found")
+        the_image.content_hash = hash_file(file_path)
+        the_image.save(update_fields=["content_hash"])
+
+    return redirect(
+        reverse(
+            "serve_thumbnail",
+            args=[get_thumbnail_name(the_image.content_hash, size)],
+        )
+    )
+
+
+@require_safe
+def serve_thumbnail(request: HttpRequest, name: str) -> HttpResponse:
+    """
+    serve a thumbnail from the cache, generating it on first request
+    """
+    parsed = parse_thumbnail_name(name)
+    if parsed is None:
+        raise Http404("Invalid thumbnail name")
+    content_hash, _ = parsed
+
+    thumbnail_path = get_thumbnail_path(name)
+    if not os.path.isfile(thumbnail_path):
+        the_image = Media.objects.filter(content_hash=content_hash).first()
+        if the_image is None:
+            raise Http404("Image not found")
+        if name not in generate_thumbnails(
+            os.path.join(settings.MEDIA_ROOT, the_image.file_path),
+            the_image.file_type,
+            content_hash,
+        ):
+            raise Http404("Thumbnail not available")
+    elif os.path.getmtime(thumbnail_path) < time.time() - 24 * 60 * 60:
+        # mtime is the last use for the cache eviction, refreshed at most once a day
+        os.utime(thumbnail_path)
+
+    # the name changes with the content, so it never has to be revalidated
+    return serve_file(
+        request,
+        thumbnail_path,
+        content_type=f"image/{settings.THUMBNAIL_FORMAT}",
+        etag=name,
+        immutable=True,
+    )
+
+
 ########### local api ############
 
 
@@ -697,7 +981,7 @@ def update_image_weight(request: Request, pk: int) -> Response:
             response=inline_serializer(
                 name="NoDataTweetsResponse",
                 fields={
-                    "id": serializers.IntegerField(),
+                    "id": serializers.CharField(),
                     "post_time": serializers.DateTimeField(),
                     "seiyuu": serializers.CharField(),
                 },
@@ -724,20 +1008,14 @@ def get_no_data_tweets(request):
             {"message": "Not allowed host name"}, status=status.HTTP_403_FORBIDDEN
         )
 
-    no_data_tweets = Tweet.objects.select_related("media__seiyuu")
-
-    time_buffer = 72  # hours
-
-    no_data_tweets = no_data_tweets.filter(
-        data_time__isnull=True,
-        post_time__lte=timezone.now() - timedelta(hours=time_buffer),
-    ).order_by("post_time")
+    # tweets leased to a crawl worker are left out
+    no_data_tweets = get_due_tweets().order_by("post_time")
 
     if request.GET.get("limit"):
         limit = int(request.GET.get("limit"))
         no_data_tweets = no_data_tweets[:limit]
 
-    data = no_data_tweets.values("id", "post_time", "media__seiyuu__screen_name")
+    data = get_crawl_tweet_values(no_data_tweets)
 
     return Response(data, status=status.HTTP_200_OK)
 
@@ -793,7 +1071,7 @@ def update_tweet_data(request, pk):
 
     try:
         # Retrieve the object you want to update based on the 'pk' parameter
-        the_tweet = Tweet.objects.get(pk=pk)
+        the_tweet = Tweet.objects.get(pk=parse_tweet_id(pk))
     except Tweet.DoesNotExist:
         return Response(
             {"status": False, "message": "Tweet not found"},
@@ -820,6 +1098,115 @@ def update_tweet_data(request, pk):
     )
 
 
+# max tweets in one batch request
+TWEET_DATA_BATCH_LIMIT = 10000
+
+TWEET_BATCH_RESPONSE = inline_serializer(
+    name="TweetBatchResponse",
+    fields={
+        "status": serializers.BooleanField(),
+        "message": serializers.CharField(),
+        "updated": serializers.IntegerField(),
+        "results": inline_serializer(
+            name="TweetBatchResult",
+            fields={
+                "id": serializers.CharField(),
+                "status": serializers.BooleanField(),
+                "message": serializers.CharField(),
+            },
+            many=True,
+        ),
+    },
+)
+
+
+def format_errors(errors: dict) -> str:
+    return "; ".join(
+        f"{field}: {' '.join(str(error) for error in field_errors)}"
+        for field, field_errors in errors.items()
+    )
+
+
+def validate_tweet_metrics(items: list) -> tuple[list[dict], list[dict]]:
+    """
+    (valid metrics, failed results) of a batch, one invalid item doesn't fail the batch
+    """
+    valid = []
+    results = []
+    for item in items:
+        serializer = TweetMetricsSerializer(data=item)
+        if serializer.is_valid():
+            valid.append(serializer.validated_data)
+        else:
+            results.append(
+                {
+                    "id": item.get("id") if isinstance(item, dict) else None,
+                    "status": False,
+                    "message": format_errors(serializer.errors),
+                }
+            )
+    return valid, results
+
+
+@extend_schema(
+    tags=["Local"],
+    request=OpenApiRequest(
+        request=TweetMetricsSerializer(many=True),
+        encoding="application/json",
+    ),
+    responses={
+        200: OpenApiResponse(
+            description="Tweet Batch Response",
+            response=TWEET_BATCH_RESPONSE,
+        ),
+    },
+)
+@api_view(["POST"])
+def update_tweet_data_batch(request):
+    """
+    write data to many tweets at once, api for local only
+
+    [body params]
+    list of {id, like, rt, quote, reply (optional)}
+
+    [return]
+    results: status of every id, invalid or unknown ids don't fail the batch
+    """
+    if not request.get_host() in settings.LOCAL_HOSTS:
+        return Response(
+            {"status": False, "message": "Not allowed host name"},
+            status=status.HTTP_403_FORBIDDEN,
+        )
+
+    if not isinstance(request.data, list):
+        return Response(
+            {"status": False, "message": "Expected a list of tweets"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    if len(request.data) > TWEET_DATA_BATCH_LIMIT:
+        return Response(
+            {
+                "status": False,
+                "message": f"At most {TWEET_DATA_BATCH_LIMIT} tweets per request",
+            },
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    valid, results = validate_tweet_metrics(request.data)
+    updated = update_tweet_metrics_bulk(valid)
+    results.extend({"id": tweet_id, **result} for tweet_id, result in updated.items())
+
+    return Response(
+        {
+            "status": True,
+            "message": "Batch processed",
+            "updated": sum(result["status"] for result in updated.values()),
+            "results": results,
+        },
+        status=status.HTTP_200_OK,
+    )
+
+
 @extend_schema(
     tags=["Local"],
     request=OpenApiRequest(
@@ -873,3 +1260,247 @@ def set_followers(request):
         {"status": True, "message": "Object create successfully"},
         status=status.HTTP_200_OK,
     )
+
+
+# max samples in one batch request
+FOLLOWERS_BATCH_LIMIT = 10000
+
+
+@extend_schema(
+    tags=["Local"],
+    request=OpenApiRequest(
+        request=FollowersSampleSerializer(many=True),
+        encoding="application/json",
+    ),
+    responses={
+        200: OpenApiResponse(
+            description="Followers Batch Response",
+            response=inline_serializer(
+                name="FollowersBatchResponse",
+                fields={
+                    "status": serializers.BooleanField(),
+                    "message": serializers.CharField(),
+                    "created": serializers.IntegerField(),
+                    "results": inline_serializer(
+                        name="FollowersBatchResult",
+                        fields={
+                            "seiyuu": serializers.CharField(),
+                            "status": serializers.BooleanField(),
+                            "message": serializers.CharField(),
+                        },
+                        many=True,
+                    ),
+                },
+            ),
+        ),
+    },
+)
+@api_view(["POST"])
+def set_followers_batch(request):
+    """
+    write many follower samples to database at once, api for local only
+
+    [body params]
+    list of {seiyuu (screen_name), followers, data_time (optional)}
+
+    [return]
+    results: status of every sample in order, invalid samples or unknown seiyuu don't fail the batch
+    """
+    if not request.get_host() in settings.LOCAL_HOSTS:
+        return Response(
+            {"status": False, "message": "Not allowed host name"},
+            status=status.HTTP_403_FORBIDDEN,
+        )
+
+    if not isinstance(request.data, list):
+        return Response(
+            {"status": False, "message": "Expected a list of samples"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    if len(request.data) > FOLLOWERS_BATCH_LIMIT:
+        return Response(
+            {
+                "status": False,
+                "message": f"At most {FOLLOWERS_BATCH_LIMIT} samples per request",
+            },
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    valid = []
+    positions = []
+    results = [None] * len(request.data)
+    for i, item in enumerate(request.data):
+        serializer = FollowersSampleSerializer(data=item)
+        if serializer.is_valid():
+            valid.append(serializer.validated_data)
+            positions.append(i)
+        else:
+            results[i] = {
+                "seiyuu": item.get("seiyuu") if isinstance(item, dict) else None,
+                "status": False,
+                "message": format_errors(serializer.errors),
+            }
+
+    for i, result in zip(positions, create_followers_bulk(valid)):
+        results[i] = result
+
+    return Response(
+        {
+            "status": True,
+            "message": "Batch processed",
+            "created": sum(result["status"] for result in results),
+            "results": results,
+        },
+        status=status.HTTP_200_OK,
+    )
+
+
+@extend_schema(
+    tags=["Local"],
+    request=OpenApiRequest(request=TweetClaimSerializer, encoding="application/json"),
+    responses={
+        200: OpenApiResponse(
+            description="Tweet Claim Response",
+            response=inline_serializer(
+                name="TweetClaimResponse",
+                fields={
+                    "status": serializers.BooleanField(),
+                    "lease_token": serializers.CharField(),
+                    "lease_expires_at": serializers.DateTimeField(),
+                    "data": inline_serializer(
+                        name="ClaimedTweet",
+                        fields={
+                            "id": serializers.CharField(),
+                            "post_time": serializers.DateTimeField(),
+                            "media__seiyuu__screen_name": serializers.CharField(),
+                        },
+                        many=True,
+                    ),
+                },
+            ),
+        ),
+    },
+)
+@api_view(["POST"])
+def claim_tweets(request):
+    """
+    lease a batch of due tweets to a crawl worker, api for local only
+    many workers can claim at the same time, tweets of expired leases are claimed again
+
+    [body params]
+    limit: max number of tweets
+    lease_seconds: time to submit or release the tweets
+
+    [return]
+    lease_token: pass to submit_tweets and release_tweets
+    data: id, post_time and seiyuu screen_name of the claimed tweets
+    """
+    if not request.get_host() in settings.LOCAL_HOSTS:
+        return Response(
+            {"status": False, "message": "Not allowed host name"},
+            status=status.HTTP_403_FORBIDDEN,
+        )
+
+    serializer = TweetClaimSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+
+    lease_token, lease_expires_at, tweets = claim_due_tweets(
+        serializer.validated_data["limit"], serializer.validated_data["lease_seconds"]
+    )
+
+    return Response(
+        {
+            "status": True,
+            "lease_token": lease_token,
+            "lease_expires_at": lease_expires_at,
+            "data": tweets,
+        },
+        status=status.HTTP_200_OK,
+    )
+
+
+@extend_schema(
+    tags=["Local"],
+    request=OpenApiRequest(request=TweetSubmitSerializer, encoding="application/json"),
+    responses={
+        200: OpenApiResponse(
+            description="Tweet Batch Response",
+            response=TWEET_BATCH_RESPONSE,
+        ),
+    },
+)
+@api_view(["POST"])
+def submit_tweets(request):
+    """
+    write data of leased tweets and end their lease, api for local only
+    tweets whose lease was lost to another worker are not written
+
+    [body params]
+    lease_token: token from claim_tweets
+    tweets: list of {id, like, rt, quote, reply (optional)}
+    """
+    if not request.get_host() in settings.LOCAL_HOSTS:
+        return Response(
+            {"status": False, "message": "Not allowed host name"},
+            status=status.HTTP_403_FORBIDDEN,
+        )
+
+    serializer = TweetSubmitSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+
+    valid, results = validate_tweet_metrics(serializer.validated_data["tweets"])
+    updated = update_tweet_metrics_bulk(
+        valid, lease_token=serializer.validated_data["lease_token"]
+    )
+    results.extend({"id": tweet_id, **result} for tweet_id, result in updated.items())
+
+    return Response(
+        {
+            "status": True,
+            "message": "Batch processed",
+            "updated": sum(result["status"] for result in updated.values()),
+            "results": results,
+        },
+        status=status.HTTP_200_OK,
+    )
+
+
+@extend_schema(
+    tags=["Local"],
+    request=OpenApiRequest(request=TweetReleaseSerializer, encoding="application/json"),
+    responses={
+        200: OpenApiResponse(
+            description="Tweet Release Response",
+            response=inline_serializer(
+                name="TweetReleaseResponse",
+                fields={
+                    "status": serializers.BooleanField(),
+                    "released": serializers.IntegerField(),
+                },
+            ),
+        ),
+    },
+)
+@api_view(["POST"])
+def release_tweets(request):
+    """
+    give back leased tweets that could not be crawled, api for local only
+
+    [body params]
+    lease_token: token from claim_tweets
+    ids: tweets to release, default is all tweets of the lease
+    """
+    if not request.get_host() in settings.LOCAL_HOSTS:
+        return Response(
+            {"status": False, "message": "Not allowed host name"},
+            status=status.HTTP_403_FORBIDDEN,
+        )
+
+    serializer = TweetReleaseSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+
+    released = release_leased_tweets(
+        serializer.validated_data["lease_token"], serializer.validated_data.get("ids")
+    )
+
+    return Response({"status": True, "released": released}, status=status.HTTP_200_OK)
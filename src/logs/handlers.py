@@ -0,0 +1,89 @@
+import logging
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import BufferingHandler
+
+# in the console format of the loggers that also have a DatabaseLogHandler, see
+# LOGGING in settings. Their console output ends up in the backend log, logs.ingest
+# skips the marked lines so the records are not stored twice.
+DATABASE_LOGGED = "{db}"
+
+
+class DatabaseLogHandler(BufferingHandler):
+
+    def __init__(self, capacity: int = 100, flush_interval: float = 5.0):
+        """
+        Write log records to LogRecord in batches, flushed when capacity records
+        are buffered, flush_interval seconds after the last flush, on ERROR and at exit.
+        The batches are written by a background thread on its own database connection,
+        so they are kept when the transaction of the code that logged them rolls back.
+        """
+        super().__init__(capacity)
+        self.flush_interval = flush_interval
+        self.last_flush = time.monotonic()
+        self.batches = queue.SimpleQueue()
+        self.writer = None
+
+    def shouldFlush(self, record: logging.LogRecord) -> bool:
+        return (
+            super().shouldFlush(record)
+            or record.levelno >= logging.ERROR
+            or time.monotonic() - self.last_flush >= self.flush_interval
+        )
+
+    def flush(self):
+        self.acquire()
+        try:
+            buffer, self.buffer = self.buffer, []
+            self.last_flush = time.monotonic()
+            if not buffer:
+                return
+            # formatted now, the arguments of a record may change before it is written
+            self.batches.put([(record, self.format(record)) for record in buffer])
+            if self.writer is None or not self.writer.is_alive():
+                self.writer = threading.Thread(
+                    target=self.write_batches, name="DatabaseLogHandler", daemon=True
+                )
+                self.writer.start()
+        finally:
+            self.release()
+
+    def write_batches(self):
+        # imported here, handlers are configured before the apps are loaded
+        from django.db import connection
+
+        try:
+            while (batch := self.batches.get()) is not None:
+                self.write(batch)
+        finally:
+            connection.close()
+
+    def write(self, batch: list[tuple[logging.LogRecord, str]]):
+        from .models import LogRecord
+        from .search import get_seiyuu
+
+        try:
+            LogRecord.objects.bulk_create(
+                [
+                    LogRecord(
+                        timestamp=datetime.fromtimestamp(record.created, tz=timezone.utc),
+                        level=record.levelno,
+                        seiyuu=get_seiyuu(message),
+                        source=record.name[:50],
+                        message=message,
+                    )
+                    for record, message in batch
+                ]
+            )
+        except Exception:
+            self.handleError(batch[-1][0])
+
+    def close(self):
+        self.flush()
+        if self.writer is not None and self.writer.is_alive():
+            # write what is queued before the process exits
+            self.batches.put(None)
+            self.writer.join(timeout=10)
+        super().close()
@@ -0,0 +1,104 @@
+import logging
+import os
+import re
+from datetime import datetime
+
+from django.db import transaction
+from django.utils import timezone
+
+from .handlers import DATABASE_LOGGED
+from .models import LogIngestState, LogRecord
+from .search import get_seiyuu, iter_blocks, parse_timestamp
+
+
+LEVEL_RE = re.compile(r"\b(DEBUG|INFO|WARNING|WARN|ERROR|CRITICAL)\b")
+# cron output has no level, these words mark the failures of the post commands
+ERROR_RE = re.compile(r"(?i)\b(error|failed|exception|traceback)\b")
+LEVELS = {
+    "DEBUG": logging.DEBUG,
+    "INFO": logging.INFO,
+    "WARNING": logging.WARNING,
+    "WARN": logging.WARNING,
+    "ERROR": logging.ERROR,
+    "CRITICAL": logging.CRITICAL,
+}
+
+
+def parse_level(line: str) -> int:
+    match = LEVEL_RE.search(line)
+    if match:
+        return LEVELS[match.group(1)]
+    if ERROR_RE.search(line):
+        return logging.ERROR
+    return logging.INFO
+
+
+def parse_log_line(line: str, source: str, timestamp: datetime) -> LogRecord:
+    return LogRecord(
+        timestamp=timestamp,
+        level=parse_level(line),
+        seiyuu=get_seiyuu(line),
+        source=source,
+        message=line,
+    )
+
+
+def to_datetime(ts: str) -> datetime:
+    # log timestamps are written in local time
+    return timezone.make_aware(datetime.strptime(ts, "%Y-%m-%d %H:%M:%S"))
+
+
+def ingest_file(
+    source: str, log_root: str, rel_path: str, cutoff: datetime, batch_size: int = 1000
+) -> int:
+    """
+    Ingest the complete lines written since the last run, return the number of records.
+    The state is keyed by inode so a rotated file is finished under its new name.
+    Lines without a timestamp take the last one before them, or the ingest time.
+    Records DatabaseLogHandler has written are skipped with their following lines.
+    """
+    log_path = os.path.join(log_root, rel_path)
+    stat = os.stat(log_path)
+    state = LogIngestState.objects.filter(ino=stat.st_ino).first()
+    if state is None:
+        state = LogIngestState(source=source, ino=stat.st_ino)
+    if state.offset > stat.st_size:
+        # truncated, or the inode was reused by another file
+        state.offset = 0
+    if state.pk and state.offset == stat.st_size:
+        if state.file_path != rel_path:
+            state.file_path = rel_path
+            state.save()
+        return 0
+    state.file_path = rel_path
+
+    ingested = 0
+    ts = None
+    database_logged = False
+    with open(log_path, "rb") as f:
+        for offset, block in iter_blocks(f, state.offset, True):
+            ingest_time = timezone.now()
+            records = []
+            for line in block.decode("utf-8", errors="replace").split("\n"):
+                if not line.strip():
+                    continue
+                line_ts = parse_timestamp(line)
+                if line_ts:
+                    ts = line_ts
+                    database_logged = DATABASE_LOGGED in line
+                if database_logged:
+                    continue
+                timestamp = to_datetime(ts) if ts else ingest_time
+                if timestamp >= cutoff:
+                    records.append(parse_log_line(line, source, timestamp))
+
+            # records and offset are saved together, a crash never ingests a line twice
+            with transaction.atomic():
+                LogRecord.objects.bulk_create(records, batch_size=batch_size)
+                state.offset = offset + len(block)
+                state.save()
+            ingested += len(records)
+
+    if not state.pk:
+        state.save()
+    return ingested
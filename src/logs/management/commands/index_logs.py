@@ -0,0 +1,61 @@
+import os
+import time
+from django.core.management.base import BaseCommand
+from django.conf import settings
+
+from logs.search import build_index, get_index_path, get_log_roots, list_log_files
+
+
+class Command(BaseCommand):
+    help = "Build or update the search indexes of all log files, drop indexes of deleted logs"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--root",
+            choices=list(get_log_roots()),
+            default=None,
+            help="Only index one log root",
+        )
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Index every file from the start",
+        )
+
+    def handle(self, **options):
+        start = time.perf_counter()
+        for root_name, log_root in get_log_roots().items():
+            if options["root"] and root_name != options["root"]:
+                continue
+            if not os.path.isdir(log_root):
+                continue
+
+            indexed = 0
+            index_paths = set()
+            for rel_path in list_log_files(log_root):
+                index_path = get_index_path(root_name, rel_path)
+                index_paths.add(index_path)
+                try:
+                    build_index(
+                        os.path.join(log_root, rel_path), index_path, options["rebuild"]
+                    )
+                    indexed += 1
+                except (OSError, EOFError) as e:
+                    self.stdout.write(self.style.ERROR(f"[{rel_path}] Index failed: {e}"))
+
+            removed = 0
+            index_root = os.path.join(settings.LOG_INDEX_ROOT, root_name)
+            for dir_path, _, file_names in os.walk(index_root):
+                for file_name in file_names:
+                    index_path = os.path.join(dir_path, file_name)
+                    if index_path not in index_paths:
+                        os.remove(index_path)
+                        removed += 1
+
+            self.stdout.write(
+                f"[{root_name}] {indexed} files indexed, {removed} stale indexes removed"
+            )
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Done in {time.perf_counter() - start:.2f}s")
+        )
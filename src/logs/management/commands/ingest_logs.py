@@ -0,0 +1,80 @@
+import os
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils.timezone import now
+
+from logs.ingest import ingest_file
+from logs.models import LogRecord
+from logs.search import get_log_roots, list_log_files
+
+
+class Command(BaseCommand):
+    help = "Parse new lines of the backend and crawler logs into LogRecord and drop records older than the retention window"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--follow",
+            action="store_true",
+            help="Keep running and ingest new lines every interval",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=10.0,
+            help="Seconds between runs in follow mode",
+        )
+        parser.add_argument(
+            "--retention-days",
+            type=int,
+            default=settings.LOG_RETENTION_DAYS,
+            help="Days of records to keep",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Records per insert",
+        )
+
+    def handle(self, **options):
+        try:
+            while True:
+                self.ingest(options["retention_days"], options["batch_size"])
+                if not options["follow"]:
+                    break
+                close_old_connections()
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            pass
+
+    def ingest(self, retention_days: int, batch_size: int):
+        start = time.perf_counter()
+        cutoff = now() - timedelta(days=retention_days)
+
+        ingested = 0
+        for source, log_root in get_log_roots().items():
+            if not os.path.isdir(log_root):
+                continue
+            for rel_path in list_log_files(log_root):
+                # compressed rotations were ingested before they were compressed
+                if rel_path.endswith(".gz"):
+                    continue
+                if os.path.getmtime(os.path.join(log_root, rel_path)) < cutoff.timestamp():
+                    continue
+                try:
+                    ingested += ingest_file(source, log_root, rel_path, cutoff, batch_size)
+                except OSError as e:
+                    self.stdout.write(self.style.ERROR(f"[{rel_path}] Ingest failed: {e}"))
+
+        deleted, _ = LogRecord.objects.filter(timestamp__lt=cutoff).delete()
+
+        if ingested or deleted:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{ingested} records ingested, {deleted} expired records deleted "
+                    f"in {time.perf_counter() - start:.2f}s"
+                )
+            )
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.30 on 2026-10-19 14:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LogIngestState',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('source', models.CharField(help_text='Log root of the file', max_length=50)),
+                ('ino', models.BigIntegerField(help_text='Inode of the file, it stays the same when the file is rotated', unique=True)),
+                ('file_path', models.CharField(help_text='Last seen file path relative to the log root', max_length=1000)),
+                ('offset', models.BigIntegerField(default=0, help_text='Bytes ingested')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'logs_ingest_state',
+            },
+        ),
+        migrations.CreateModel(
+            name='LogRecord',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('timestamp', models.DateTimeField(help_text='Time of the log line')),
+                ('level', models.PositiveSmallIntegerField(choices=[(10, 'DEBUG'), (20, 'INFO'), (30, 'WARNING'), (40, 'ERROR'), (50, 'CRITICAL')], default=20, help_text='Python logging level')),
+                ('seiyuu', models.CharField(blank=True, help_text='Seiyuu id_name of the [id_name] prefix', max_length=20, null=True)),
+                ('source', models.CharField(help_text='Log root (backend, crawler) or logger name', max_length=50)),
+                ('message', models.TextField(help_text='The log line')),
+            ],
+            options={
+                'db_table': 'logs_log_record',
+                'indexes': [models.Index(fields=['timestamp', 'level', 'seiyuu'], name='logs_record_ts_level_seiyuu')],
+            },
+        ),
+    ]
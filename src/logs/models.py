@@ -1,3 +1,61 @@
+import logging
 from django.db import models
 
+
 # Create your models here.
+class LogRecord(models.Model):
+    class Meta:
+        db_table = "logs_log_record"
+        indexes = [
+            models.Index(
+                fields=["timestamp", "level", "seiyuu"],
+                name="logs_record_ts_level_seiyuu",
+            ),
+        ]
+
+    LEVEL_CHOICES = [
+        (logging.DEBUG, "DEBUG"),
+        (logging.INFO, "INFO"),
+        (logging.WARNING, "WARNING"),
+        (logging.ERROR, "ERROR"),
+        (logging.CRITICAL, "CRITICAL"),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    timestamp = models.DateTimeField(help_text="Time of the log line")
+    level = models.PositiveSmallIntegerField(
+        help_text="Python logging level", choices=LEVEL_CHOICES, default=logging.INFO
+    )
+    seiyuu = models.CharField(
+        help_text="Seiyuu id_name of the [id_name] prefix",
+        max_length=20,
+        blank=True,
+        null=True,
+    )
+    source = models.CharField(
+        help_text="Log root (backend, crawler) or logger name", max_length=50
+    )
+    message = models.TextField(help_text="The log line")
+
+    def __str__(self):
+        return f"[{self.get_level_display()}]-{self.timestamp}-{self.message[:50]}"
+
+
+class LogIngestState(models.Model):
+    class Meta:
+        db_table = "logs_ingest_state"
+
+    id = models.AutoField(primary_key=True)
+    source = models.CharField(help_text="Log root of the file", max_length=50)
+    ino = models.BigIntegerField(
+        help_text="Inode of the file, it stays the same when the file is rotated",
+        unique=True,
+    )
+    file_path = models.CharField(
+        help_text="Last seen file path relative to the log root", max_length=1000
+    )
+    offset = models.BigIntegerField(help_text="Bytes ingested", default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"[Log Ingest State]-{self.source}/{self.file_path}"
@@ -0,0 +1,475 @@
+import asyncio
+import gzip
+import json
+import os
+import queue
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from django.conf import settings
+from django.utils import timezone
+
+
+# lines are indexed and scanned in blocks of about this many uncompressed bytes
+BLOCK_SIZE = 256 * 1024
+INDEX_VERSION = 1
+
+# current and logrotate style names: x.log, x.log.1, x.log.2.gz
+LOG_FILE_RE = re.compile(r"\.(log|txt)(\.\d+)?(\.gz)?$")
+TIMESTAMP_RE = re.compile(r"^\[?(\d{4}-\d{2}-\d{2})[ T](\d{2}:\d{2})(:\d{2})?", re.MULTILINE)
+SEIYUU_RE = re.compile(r"\[(\w+)\]")
+TOKEN_RE = re.compile(rb"[0-9a-z_]+")
+REGEX_SPECIAL_RE = re.compile(r"[.^$*+?{}\[\]\\|()]")
+
+
+def get_log_roots() -> dict[str, str]:
+    return {
+        "backend": str(settings.BACKEND_LOG_ROOT),
+        "crawler": str(settings.CRAWLER_LOG_ROOT),
+    }
+
+
+def is_log_file(file_name: str) -> bool:
+    return LOG_FILE_RE.search(file_name) is not None
+
+
+def open_log(log_path: str):
+    if log_path.endswith(".gz"):
+        return gzip.open(log_path, "rb")
+    return open(log_path, "rb")
+
+
+def list_log_files(log_root: str, path: str = "") -> list[str]:
+    """
+    Log files under the path, relative to the log root, newest first
+    """
+    top = os.path.join(log_root, path)
+    if os.path.isfile(top):
+        return [path]
+
+    files = []
+    for dir_path, _, file_names in os.walk(top):
+        for file_name in file_names:
+            if is_log_file(file_name):
+                file_path = os.path.join(dir_path, file_name)
+                files.append((os.path.getmtime(file_path), file_path))
+    return [
+        os.path.relpath(file_path, log_root)
+        for _, file_path in sorted(files, reverse=True)
+    ]
+
+
+def parse_timestamp(line: str) -> str | None:
+    """
+    Leading timestamp of a line as "YYYY-MM-DD HH:MM:SS", comparable as a string
+    """
+    match = TIMESTAMP_RE.match(line)
+    if match is None:
+        return None
+    return normalize_timestamp(match)
+
+
+def normalize_timestamp(match: re.Match) -> str:
+    date, minutes, seconds = match.groups()
+    return f"{date} {minutes}{seconds or ':00'}"
+
+
+def format_timestamp(value: datetime) -> str:
+    # log timestamps are written in local time
+    if timezone.is_aware(value):
+        value = timezone.localtime(value)
+    return value.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def get_seiyuu(line: str) -> str | None:
+    match = SEIYUU_RE.search(line)
+    return match.group(1) if match else None
+
+
+def iter_blocks(f, offset: int, complete_lines: bool):
+    """
+    (offset, bytes) blocks of whole lines from offset to the end of the file.
+    With complete_lines a last line without newline is left out, it is still being written.
+    """
+    f.seek(offset)
+    rest = b""
+    while True:
+        data = f.read(BLOCK_SIZE)
+        if not data:
+            break
+        data = rest + data
+        last_newline = data.rfind(b"\n")
+        if last_newline == -1:
+            rest = data
+            continue
+        block, rest = data[: last_newline + 1], data[last_newline + 1 :]
+        yield offset, block
+        offset += len(block)
+    if rest and not complete_lines:
+        yield offset, rest
+
+
+def get_index_path(root_name: str, rel_path: str) -> str:
+    return os.path.join(settings.LOG_INDEX_ROOT, root_name, rel_path + ".idx.json")
+
+
+def load_index(log_path: str, index_path: str) -> dict | None:
+    """
+    The index of the log file, None if there is none or it belongs to another file
+    """
+    try:
+        with open(index_path) as f:
+            index = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+    stat = os.stat(log_path)
+    if index.get("version") != INDEX_VERSION or index["ino"] != stat.st_ino:
+        return None
+    if log_path.endswith(".gz"):
+        if index["mtime_ns"] != stat.st_mtime_ns:
+            return None
+    elif stat.st_size < index["size"]:
+        # truncated
+        return None
+    return index
+
+
+def build_index(log_path: str, index_path: str, rebuild: bool = False) -> dict:
+    """
+    Index blocks of the log file by timestamp range, seiyuu and tokens.
+    A growing log is indexed incrementally from the end of the previous index.
+    """
+    stat = os.stat(log_path)
+    index = None if rebuild else load_index(log_path, index_path)
+    if index is None:
+        index = {
+            "version": INDEX_VERSION,
+            "ino": stat.st_ino,
+            "size": 0,
+            "lines": 0,
+            "last_ts": None,
+            "blocks": [],
+            "tokens": {},
+        }
+    elif log_path.endswith(".gz") or index["size"] == stat.st_size:
+        return index
+
+    index["mtime_ns"] = stat.st_mtime_ns
+    compressed = log_path.endswith(".gz")
+    with open_log(log_path) as f:
+        for offset, block in iter_blocks(f, index["size"], not compressed):
+            block_id = len(index["blocks"])
+            ts = index["last_ts"]
+            entry = {
+                "offset": offset,
+                "length": len(block),
+                "first_line": index["lines"],
+                "start_ts": ts,
+                "min_ts": None,
+                "max_ts": None,
+                "untimed": False,
+                "seiyuu": [],
+            }
+            seiyuu = set()
+            lines = block.decode("utf-8", errors="replace").split("\n")
+            if block.endswith(b"\n"):
+                lines.pop()
+            for line in lines:
+                ts = parse_timestamp(line) or ts
+                if ts is None:
+                    entry["untimed"] = True
+                else:
+                    entry["min_ts"] = min(entry["min_ts"] or ts, ts)
+                    entry["max_ts"] = max(entry["max_ts"] or ts, ts)
+                line_seiyuu = get_seiyuu(line)
+                if line_seiyuu:
+                    seiyuu.add(line_seiyuu)
+            entry["seiyuu"] = sorted(seiyuu)
+
+            for token in set(TOKEN_RE.findall(block.lower())):
+                index["tokens"].setdefault(token.decode(), []).append(block_id)
+
+            index["blocks"].append(entry)
+            index["lines"] += len(lines)
+            index["size"] = offset + len(block)
+            index["last_ts"] = ts
+
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    tmp_path = f"{index_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(index, f, separators=(",", ":"))
+    os.replace(tmp_path, index_path)
+    return index
+
+
+def get_literal_tokens(pattern: str) -> list[tuple[str, bool, bool]]:
+    """
+    Tokens a line must contain for a pattern without regex syntax, as
+    (token, starts at a token boundary, ends at a token boundary).
+    The first and last token may be part of a longer token in the log.
+    """
+    if REGEX_SPECIAL_RE.search(pattern):
+        return []
+    literal = pattern.lower().encode()
+    tokens = []
+    for match in TOKEN_RE.finditer(literal):
+        tokens.append(
+            (match.group().decode(), match.start() > 0, match.end() < len(literal))
+        )
+    return tokens
+
+
+def match_token_blocks(index: dict, token: str, start_exact: bool, end_exact: bool) -> set[int]:
+    if start_exact and end_exact:
+        return set(index["tokens"].get(token, []))
+    blocks = set()
+    for key, postings in index["tokens"].items():
+        if (
+            (start_exact and key.startswith(token))
+            or (end_exact and key.endswith(token))
+            or (not start_exact and not end_exact and token in key)
+        ):
+            blocks.update(postings)
+    return blocks
+
+
+# background index builds started by searches, one at a time
+index_executor = ThreadPoolExecutor(max_workers=1)
+indexing = set()
+indexing_lock = threading.Lock()
+
+
+def schedule_index(log_path: str, index_path: str):
+    with indexing_lock:
+        if log_path in indexing:
+            return
+        indexing.add(log_path)
+
+    def run():
+        try:
+            build_index(log_path, index_path)
+        except (OSError, EOFError):
+            pass
+        finally:
+            with indexing_lock:
+                indexing.discard(log_path)
+
+    index_executor.submit(run)
+
+
+class LogSearch(object):
+
+    def __init__(
+        self,
+        root_name: str,
+        pattern: str,
+        path: str = "",
+        ignore_case: bool = False,
+        seiyuu: str | None = None,
+        start_date: datetime | None = None,
+        end_date: datetime | None = None,
+        limit: int = 1000,
+    ):
+        """
+        Search the log files under path of a log root, matches are put in a queue
+        in batches by run(), files are searched in parallel
+        """
+        self.root_name = root_name
+        self.log_root = get_log_roots()[root_name]
+        self.path = path
+        self.regex = re.compile(pattern, re.MULTILINE | (re.IGNORECASE if ignore_case else 0))
+        self.tokens = get_literal_tokens(pattern)
+        self.seiyuu = seiyuu
+        self.start_date = start_date
+        self.start_ts = format_timestamp(start_date) if start_date else None
+        self.end_ts = format_timestamp(end_date) if end_date else None
+        self.limit = limit
+
+        self.stop = threading.Event()
+        self.lock = threading.Lock()
+        self.stats = {
+            "files": 0,
+            "indexed_files": 0,
+            "blocks_scanned": 0,
+            "blocks_skipped": 0,
+            "matches": 0,
+            "truncated": False,
+        }
+
+    def run(self, results: queue.Queue):
+        try:
+            files = list_log_files(self.log_root, self.path)
+            if self.start_date is not None:
+                # nothing was written to a file after its mtime
+                start = self.start_date.timestamp()
+                files = [
+                    rel_path
+                    for rel_path in files
+                    if os.path.getmtime(os.path.join(self.log_root, rel_path)) >= start
+                ]
+            with ThreadPoolExecutor(max_workers=settings.LOG_SEARCH_WORKERS) as executor:
+                for rel_path in files:
+                    executor.submit(self.search_file, rel_path, results)
+        finally:
+            self.put(results, None)
+
+    def put(self, results: queue.Queue, batch: list[dict] | None):
+        # a full queue means a slow client, give up once the client is gone
+        while True:
+            try:
+                results.put(batch, timeout=1)
+                return
+            except queue.Full:
+                if self.stop.is_set():
+                    return
+
+    def skip_block(self, index: dict, block_id: int, candidates: set[int] | None) -> bool:
+        block = index["blocks"][block_id]
+        if candidates is not None and block_id not in candidates:
+            return True
+        if self.seiyuu and self.seiyuu not in block["seiyuu"]:
+            return True
+        if not block["untimed"]:
+            if self.start_ts and block["max_ts"] < self.start_ts:
+                return True
+            if self.end_ts and block["min_ts"] > self.end_ts:
+                return True
+        return False
+
+    def search_file(self, rel_path: str, results: queue.Queue):
+        if self.stop.is_set():
+            return
+        log_path = os.path.join(self.log_root, rel_path)
+        index_path = get_index_path(self.root_name, rel_path)
+        try:
+            index = load_index(log_path, index_path)
+            blocks = []
+            if index is not None:
+                candidates = None
+                for token, start_exact, end_exact in self.tokens:
+                    token_blocks = match_token_blocks(index, token, start_exact, end_exact)
+                    candidates = token_blocks if candidates is None else candidates & token_blocks
+                for block_id, block in enumerate(index["blocks"]):
+                    if self.skip_block(index, block_id, candidates):
+                        with self.lock:
+                            self.stats["blocks_skipped"] += 1
+                    else:
+                        blocks.append(block)
+
+            with open_log(log_path) as f:
+                # indexed blocks, then the part written after the index
+                for block in blocks:
+                    if self.stop.is_set():
+                        return
+                    f.seek(block["offset"])
+                    self.search_block(
+                        rel_path,
+                        f.read(block["length"]),
+                        block["offset"],
+                        block["first_line"],
+                        block["start_ts"],
+                        results,
+                    )
+                offset = index["size"] if index else 0
+                line_no = index["lines"] if index else 0
+                ts = index["last_ts"] if index else None
+                for offset, block in iter_blocks(f, offset, False):
+                    if self.stop.is_set():
+                        return
+                    line_no, ts = self.search_block(
+                        rel_path, block, offset, line_no, ts, results
+                    )
+        except (OSError, EOFError) as e:
+            self.put(results, [{"file": rel_path, "error": str(e)}])
+            return
+
+        with self.lock:
+            self.stats["files"] += 1
+            if index is not None:
+                self.stats["indexed_files"] += 1
+        if index is None or os.path.getsize(log_path) - index["size"] > BLOCK_SIZE:
+            schedule_index(log_path, index_path)
+
+    def search_block(
+        self,
+        rel_path: str,
+        block: bytes,
+        offset: int,
+        line_no: int,
+        ts: str | None,
+        results: queue.Queue,
+    ) -> tuple[int, str | None]:
+        """
+        Put the matching lines of the block, return the line number and
+        timestamp in effect after it
+        """
+        with self.lock:
+            self.stats["blocks_scanned"] += 1
+        lines = block.split(b"\n")
+        if block.endswith(b"\n"):
+            lines.pop()
+
+        text = block.decode("utf-8", errors="replace")
+        if not self.regex.search(text):
+            # no line can match, only the timestamp in effect is needed
+            match = None
+            for match in TIMESTAMP_RE.finditer(text):
+                pass
+            if match is not None:
+                ts = normalize_timestamp(match)
+            return line_no + len(lines), ts
+
+        batch = []
+        for raw_line in lines:
+            line = raw_line.decode("utf-8", errors="replace")
+            ts = parse_timestamp(line) or ts
+            if (
+                self.regex.search(line)
+                and not (self.seiyuu and get_seiyuu(line) != self.seiyuu)
+                and not (ts and self.start_ts and ts < self.start_ts)
+                and not (ts and self.end_ts and ts > self.end_ts)
+            ):
+                batch.append(
+                    {
+                        "file": rel_path,
+                        "line": line_no + 1,
+                        "offset": offset,
+                        "time": ts,
+                        "seiyuu": get_seiyuu(line),
+                        "text": line,
+                    }
+                )
+            line_no += 1
+            offset += len(raw_line) + 1
+
+        if batch:
+            with self.lock:
+                batch = batch[: self.limit - self.stats["matches"]]
+                self.stats["matches"] += len(batch)
+                if self.stats["matches"] >= self.limit:
+                    self.stats["truncated"] = True
+                    self.stop.set()
+            if batch:
+                self.put(results, batch)
+        return line_no, ts
+
+
+async def stream_search(search: LogSearch):
+    """
+    NDJSON lines of the matches as the files are searched, then a summary line
+    """
+    results = queue.Queue(maxsize=64)
+    threading.Thread(target=search.run, args=(results,), daemon=True).start()
+    try:
+        while True:
+            batch = await asyncio.to_thread(results.get)
+            if batch is None:
+                break
+            yield "".join(json.dumps(item, ensure_ascii=False) + "\n" for item in batch)
+        yield json.dumps({"done": True, **search.stats}) + "\n"
+    finally:
+        # the client is gone or the search is done
+        search.stop.set()
@@ -0,0 +1,88 @@
+import re
+from django.conf import settings
+from rest_framework import serializers
+
+from .models import LogRecord
+from .search import get_log_roots
+from .utils import is_within_root
+
+
+class LogReadQuerySerializer(serializers.Serializer):
+    offset = serializers.IntegerField(required=False, min_value=0)
+    length = serializers.IntegerField(
+        required=False, min_value=1, max_value=settings.LOG_MAX_READ_BYTES
+    )
+    tail = serializers.IntegerField(required=False, min_value=1)
+    before = serializers.IntegerField(required=False, min_value=0)
+
+    def validate(self, attrs):
+        if "offset" in attrs and ("tail" in attrs or "before" in attrs):
+            raise serializers.ValidationError(
+                "offset reads forward, it can't be combined with tail or before"
+            )
+        return attrs
+
+
+class LogListQuerySerializer(serializers.Serializer):
+    sort = serializers.ChoiceField(
+        choices=["name", "size", "mtime"], required=False, default="name"
+    )
+    order = serializers.ChoiceField(choices=["asc", "desc"], required=False, default="asc")
+    page = serializers.IntegerField(required=False, min_value=1, default=1)
+    page_size = serializers.IntegerField(
+        required=False, min_value=1, max_value=1000, default=100
+    )
+
+
+class LogSearchQuerySerializer(serializers.Serializer):
+    root_name = serializers.ChoiceField(choices=["backend", "crawler"])
+    path = serializers.CharField(required=False, default="")
+    pattern = serializers.CharField()
+    ignore_case = serializers.BooleanField(required=False, default=False)
+    seiyuu = serializers.CharField(required=False)
+    start_date = serializers.DateTimeField(required=False)
+    end_date = serializers.DateTimeField(required=False)
+    limit = serializers.IntegerField(
+        required=False,
+        min_value=1,
+        max_value=settings.LOG_SEARCH_MAX_RESULTS,
+        default=settings.LOG_SEARCH_MAX_RESULTS,
+    )
+
+    def validate(self, attrs):
+        if not is_within_root(get_log_roots()[attrs["root_name"]], attrs["path"]):
+            raise serializers.ValidationError(
+                {"path": "Path must be within the log root"}
+            )
+        return attrs
+
+    def validate_pattern(self, value):
+        try:
+            re.compile(value)
+        except re.error as e:
+            raise serializers.ValidationError(f"Invalid regex: {e}")
+        return value
+
+
+class LogRecordSerializer(serializers.ModelSerializer):
+    level = serializers.CharField(source="get_level_display")
+
+    class Meta:
+        model = LogRecord
+        fields = ["id", "timestamp", "level", "seiyuu", "source", "message"]
+        read_only_fields = fields
+
+
+class LogRecordQuerySerializer(serializers.Serializer):
+    start_date = serializers.DateTimeField(required=False)
+    end_date = serializers.DateTimeField(required=False)
+    level = serializers.ChoiceField(
+        choices=[name for _, name in LogRecord.LEVEL_CHOICES],
+        required=False,
+        help_text="Minimum level",
+    )
+    seiyuu = serializers.CharField(required=False, help_text="Seiyuu id_name")
+    source = serializers.CharField(required=False)
+    search = serializers.CharField(required=False, help_text="Text in the message")
+    page = serializers.IntegerField(required=False, min_value=1)
+    page_size = serializers.IntegerField(required=False, min_value=1, max_value=100)
@@ -1,3 +1,349 @@
-from django.test import TestCase
+import gzip
+import logging
+import os
+import queue
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .handlers import DatabaseLogHandler
+from .ingest import ingest_file
+from .models import LogIngestState, LogRecord
+from .search import LogSearch, build_index, get_index_path, index_executor
+from .serializers import LogSearchQuerySerializer
+from .utils import resolve_log_path
+
+
+class LogPathTest(SimpleTestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.log_root = os.path.join(tmp_dir.name, "logs")
+        os.makedirs(os.path.join(self.log_root, "a"))
+
+    def test_paths_within_root(self):
+        self.assertEqual(
+            resolve_log_path(self.log_root, "a/x.log"),
+            os.path.join(self.log_root, "a/x.log"),
+        )
+        self.assertEqual(
+            resolve_log_path(self.log_root, "a/../x.log"),
+            os.path.join(self.log_root, "a/../x.log"),
+        )
+
+    def test_paths_escaping_root(self):
+        for path in ["", "..", "../secret", "a/../../secret", "/etc/passwd"]:
+            self.assertEqual(resolve_log_path(self.log_root, path), self.log_root)
+
+    def test_symlink_escaping_root(self):
+        os.symlink(os.path.dirname(self.log_root), os.path.join(self.log_root, "link"))
+        self.assertEqual(resolve_log_path(self.log_root, "link/secret"), self.log_root)
+
+    def test_search_path(self):
+        with override_settings(BACKEND_LOG_ROOT=self.log_root):
+            serializer = LogSearchQuerySerializer(
+                data={"root_name": "backend", "path": "a/../../secret", "pattern": "x"}
+            )
+            self.assertFalse(serializer.is_valid())
+            self.assertIn("path", serializer.errors)
+
+            serializer = LogSearchQuerySerializer(
+                data={"root_name": "backend", "path": "a", "pattern": "x"}
+            )
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+
+
+class LogSearchTest(SimpleTestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.log_root = os.path.join(tmp_dir.name, "logs")
+        os.makedirs(self.log_root)
+        settings_override = override_settings(
+            BACKEND_LOG_ROOT=self.log_root,
+            LOG_INDEX_ROOT=os.path.join(tmp_dir.name, "index"),
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        # wait for the index builds started by the searches
+        self.addCleanup(lambda: index_executor.submit(lambda: None).result())
+
+        with open(os.path.join(self.log_root, "post.log"), "w") as f:
+            f.write(
+                "2024-01-02 10:00:00 [kaorin] Post success\n"
+                "2024-01-02 11:00:00 [aina] Post failed\n"
+                "Traceback without timestamp\n"
+                "2024-01-03 10:00:00 [kaorin] Post failed\n"
+            )
+        with gzip.open(os.path.join(self.log_root, "post.log.1.gz"), "wt") as f:
+            f.write("2024-01-01 10:00:00 [kaorin] Post failed\n")
+
+    def search(self, pattern, **kwargs) -> tuple[list[dict], dict]:
+        search = LogSearch("backend", pattern, **kwargs)
+        results = queue.Queue()
+        search.run(results)
+        matches = []
+        while (batch := results.get_nowait()) is not None:
+            matches.extend(batch)
+        return sorted(matches, key=lambda match: match["time"]), search.stats
+
+    def test_search(self):
+        matches, stats = self.search("failed")
+        self.assertEqual(
+            [(match["file"], match["line"], match["seiyuu"]) for match in matches],
+            [
+                ("post.log.1.gz", 1, "kaorin"),
+                ("post.log", 2, "aina"),
+                ("post.log", 4, "kaorin"),
+            ],
+        )
+        self.assertEqual(stats["files"], 2)
+
+    def test_filters(self):
+        matches, _ = self.search("Post", seiyuu="kaorin")
+        self.assertEqual(
+            [match["time"][:10] for match in matches],
+            ["2024-01-01", "2024-01-02", "2024-01-03"],
+        )
+
+        matches, _ = self.search(
+            "Post",
+            start_date=datetime(2024, 1, 2, 10, 30),
+            end_date=datetime(2024, 1, 2, 12, 0),
+        )
+        self.assertEqual([match["seiyuu"] for match in matches], ["aina"])
+
+        # a line without timestamp has the one of the line before it
+        matches, _ = self.search("^Traceback")
+        self.assertEqual(matches[0]["time"], "2024-01-02 11:00:00")
+
+        matches, stats = self.search("Post", limit=2)
+        self.assertEqual(len(matches), 2)
+        self.assertTrue(stats["truncated"])
+
+    def test_indexed_search(self):
+        for rel_path in ("post.log", "post.log.1.gz"):
+            log_path = os.path.join(self.log_root, rel_path)
+            build_index(log_path, get_index_path("backend", rel_path))
+        matches, stats = self.search("failed", seiyuu="aina")
+        self.assertEqual([match["line"] for match in matches], [2])
+        self.assertEqual(stats["indexed_files"], 2)
+        # the rotated file has no line of aina
+        self.assertEqual(stats["blocks_skipped"], 1)
+
+        matches, _ = self.search("nothing matches this")
+        self.assertEqual(matches, [])
+
+
+class LogStreamTest(TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        settings_override = override_settings(BACKEND_LOG_ROOT=tmp_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        with open(os.path.join(tmp_dir.name, "post.log"), "w") as f:
+            f.write("2024-01-02 10:00:00 [kaorin] Post success\n")
+        self.client = APIClient()
+        self.client.force_authenticate(
+            get_user_model().objects.create_user(username="admin", password="x")
+        )
+        self.url = reverse("stream_backend_log_file", kwargs={"path": "post.log"})
+
+    def test_invalid_offset(self):
+        for offset in ["-1", "abc", "²"]:
+            response = self.client.get(self.url, {"offset": offset})
+            self.assertEqual(response.status_code, 400, offset)
+        # a unicode digit int() can parse is rejected as well
+        response = self.client.get(self.url, HTTP_LAST_EVENT_ID="٣")
+        self.assertEqual(response.status_code, 400)
+
+
+class DatabaseLogHandlerTest(TransactionTestCase):
+    def test_write(self):
+        handler = DatabaseLogHandler(capacity=100, flush_interval=60)
+        logger = logging.getLogger("logs.tests.handler")
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+        # not to the handlers of the "logs" logger
+        logger.propagate = False
+        self.addCleanup(setattr, logger, "propagate", True)
+
+        logger.info("[kaorin] Post success")
+        # buffered until an error, the capacity or the flush interval
+        self.assertFalse(LogRecord.objects.exists())
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                logger.error("[aina] Post failed")
+                raise ValueError
+        handler.close()
+
+        # written on its own connection, the rollback doesn't drop them
+        self.assertEqual(
+            list(
+                LogRecord.objects.order_by("id").values_list(
+                    "seiyuu", "level", "source"
+                )
+            ),
+            [
+                ("kaorin", logging.INFO, "logs.tests.handler"),
+                ("aina", logging.ERROR, "logs.tests.handler"),
+            ],
+        )
+
+
+class LogIngestTest(TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.log_root = tmp_dir.name
+
+    def write(self, rel_path: str, text: str, mode: str = "a"):
+        with open(os.path.join(self.log_root, rel_path), mode) as f:
+            f.write(text)
+
+    def ingest(self, rel_path: str = "post.log") -> int:
+        cutoff = datetime(2000, 1, 1, tzinfo=dt_timezone.utc)
+        return ingest_file("backend", self.log_root, rel_path, cutoff)
+
+    def messages(self) -> list[str]:
+        return list(LogRecord.objects.order_by("id").values_list("message", flat=True))
+
+    def test_new_lines(self):
+        self.write(
+            "post.log",
+            "2024-01-02 10:00:00 [kaorin] Post success\n"
+            # written by DatabaseLogHandler, skipped with its traceback
+            "2024-01-02 10:00:01 {db} ERROR core.utils: [kaorin] Lookup failed\n"
+            "Traceback (most recent call last):\n"
+            "2024-01-02 10:00:02 [aina] Post failed\n"
+            "Retrying later\n"
+            "incomplete",
+        )
+        self.assertEqual(self.ingest(), 3)
+        self.assertEqual(
+            list(LogRecord.objects.order_by("id").values_list("seiyuu", "level")),
+            [("kaorin", logging.INFO), ("aina", logging.ERROR), (None, logging.INFO)],
+        )
+        # a line without timestamp has the one of the line before it
+        self.assertEqual(
+            timezone.localtime(LogRecord.objects.latest("id").timestamp).strftime(
+                "%H:%M:%S"
+            ),
+            "10:00:02",
+        )
+
+        self.write("post.log", " line\n")
+        self.assertEqual(self.ingest(), 1)
+        self.assertEqual(self.messages()[-1], "incomplete line")
+        self.assertEqual(self.ingest(), 0)
+
+    def test_rotation_and_truncation(self):
+        self.write("post.log", "2024-01-02 10:00:00 [a] one\n")
+        self.assertEqual(self.ingest(), 1)
+
+        # rotated after another line, the state follows the inode
+        self.write("post.log", "2024-01-02 10:00:01 [a] two\n")
+        os.rename(
+            os.path.join(self.log_root, "post.log"),
+            os.path.join(self.log_root, "post.log.1"),
+        )
+        self.write("post.log", "2024-01-02 10:00:02 [a] three\n")
+        self.assertEqual(self.ingest("post.log.1"), 1)
+        self.assertEqual(self.ingest(), 1)
+        self.assertEqual(
+            sorted(LogIngestState.objects.values_list("file_path", flat=True)),
+            ["post.log", "post.log.1"],
+        )
+
+        # truncated in place, read again from the start
+        self.write("post.log", "2024-01-02 10:00:03 four\n", mode="w")
+        self.assertEqual(self.ingest(), 1)
+        self.assertEqual(
+            self.messages()[-3:],
+            [
+                "2024-01-02 10:00:01 [a] two",
+                "2024-01-02 10:00:02 [a] three",
+                "2024-01-02 10:00:03 four",
+            ],
+        )
+
+    def test_retention(self):
+        LogRecord.objects.bulk_create(
+            [
+                LogRecord(
+                    timestamp=timezone.now() - timedelta(days=days), message=str(days)
+                )
+                for days in (1, 40)
+            ]
+        )
+        with override_settings(
+            BACKEND_LOG_ROOT=self.log_root, CRAWLER_LOG_ROOT=self.log_root
+        ):
+            call_command(
+                "ingest_logs", retention_days=30, stdout=StringIO()
+            )
+        self.assertEqual(self.messages(), ["1"])
+
+
+class LogRecordListTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        start = datetime(2024, 1, 2, tzinfo=dt_timezone.utc)
+        LogRecord.objects.bulk_create(
+            [
+                LogRecord(
+                    timestamp=start + timedelta(hours=i),
+                    level=level,
+                    seiyuu=seiyuu,
+                    source=source,
+                    message=message,
+                )
+                for i, (level, seiyuu, source, message) in enumerate(
+                    [
+                        (logging.INFO, "kaorin", "backend", "Post success"),
+                        (logging.ERROR, "kaorin", "backend", "Post failed"),
+                        (logging.WARNING, "aina", "crawler", "Slow lookup"),
+                        (logging.ERROR, None, "core.utils", "Lookup failed"),
+                    ]
+                )
+            ]
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(
+            get_user_model().objects.create_user(username="admin", password="x")
+        )
+
+    def list(self, **params) -> list[str]:
+        response = self.client.get(reverse("list_log_records"), params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return [record["message"] for record in response.data["results"]]
+
+    def test_filters(self):
+        # newest first
+        self.assertEqual(
+            self.list(),
+            ["Lookup failed", "Slow lookup", "Post failed", "Post success"],
+        )
+        self.assertEqual(
+            self.list(level="WARNING"), ["Lookup failed", "Slow lookup", "Post failed"]
+        )
+        self.assertEqual(self.list(seiyuu="kaorin"), ["Post failed", "Post success"])
+        self.assertEqual(self.list(source="core.utils"), ["Lookup failed"])
+        self.assertEqual(self.list(search="FAILED"), ["Lookup failed", "Post failed"])
+        self.assertEqual(
+            self.list(
+                start_date="2024-01-02T01:00:00Z", end_date="2024-01-02T02:00:00Z"
+            ),
+            ["Slow lookup", "Post failed"],
+        )
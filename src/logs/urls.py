@@ -2,6 +2,8 @@ from django.urls import include, path
 from . import views
 
 urlpatterns = [
+    path("search/", views.search_logs, name="search_logs"),
+    path("records/", views.list_log_records, name="list_log_records"),
     path(
         "backend/<path:path>",
         views.serve_backend_log_file_or_directory,
@@ -12,4 +14,14 @@ urlpatterns = [
         views.serve_crawler_log_file_or_directory,
         name="serve_crawler_log_file_or_directory",
     ),
+    path(
+        "stream/backend/<path:path>",
+        views.stream_backend_log_file,
+        name="stream_backend_log_file",
+    ),
+    path(
+        "stream/crawler/<path:path>",
+        views.stream_crawler_log_file,
+        name="stream_crawler_log_file",
+    ),
 ]
@@ -0,0 +1,250 @@
+import asyncio
+import os
+import stat
+import time
+from datetime import datetime, timezone
+from django.conf import settings
+from django.core.cache import cache
+
+
+# block size when reading backwards from a cursor
+BACKWARD_BLOCK_SIZE = 64 * 1024
+
+# max bytes pushed in one server-sent event
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def is_within_root(log_root, path: str) -> bool:
+    """
+    If the path, relative to the log root, stays in it once ".." and symlinks are resolved
+    """
+    root = os.path.realpath(log_root)
+    return os.path.commonpath([root, os.path.realpath(os.path.join(root, path))]) == root
+
+
+def resolve_log_path(log_root, path: str) -> str:
+    """
+    Ensure the requested path is within the log root, fall back to the root otherwise
+    """
+    if path and is_within_root(log_root, path):
+        return os.path.join(log_root, path)
+    return str(log_root)
+
+
+def scan_directory(log_path: str) -> list[dict]:
+    """
+    Entries of the directory with size, mtime and type, cached until the directory
+    changes. Adding, removing or renaming a file changes the directory mtime, sizes
+    of files that are still growing are refreshed after LOG_LISTING_CACHE_TIMEOUT.
+    """
+    cache_key = f"logs:scandir:{log_path}:{os.stat(log_path).st_mtime_ns}"
+    entries = cache.get(cache_key)
+    if entries is not None:
+        return entries
+
+    entries = []
+    with os.scandir(log_path) as it:
+        for entry in it:
+            try:
+                entry_stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            if stat.S_ISDIR(entry_stat.st_mode):
+                entry_type = "dir"
+            elif stat.S_ISREG(entry_stat.st_mode):
+                entry_type = "file"
+            else:
+                entry_type = "other"
+            entries.append(
+                {
+                    "name": entry.name,
+                    "type": entry_type,
+                    "size": entry_stat.st_size,
+                    "mtime": entry_stat.st_mtime,
+                }
+            )
+
+    cache.set(cache_key, entries, settings.LOG_LISTING_CACHE_TIMEOUT)
+    return entries
+
+
+def sort_entries(entries: list[dict], sort: str, order: str) -> list[dict]:
+    """
+    Directories first, then by the sort key
+    """
+    reverse = order == "desc"
+    entries = sorted(entries, key=lambda entry: entry[sort], reverse=reverse)
+    return sorted(entries, key=lambda entry: entry["type"] != "dir")
+
+
+def format_entry(entry: dict) -> dict:
+    return {
+        **entry,
+        "mtime": datetime.fromtimestamp(entry["mtime"], tz=timezone.utc).isoformat(),
+    }
+
+
+def read_forward(log_path: str, offset: int, length: int) -> dict:
+    """
+    Read up to length bytes from offset, cut at the last complete line unless
+    the end of the file is reached
+    """
+    size = os.path.getsize(log_path)
+    offset = min(offset, size)
+    length = min(length, settings.LOG_MAX_READ_BYTES)
+
+    with open(log_path, "rb") as f:
+        f.seek(offset)
+        chunk = f.read(length)
+
+    end = offset + len(chunk)
+    if end < size:
+        last_newline = chunk.rfind(b"\n")
+        # a single line longer than length is returned cut
+        if last_newline != -1:
+            chunk = chunk[: last_newline + 1]
+            end = offset + len(chunk)
+
+    return {
+        "log": chunk.decode("utf-8", errors="replace"),
+        "offset": offset,
+        "next_offset": end,
+        "prev_offset": offset if offset > 0 else None,
+        "size": size,
+    }
+
+
+def read_backward(
+    log_path: str, before: int | None, lines: int | None, length: int | None
+) -> dict:
+    """
+    Read the last lines (or length bytes) before the byte cursor, default is the
+    end of the file. The buffer never grows over LOG_MAX_READ_BYTES.
+    """
+    size = os.path.getsize(log_path)
+    end = size if before is None else min(before, size)
+    max_bytes = min(length or settings.LOG_MAX_READ_BYTES, settings.LOG_MAX_READ_BYTES)
+
+    blocks = []
+    start = end
+    newlines = 0
+    with open(log_path, "rb") as f:
+        while start > 0 and end - start < max_bytes:
+            block_size = min(BACKWARD_BLOCK_SIZE, start, max_bytes - (end - start))
+            start -= block_size
+            f.seek(start)
+            block = f.read(block_size)
+            blocks.append(block)
+            newlines += block.count(b"\n")
+            # one more newline than lines, the one at the cursor ends the last line
+            if lines is not None and newlines > lines:
+                break
+
+        line_start = start == 0
+        if not line_start:
+            f.seek(start - 1)
+            line_start = f.read(1) == b"\n"
+
+    chunk = b"".join(reversed(blocks))
+
+    if not line_start:
+        # the first line is cut by the byte limit, start at the next complete one
+        first_newline = chunk.find(b"\n")
+        if first_newline != -1 and first_newline + 1 < len(chunk):
+            chunk = chunk[first_newline + 1 :]
+            start += first_newline + 1
+
+    if lines is not None:
+        position = len(chunk) - 1 if chunk.endswith(b"\n") else len(chunk)
+        for _ in range(lines):
+            position = chunk.rfind(b"\n", 0, position)
+            if position == -1:
+                break
+        if position != -1:
+            chunk = chunk[position + 1 :]
+            start += position + 1
+
+    return {
+        "log": chunk.decode("utf-8", errors="replace"),
+        "offset": start,
+        "next_offset": end,
+        "prev_offset": start if start > 0 else None,
+        "size": size,
+    }
+
+
+def format_event(data: str, event_id: int | None = None, event: str | None = None) -> str:
+    lines = []
+    if event is not None:
+        lines.append(f"event: {event}")
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.extend(f"data: {line}" for line in data.split("\n"))
+    return "\n".join(lines) + "\n\n"
+
+
+def read_appended(log_path: str, offset: int) -> tuple[bytes, int]:
+    """
+    Complete lines written after offset, at most STREAM_CHUNK_SIZE bytes
+    """
+    with open(log_path, "rb") as f:
+        f.seek(offset)
+        chunk = f.read(STREAM_CHUNK_SIZE)
+    last_newline = chunk.rfind(b"\n")
+    if last_newline != -1:
+        chunk = chunk[: last_newline + 1]
+    elif len(chunk) < STREAM_CHUNK_SIZE:
+        # wait until the line is finished
+        chunk = b""
+    return chunk, offset + len(chunk)
+
+
+async def follow_log_file(log_path: str, offset: int | None):
+    """
+    Server-sent events of the lines appended to the log file.
+    The event id is the byte offset after the event, so a reconnecting client
+    resumes with Last-Event-ID. The file is only read when its size changes,
+    a connection holds no more than one chunk and no open file.
+    """
+    size = os.path.getsize(log_path)
+    if offset is None or offset > size:
+        offset = size
+
+    yield f"retry: {settings.LOG_STREAM_RETRY_MS}\n"
+    yield format_event("", event_id=offset, event="open")
+
+    started = time.monotonic()
+    last_sent = started
+    while time.monotonic() - started < settings.LOG_STREAM_MAX_SECONDS:
+        try:
+            size = os.path.getsize(log_path)
+        except FileNotFoundError:
+            # rotated away, the new file shows up with the same name
+            size = 0
+
+        if size < offset:
+            # truncated or rotated, start over from the beginning of the new file
+            offset = 0
+            yield format_event("", event_id=offset, event="reset")
+            last_sent = time.monotonic()
+
+        if size > offset:
+            try:
+                chunk, offset = read_appended(log_path, offset)
+            except FileNotFoundError:
+                chunk = b""
+            if chunk:
+                yield format_event(
+                    chunk.decode("utf-8", errors="replace").rstrip("\n"),
+                    event_id=offset,
+                )
+                last_sent = time.monotonic()
+                # more is waiting, read it without sleeping
+                if offset < size:
+                    continue
+
+        if time.monotonic() - last_sent >= settings.LOG_STREAM_HEARTBEAT:
+            yield ": heartbeat\n\n"
+            last_sent = time.monotonic()
+
+        await asyncio.sleep(settings.LOG_STREAM_POLL_INTERVAL)
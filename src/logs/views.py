@@ -1,7 +1,10 @@
 import os
 from django.conf import settings
-from rest_framework.decorators import api_view, permission_classes
+from django.core.paginator import Paginator
+from django.http import StreamingHttpResponse
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 
 from drf_spectacular.utils import (
@@ -13,8 +16,136 @@ from drf_spectacular.utils import (
     OpenApiParameter,
 )
 
+from core.paginators import StandardResultsSetPagination
 
-def load_log_file_or_directory(log_path: str) -> Response:
+from .renderers import EventStreamRenderer
+from .search import LogSearch, stream_search
+from .models import LogRecord
+from .serializers import (
+    LogListQuerySerializer,
+    LogReadQuerySerializer,
+    LogRecordQuerySerializer,
+    LogRecordSerializer,
+    LogSearchQuerySerializer,
+)
+from .utils import (
+    follow_log_file,
+    format_entry,
+    read_backward,
+    read_forward,
+    resolve_log_path,
+    scan_directory,
+    sort_entries,
+)
+
+
+LOG_READ_PARAMETERS = [
+    OpenApiParameter(
+        name="offset",
+        type=int,
+        location=OpenApiParameter.QUERY,
+        required=False,
+        description="Byte offset to read forward from, use next_offset of the previous response to follow the file",
+    ),
+    OpenApiParameter(
+        name="length",
+        type=int,
+        location=OpenApiParameter.QUERY,
+        required=False,
+        description="Max bytes to read, capped at LOG_MAX_READ_BYTES",
+    ),
+    OpenApiParameter(
+        name="tail",
+        type=int,
+        location=OpenApiParameter.QUERY,
+        required=False,
+        description="Number of lines to read backwards from before, default when no offset is given",
+    ),
+    OpenApiParameter(
+        name="before",
+        type=int,
+        location=OpenApiParameter.QUERY,
+        required=False,
+        description="Byte cursor to read backwards from, use prev_offset of the previous response to page up. Default is the end of the file",
+    ),
+]
+
+
+LOG_LIST_PARAMETERS = [
+    OpenApiParameter(
+        name="sort",
+        type=str,
+        location=OpenApiParameter.QUERY,
+        required=False,
+        enum=["name", "size", "mtime"],
+        description="Sort key of directory entries, directories are listed first. Default is name",
+    ),
+    OpenApiParameter(
+        name="order",
+        type=str,
+        location=OpenApiParameter.QUERY,
+        required=False,
+        enum=["asc", "desc"],
+        description="Sort order of directory entries",
+    ),
+    OpenApiParameter(
+        name="page",
+        type=int,
+        location=OpenApiParameter.QUERY,
+        required=False,
+        description="Page of directory entries",
+    ),
+    OpenApiParameter(
+        name="page_size",
+        type=int,
+        location=OpenApiParameter.QUERY,
+        required=False,
+        description="Directory entries per page, max 1000",
+    ),
+]
+
+
+def list_log_directory(request, log_path: str) -> dict:
+    """
+    One page of the sorted directory entries, list_dir keeps all names in the same order
+    """
+    serializer = LogListQuerySerializer(data=request.query_params)
+    serializer.is_valid(raise_exception=True)
+    query = serializer.validated_data
+
+    entries = sort_entries(scan_directory(log_path), query["sort"], query["order"])
+    page = Paginator(entries, query["page_size"]).get_page(query["page"])
+    return {
+        "list_dir": [entry["name"] for entry in entries],
+        "entries": [format_entry(entry) for entry in page.object_list],
+        "total_pages": page.paginator.num_pages,
+        "current_page": page.number,
+        "total_items": page.paginator.count,
+        "page_size": query["page_size"],
+    }
+
+
+def read_log_file(request, log_path: str) -> dict:
+    """
+    Read a bounded part of the log file, never the whole file.
+    With offset the file is read forward, otherwise the last tail lines before the cursor.
+    """
+    serializer = LogReadQuerySerializer(data=request.query_params)
+    serializer.is_valid(raise_exception=True)
+    query = serializer.validated_data
+
+    if "offset" in query:
+        return read_forward(
+            log_path, query["offset"], query.get("length", settings.LOG_MAX_READ_BYTES)
+        )
+
+    lines = query.get("tail")
+    if lines is None and "length" not in query:
+        lines = settings.LOG_DEFAULT_TAIL_LINES
+    return read_backward(log_path, query.get("before"), lines, query.get("length"))
+
+
+def load_log_file_or_directory(request, log_path: str) -> Response:
     # Check if the path exists
     if not os.path.exists(log_path):
         return Response(
@@ -32,7 +163,7 @@ def load_log_file_or_directory(log_path: str) -> Response:
     # If the path is a directory, list its contents
     if os.path.isdir(log_path):
         try:
-            response_data["list_dir"] = os.listdir(log_path)
+            response_data.update(list_log_directory(request, log_path))
         except PermissionError:
             return Response(
                 {
@@ -50,9 +181,8 @@ def load_log_file_or_directory(log_path: str) -> Response:
         # Check if the file is a .log or .txt file
         if log_path.endswith(".log") or log_path.endswith(".txt"):
             try:
-                with open(log_path, "r") as f:
-                    response_data["log"] = f.read()
-            except Exception as e:
+                response_data.update(read_log_file(request, log_path))
+            except OSError as e:
                 response_data["status"] = False
                 response_data["message"] = str(e)
         else:
@@ -75,7 +205,9 @@ def load_log_file_or_directory(log_path: str) -> Response:
             location=OpenApiParameter.PATH,
             required=False,
             description="Path to the log file or directory",
-        )
+        ),
+        *LOG_READ_PARAMETERS,
+        *LOG_LIST_PARAMETERS,
     ],
     responses={
         200: OpenApiResponse(
@@ -84,7 +216,23 @@ def load_log_file_or_directory(log_path: str) -> Response:
                 fields={
                     "status": "boolean",
                     "list_dir": ["string"],
+                    "entries": [
+                        {
+                            "name": "string",
+                            "type": "string",
+                            "size": "integer",
+                            "mtime": "string",
+                        }
+                    ],
+                    "total_pages": "integer",
+                    "current_page": "integer",
+                    "total_items": "integer",
+                    "page_size": "integer",
                     "log": "string",
+                    "offset": "integer",
+                    "next_offset": "integer",
+                    "prev_offset": "integer",
+                    "size": "integer",
                     "message": "string",
                 },
             ),
@@ -95,6 +243,10 @@ def load_log_file_or_directory(log_path: str) -> Response:
                         "status": True,
                         "list_dir": ["file1.log", "file2.log"],
                         "log": "Log content",
+                        "offset": 1024,
+                        "next_offset": 2048,
+                        "prev_offset": 1024,
+                        "size": 2048,
                         "message": "",
                     },
                 )
@@ -129,15 +281,11 @@ def serve_backend_log_file_or_directory(request, path=""):
     """
     View to serve the post service log file or directory.
     Path "/logs/backend//" will return the list of files in the BACKEND_LOG_ROOT directory.
+    Files are read in pages, see LOG_READ_PARAMETERS, directories are listed in pages, see LOG_LIST_PARAMETERS.
     """
 
-    # Ensure the requested path is within the LOG_ROOT
-    if path and not path.startswith("..") and not path.startswith("/"):
-        log_path = os.path.join(settings.BACKEND_LOG_ROOT, path)
-    else:
-        log_path = settings.BACKEND_LOG_ROOT
-
-    return load_log_file_or_directory(log_path)
+    log_path = resolve_log_path(settings.BACKEND_LOG_ROOT, path)
+    return load_log_file_or_directory(request, log_path)
 
 
 @extend_schema(
@@ -149,7 +297,9 @@ def serve_backend_log_file_or_directory(request, path=""):
             location=OpenApiParameter.PATH,
             required=False,
             description="Path to the log file or directory",
-        )
+        ),
+        *LOG_READ_PARAMETERS,
+        *LOG_LIST_PARAMETERS,
     ],
     responses={
         200: OpenApiResponse(
@@ -158,7 +308,23 @@ def serve_backend_log_file_or_directory(request, path=""):
                 fields={
                     "status": "boolean",
                     "list_dir": ["string"],
+                    "entries": [
+                        {
+                            "name": "string",
+                            "type": "string",
+                            "size": "integer",
+                            "mtime": "string",
+                        }
+                    ],
+                    "total_pages": "integer",
+                    "current_page": "integer",
+                    "total_items": "integer",
+                    "page_size": "integer",
                     "log": "string",
+                    "offset": "integer",
+                    "next_offset": "integer",
+                    "prev_offset": "integer",
+                    "size": "integer",
                     "message": "string",
                 },
             ),
@@ -169,6 +335,10 @@ def serve_backend_log_file_or_directory(request, path=""):
                         "status": True,
                         "list_dir": ["file1.log", "file2.log"],
                         "log": "Log content",
+                        "offset": 1024,
+                        "next_offset": 2048,
+                        "prev_offset": 1024,
+                        "size": 2048,
                         "message": "",
                     },
                 )
@@ -203,12 +373,153 @@ def serve_crawler_log_file_or_directory(request, path=""):
     """
     View to serve the crawler log file or directory.
     Path "/logs/crawler//" will return the list of files in the CRAWLER_LOG_ROOT directory.
+    Files are read in pages, see LOG_READ_PARAMETERS, directories are listed in pages, see LOG_LIST_PARAMETERS.
+    """
+
+    log_path = resolve_log_path(settings.CRAWLER_LOG_ROOT, path)
+    return load_log_file_or_directory(request, log_path)
+
+
+def stream_log_file(request, log_path: str):
+    if not os.path.isfile(log_path):
+        return Response({"status": False, "message": "File does not exist"}, status=404)
+
+    # a reconnecting EventSource sends the id of the last event it received
+    offset = request.META.get("HTTP_LAST_EVENT_ID") or request.query_params.get(
+        "offset"
+    )
+    # isdigit() alone accepts digits like "²" that int() can't parse
+    if offset is not None and not (offset.isascii() and offset.isdigit()):
+        return Response({"status": False, "message": "Invalid offset"}, status=400)
+
+    response = StreamingHttpResponse(
+        follow_log_file(log_path, int(offset) if offset is not None else None),
+        content_type="text/event-stream",
+    )
+    response["Cache-Control"] = "no-cache"
+    # nginx would buffer the events otherwise
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+LOG_STREAM_SCHEMA = extend_schema(
+    tags=["Logs"],
+    parameters=[
+        OpenApiParameter(
+            name="path",
+            type=str,
+            location=OpenApiParameter.PATH,
+            description="Path to the log file",
+        ),
+        OpenApiParameter(
+            name="offset",
+            type=int,
+            location=OpenApiParameter.QUERY,
+            required=False,
+            description="Byte offset to start from, e.g. next_offset of a log read. Default is the end of the file, the Last-Event-ID header takes precedence",
+        ),
+    ],
+    responses={
+        (200, "text/event-stream"): OpenApiResponse(
+            response=str,
+            description='Events with the appended lines as data and the byte offset after them as id, "reset" when the file was truncated or rotated, and heartbeat comments',
+        ),
+        404: OpenApiResponse(
+            response=inline_serializer(
+                name="ErrorResponse", fields={"status": "boolean", "message": "string"}
+            ),
+        ),
+    },
+)
+
+
+@LOG_STREAM_SCHEMA
+@api_view(["GET"])
+@renderer_classes([EventStreamRenderer, JSONRenderer])
+@permission_classes([IsAuthenticated])
+def stream_backend_log_file(request, path=""):
+    """
+    Follow a post service log file as server-sent events.
+    The stream is async, it needs the ASGI entry point to serve many viewers.
+    """
+    log_path = resolve_log_path(settings.BACKEND_LOG_ROOT, path)
+    return stream_log_file(request, log_path)
+
+
+@LOG_STREAM_SCHEMA
+@api_view(["GET"])
+@renderer_classes([EventStreamRenderer, JSONRenderer])
+@permission_classes([IsAuthenticated])
+def stream_crawler_log_file(request, path=""):
+    """
+    Follow a crawler log file as server-sent events.
+    The stream is async, it needs the ASGI entry point to serve many viewers.
+    """
+    log_path = resolve_log_path(settings.CRAWLER_LOG_ROOT, path)
+    return stream_log_file(request, log_path)
+
+
+@extend_schema(
+    tags=["Logs"],
+    parameters=[LogSearchQuerySerializer],
+    responses={
+        (200, "application/x-ndjson"): OpenApiResponse(
+            response=str,
+            description="One JSON object per matching line (file, line, offset, time, seiyuu, text) as files are searched, "
+            'offset is the uncompressed byte offset of the line. The last line is a summary with "done": true.',
+        ),
+    },
+)
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def search_logs(request):
+    """
+    Search current and rotated (.gz) logs of a log root by regex, seiyuu and time range.
+    Files are searched in parallel. Indexed files are only scanned in the blocks that can match,
+    missing indexes are built in the background for the next search.
+    """
+    serializer = LogSearchQuerySerializer(data=request.query_params)
+    serializer.is_valid(raise_exception=True)
+
+    search = LogSearch(**serializer.validated_data)
+    response = StreamingHttpResponse(
+        stream_search(search), content_type="application/x-ndjson"
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+@extend_schema(
+    tags=["Logs"],
+    parameters=[LogRecordQuerySerializer],
+    responses={200: LogRecordSerializer(many=True)},
+)
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def list_log_records(request):
+    """
+    Ingested log records filtered by time range, minimum level, seiyuu, source and text, newest first
     """
+    serializer = LogRecordQuerySerializer(data=request.query_params)
+    serializer.is_valid(raise_exception=True)
+    query = serializer.validated_data
 
-    # Ensure the requested path is within the LOG_ROOT
-    if path and not path.startswith("..") and not path.startswith("/"):
-        log_path = os.path.join(settings.CRAWLER_LOG_ROOT, path)
-    else:
-        log_path = settings.CRAWLER_LOG_ROOT
+    records = LogRecord.objects.all()
+    if "start_date" in query:
+        records = records.filter(timestamp__gte=query["start_date"])
+    if "end_date" in query:
+        records = records.filter(timestamp__lte=query["end_date"])
+    if "level" in query:
+        level = dict((name, value) for value, name in LogRecord.LEVEL_CHOICES)[query["level"]]
+        records = records.filter(level__gte=level)
+    if "seiyuu" in query:
+        records = records.filter(seiyuu=query["seiyuu"])
+    if "source" in query:
+        records = records.filter(source=query["source"])
+    if "search" in query:
+        records = records.filter(message__icontains=query["search"])
 
-    return load_log_file_or_directory(log_path)
+    paginator = StandardResultsSetPagination()
+    page = paginator.paginate_queryset(records.order_by("-timestamp", "-id"), request)
+    return paginator.get_paginated_response(LogRecordSerializer(page, many=True).data)
@@ -106,11 +106,94 @@ TEMPLATES = [
 
 MEDIA_ROOT = BASE_DIR / "data" / "media" / "Library"
 MEDIA_URL = "/file/"
+MEDIA_CACHE_MAX_AGE = 24 * 60 * 60  # seconds, for files that are not content addressed
+
+# let the front proxy stream media files: "x-accel-redirect" (nginx), "x-sendfile"
+# (apache, lighttpd) or empty to send them from Django
+MEDIA_SENDFILE_BACKEND = os.getenv("MEDIA_SENDFILE_BACKEND", "")
+# for x-accel-redirect, the internal nginx location that aliases MEDIA_SENDFILE_ROOT
+MEDIA_SENDFILE_URL = "/internal/media/"
+MEDIA_SENDFILE_ROOT = BASE_DIR / "data" / "media"
+
+# suspected near-duplicates found by import_img are moved here instead of the Library
+QUARANTINE_ROOT = BASE_DIR / "data" / "media" / "Quarantine"
+
+# max hamming distance between perceptual hashes to treat two images as duplicates
+PHASH_MAX_DISTANCE = 6
+
+# content addressed thumbnail cache for the image browser
+THUMBNAIL_ROOT = BASE_DIR / "data" / "media" / "Thumbnails"
+THUMBNAIL_SIZES = [256, 1024]  # longest edge in px
+THUMBNAIL_FORMAT = "webp"  # or "jpeg"
+THUMBNAIL_QUALITY = 80
+THUMBNAIL_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
 
 BACKEND_LOG_ROOT = BASE_DIR / "data" / "crontab_log"
 
 CRAWLER_LOG_ROOT = BASE_DIR / "data" / "crawler_log"
 
+# log viewer reads, a response never holds more than LOG_MAX_READ_BYTES of a file
+LOG_MAX_READ_BYTES = 1024 * 1024
+LOG_DEFAULT_TAIL_LINES = 1000
+LOG_LISTING_CACHE_TIMEOUT = 60  # seconds, directory listings are also invalidated by the directory mtime
+
+# live log streaming (server-sent events), served as an async stream under ASGI
+LOG_STREAM_POLL_INTERVAL = 1.0  # seconds between size checks
+LOG_STREAM_HEARTBEAT = 15  # seconds of silence before a heartbeat comment
+LOG_STREAM_MAX_SECONDS = 3600  # the client reconnects with Last-Event-ID afterwards
+LOG_STREAM_RETRY_MS = 3000
+
+# log search, per file block indexes are kept apart from the logs
+LOG_INDEX_ROOT = BASE_DIR / "data" / "log_index"
+LOG_SEARCH_WORKERS = 4
+LOG_SEARCH_MAX_RESULTS = 1000
+
+# structured log records, from the ingest_logs command and the database handler
+LOG_RETENTION_DAYS = 30
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        # {db} is logs.handlers.DATABASE_LOGGED, the records are already in LogRecord
+        "database_logged": {
+            "format": "%(asctime)s {db} %(levelname)s %(name)s: %(message)s",
+            "datefmt": "%Y-%m-%d %H:%M:%S",
+        },
+    },
+    "handlers": {
+        "console": {"class": "logging.StreamHandler", "formatter": "database_logged"},
+        "database": {
+            "class": "logs.handlers.DatabaseLogHandler",
+            "capacity": 100,
+            "flush_interval": 5.0,
+        },
+    },
+    "loggers": {
+        "core": {"handlers": ["console", "database"], "level": "INFO"},
+        "logs": {"handlers": ["console", "database"], "level": "INFO"},
+    },
+}
+
+# Twitter API v2 root of the collectors, point it to a local stand-in for testing
+TWITTER_API_BASE_URL = os.getenv("TWITTER_API_BASE_URL") or "https://api.twitter.com"
+
+# tweets are crawled for data this long after posting
+TWEET_DATA_DELAY_HOURS = 72
+# seconds a crawl worker holds claimed tweets before they can be claimed again
+TWEET_LEASE_SECONDS = 600
+
+# Twitter API rate limit budget, shared by all posting runs through STATE_FILE
+TWITTER_RATE_LIMIT = {
+    "STATE_FILE": BASE_DIR / "data" / "rate_limit_state.json",
+    "DEFAULT_LIMIT": 50,  # requests per window before the first response headers
+    "DEFAULT_WINDOW": 900,  # seconds
+    "MAX_RETRIES": 5,  # retries on 429 and 5xx
+    "BACKOFF_BASE": 2,  # seconds
+    "BACKOFF_MAX": 120,  # seconds
+    "MAX_WAIT": 900,  # give up instead of waiting longer than this for a budget
+}
+
 WSGI_APPLICATION = "lovelive_seiyuu_bot_backend.wsgi.application"
 
 
@@ -121,7 +204,48 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "data" / "db.sqlite3",
-    }
+        # reuse the connection of a worker across requests, the pragmas run once per connection
+        "CONN_MAX_AGE": int(os.getenv("DB_CONN_MAX_AGE", "600")),
+        "CONN_HEALTH_CHECKS": True,
+    },
+}
+
+# replica refreshed by refresh_analytics_replica, empty to read the main database.
+# The main database is read until the replica file exists, see core.routers
+ANALYTICS_DB_PATH = os.getenv("ANALYTICS_DB_PATH") or None
+
+# read-only connection of the heavy analytics reads, see core.routers
+DATABASES["analytics"] = {
+    "ENGINE": "django.db.backends.sqlite3",
+    "NAME": Path(ANALYTICS_DB_PATH or DATABASES["default"]["NAME"]).resolve().as_uri()
+    + "?mode=ro",
+    "OPTIONS": {"uri": True},
+    # a refreshed replica is picked up when the connection is reopened
+    "CONN_MAX_AGE": 60,
+    "CONN_HEALTH_CHECKS": True,
+    "TEST": {"MIRROR": "default"},
+}
+
+DATABASE_ROUTERS = ["core.routers.AnalyticsRouter"]
+
+# applied to every new SQLite connection (core.db), values are PRAGMA literals
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",  # readers are not blocked by the crawler writes
+    "synchronous": "NORMAL",  # with WAL, only a power loss can drop the last commits
+    "busy_timeout": 20000,  # ms a writer waits for the lock before "database is locked"
+    "mmap_size": 256 * 1024 * 1024,  # bytes
+    "cache_size": -64 * 1024,  # negative is KiB, per connection
+    "temp_store": "MEMORY",
+}
+
+# merged into SQLITE_PRAGMAS for one alias, None skips a pragma
+SQLITE_ALIAS_PRAGMAS = {
+    "analytics": {
+        "journal_mode": None,  # can't be changed on a read-only connection
+        "query_only": 1,
+        # KiB, every worker process has its own analytics connection and cache
+        "cache_size": -int(os.getenv("ANALYTICS_DB_CACHE_KIB", "65536")),
+    },
 }
 
 
@@ -16,7 +16,6 @@ Including another URLconf
 """
 
 from django.conf import settings
-from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
 from drf_spectacular.views import (
@@ -24,6 +23,7 @@ from drf_spectacular.views import (
     SpectacularRedocView,
     SpectacularSwaggerView,
 )
+from core.views import serve_media
 
 urlpatterns = [
     path("admin/", admin.site.urls),
@@ -41,4 +41,5 @@ urlpatterns = [
     path("account/", include("account.urls")),
     path("core/", include("core.urls")),
     path("logs/", include("logs.urls")),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    path(f"{settings.MEDIA_URL.strip('/')}/<path:path>", serve_media, name="serve_media"),
+]